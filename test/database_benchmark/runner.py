@@ -0,0 +1,138 @@
+'''URL table benchmark.
+
+Compares the URL table implementations by timing inserts, check outs, and
+check ins on a temporary database file.
+
+With ``--check-out-latency``, the table is filled with URLs deeper than the
+level limit followed by a few shallow URLs, and the time of each check out
+filtered by level is reported instead.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from wpull.database.sqlite3_ import SQLite3URLTable, \
+    FingerprintSQLite3URLTable
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.item import Status
+
+
+URL_TEMPLATE = \
+    'http://www.example.com/articles/{0}/page-{1}.html?ref=listing&id={0}{1}'
+
+IMPLEMENTATIONS = (
+    ('sqlalchemy', SQLiteURLTable),
+    ('sqlite3', SQLite3URLTable),
+    ('fingerprint', FingerprintSQLite3URLTable),
+)
+
+
+def run_benchmark(url_table, count, batch_size):
+    '''Run the operations and return a list of (name, rate) tuples.'''
+    results = []
+
+    time_start = time.perf_counter()
+
+    for batch_num in range(0, count, batch_size):
+        url_table.add_many(
+            [{'url': URL_TEMPLATE.format(batch_num, num)}
+             for num in range(batch_size)],
+            referrer='http://example.com/{}'.format(batch_num),
+            top_url='http://example.com/',
+            level=1,
+        )
+
+    results.append(('inserts', count / (time.perf_counter() - time_start)))
+
+    checked_out_urls = []
+    time_start = time.perf_counter()
+
+    while True:
+        url_records = url_table.check_out_many(Status.todo, batch_size)
+
+        if not url_records:
+            break
+
+        checked_out_urls.extend(url_record.url for url_record in url_records)
+
+    results.append(
+        ('check outs', count / (time.perf_counter() - time_start)))
+
+    time_start = time.perf_counter()
+
+    for url in checked_out_urls:
+        url_table.check_in(url, Status.done, status_code=200)
+
+    url_table.flush()
+
+    results.append(('check ins', count / (time.perf_counter() - time_start)))
+
+    return results
+
+
+def run_check_out_latency(url_table, count, batch_size, samples):
+    '''Return the mean and maximum time of a check out filtered by level.'''
+    for batch_num in range(0, count, batch_size):
+        url_table.add_many(
+            [{'url': URL_TEMPLATE.format(batch_num, num)}
+             for num in range(batch_size)],
+            level=5,
+        )
+
+    url_table.add_many(
+        [{'url': URL_TEMPLATE.format('shallow', num)}
+         for num in range(samples)],
+        level=1,
+    )
+
+    durations = []
+
+    for dummy in range(samples):
+        time_start = time.perf_counter()
+        url_record = url_table.check_out(Status.todo, 2)
+        durations.append(time.perf_counter() - time_start)
+
+        url_table.check_in(url_record.url, Status.done)
+
+    return sum(durations) / len(durations), max(durations)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--count', type=int, default=20000)
+    arg_parser.add_argument('--batch-size', type=int, default=50)
+    arg_parser.add_argument('--write-behind-size', type=int, default=100)
+    arg_parser.add_argument('--check-out-latency', action='store_true')
+    arg_parser.add_argument('--samples', type=int, default=100)
+    args = arg_parser.parse_args()
+
+    for name, url_table_class in IMPLEMENTATIONS:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'benchmark.db')
+            url_table = url_table_class(
+                path, write_behind_size=args.write_behind_size)
+
+            if args.check_out_latency:
+                mean, maximum = run_check_out_latency(
+                    url_table, args.count, args.batch_size, args.samples)
+                print('{0:12} {1:12} {2:10.3f} ms mean {3:10.3f} ms max'
+                      .format(name, 'check out', mean * 1000, maximum * 1000))
+                url_table.close()
+                continue
+
+            for operation, rate in run_benchmark(
+                    url_table, args.count, args.batch_size):
+                print('{0:12} {1:12} {2:10.0f}/s'.format(name, operation, rate))
+
+            url_table.close()
+
+            print('{0:12} {1:12} {2:10} bytes'.format(
+                name, 'file size', os.path.getsize(path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+'''Request throughput benchmark.
+
+Downloads many small files from a local keep-alive HTTP server and prints
+the number of requests per second. The server runs in a separate process
+so only the time spent by Wpull is measured.
+
+Run it before and after a change to compare the overhead of the event
+loop, connection and stream layers.
+'''
+import argparse
+import http.server
+import multiprocessing
+import os
+import socketserver
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from wpull.builder import Builder
+from wpull.options import AppArgumentParser
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    body = b'x' * 2048
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def run_server(queue):
+    server = Server(('127.0.0.1', 0), Handler)
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def run_client(port, count, concurrent, extra_args):
+    '''Download the files and return the number of requests per second.'''
+    with tempfile.TemporaryDirectory() as temp_dir:
+        url_filename = os.path.join(temp_dir, 'urls.txt')
+
+        with open(url_filename, 'w') as out_file:
+            for num in range(count):
+                out_file.write(
+                    'http://127.0.0.1:{0}/{1}\n'.format(port, num))
+
+        args = AppArgumentParser().parse_args([
+            '--input-file', url_filename,
+            '--directory-prefix', temp_dir,
+            '--delete-after',
+            '--no-robots',
+            '--tries', '1',
+            '--concurrent', str(concurrent),
+            '--quiet',
+        ] + extra_args)
+        builder = Builder(args)
+        application = builder.build()
+
+        time_start = time.perf_counter()
+        application.run_sync()
+        duration = time.perf_counter() - time_start
+
+        files = builder.factory['Statistics'].files
+
+        assert files == count, 'Expected {0} files. Got {1}.'.format(
+            count, files)
+
+        return count / duration
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--count', type=int, default=2000)
+    arg_parser.add_argument('--concurrent', type=int, default=4)
+    arg_parser.add_argument(
+        'wpull_args', nargs='*',
+        help='additional Wpull arguments, given after "--"')
+    args = arg_parser.parse_args()
+
+    queue = multiprocessing.Queue()
+    server_proc = multiprocessing.Process(target=run_server, args=(queue,))
+    server_proc.daemon = True
+    server_proc.start()
+
+    try:
+        port = queue.get(timeout=10)
+        rate = run_client(port, args.count, args.concurrent, args.wpull_args)
+    finally:
+        server_proc.terminate()
+
+    print('{0:.0f} requests/s'.format(rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -118,6 +118,7 @@ def install(lua_script_path):
         get_urls = NotImplemented
         wait_time = NotImplemented
         finishing_statistics = NotImplemented
+        circuit_state = NotImplemented
         exit_status = NotImplemented
 
     callbacks = CallbacksAdapter()
@@ -215,6 +216,8 @@ def install(lua_script_path):
                                 lua_item, 'post_data'),
                             'replace': get_from_lua_table_as_dict(
                                 lua_item, 'replace'),
+                            'priority': get_from_lua_table_as_dict(
+                                lua_item, 'priority'),
                         }
                         items.append(item)
 
@@ -237,6 +240,12 @@ def install(lua_script_path):
                     to_lua_type(bytes_downloaded)
                     )
 
+        @staticmethod
+        def circuit_state(hostname, state):
+            if callbacks.circuit_state is not NotImplemented:
+                callbacks.circuit_state(
+                    to_lua_type(hostname), to_lua_type(state))
+
         @staticmethod
         def exit_status(exit_code):
             if callbacks.exit_status is not NotImplemented:
@@ -255,6 +264,7 @@ def install(lua_script_path):
     wpull_hook.callbacks.get_urls = HookEnvironmentAdapter.get_urls
     wpull_hook.callbacks.wait_time = HookEnvironmentAdapter.wait_time
     wpull_hook.callbacks.finishing_statistics = HookEnvironmentAdapter.finishing_statistics
+    wpull_hook.callbacks.circuit_state = HookEnvironmentAdapter.circuit_state
     wpull_hook.callbacks.exit_status = HookEnvironmentAdapter.exit_status
 
     global lua
@@ -15,6 +15,7 @@ from wpull.errors import ServerError, ExitStatus, ProtocolError, \
     SSLVerificationError, DNSNotFound, ConnectionRefused, NetworkError, \
     AuthenticationError
 from wpull.hook import HookableMixin, HookDisconnected, HookStop
+from wpull.item import Status
 import wpull.string
 import wpull.observer
 
@@ -243,11 +244,126 @@ class Application(HookableMixin):
             preformatted_file_size=file_size
         ))
 
+        if 'URLTable' in self._builder.factory:
+            self._print_url_counts()
+
+        if 'CircuitBreaker' in self._builder.factory:
+            self._print_circuit_stats()
+
+        if 'ConnectionPool' in self._builder.factory:
+            self._print_connection_stats()
+
+        if 'SSLSessionCache' in self._builder.factory:
+            self._print_ssl_session_stats()
+
+        if 'Resolver' in self._builder.factory:
+            self._print_dns_stats()
+
+        if 'HostPrefetcher' in self._builder.factory:
+            self._print_prefetch_stats()
+
         if stats.is_quota_exceeded:
             _logger.info(_('Download quota exceeded.'))
 
         _logger.info(__(_('Exiting with status {0}.'), self._exit_code))
 
+    def _print_url_counts(self):
+        '''Log the number of URLs for each status.'''
+        counts = self._builder.factory['URLTable'].count_by_status()
+
+        _logger.info(__(
+            _(
+                'URLs: {done} done, {error} error, {skipped} skipped, '
+                '{todo} todo.'
+            ),
+            done=counts[Status.done],
+            error=counts[Status.error],
+            skipped=counts[Status.skipped],
+            todo=counts[Status.todo] + counts[Status.in_progress],
+        ))
+
+    def _print_circuit_stats(self):
+        '''Log the number of times hosts were deferred.'''
+        circuit_breaker = self._builder.factory['CircuitBreaker']
+
+        if not circuit_breaker.open_count:
+            return
+
+        _logger.info(__(
+            _(
+                'Circuits opened: {open_count}. URLs deferred: '
+                '{deferred_count}. Hosts still failing: {num_hosts}.'
+            ),
+            open_count=circuit_breaker.open_count,
+            deferred_count=circuit_breaker.deferred_count,
+            num_hosts=len(circuit_breaker.open_hosts),
+        ))
+
+    def _print_connection_stats(self):
+        '''Log how often connections were reused.'''
+        connection_pool = self._builder.factory['ConnectionPool']
+
+        if not connection_pool.checkout_count:
+            return
+
+        _logger.info(__(
+            _(
+                'Connections reused: {reuse_count} of {checkout_count} '
+                '({reuse_rate:.0%}). Idle connections closed: {evict_count}.'
+            ),
+            reuse_count=connection_pool.reuse_count,
+            checkout_count=connection_pool.checkout_count,
+            reuse_rate=connection_pool.reuse_rate,
+            evict_count=connection_pool.evict_count,
+        ))
+
+    def _print_ssl_session_stats(self):
+        '''Log how many SSL handshakes resumed a session.'''
+        session_cache = self._builder.factory['SSLSessionCache']
+
+        if not session_cache.resumed_count and not session_cache.full_count:
+            return
+
+        _logger.info(__(
+            _(
+                'SSL handshakes: {resumed_count} resumed, {full_count} full.'
+            ),
+            resumed_count=session_cache.resumed_count,
+            full_count=session_cache.full_count,
+        ))
+
+    def _print_dns_stats(self):
+        '''Log how often DNS lookups were answered by the cache.'''
+        resolver = self._builder.factory['Resolver']
+
+        if not resolver.cache_hit_count and not resolver.cache_miss_count:
+            return
+
+        _logger.info(__(
+            _(
+                'DNS cache hits: {hit_count} of {count} ({hit_rate:.0%}).'
+            ),
+            hit_count=resolver.cache_hit_count,
+            count=resolver.cache_hit_count + resolver.cache_miss_count,
+            hit_rate=resolver.cache_hit_rate,
+        ))
+
+    def _print_prefetch_stats(self):
+        '''Log how many hosts were prefetched.'''
+        prefetcher = self._builder.factory['HostPrefetcher']
+
+        _logger.info(__(
+            _(
+                'Hosts prefetched: {lookup_count} resolved, '
+                '{connect_count} connected, {skip_count} skipped, '
+                '{error_count} failed.'
+            ),
+            lookup_count=prefetcher.lookup_count,
+            connect_count=prefetcher.connect_count,
+            skip_count=prefetcher.skip_count,
+            error_count=prefetcher.error_count,
+        ))
+
     def _print_ssl_error(self):
         '''Print an invalid SSL certificate warning.'''
         _logger.info(_('A SSL certificate could not be verified.'))
@@ -276,7 +392,12 @@ class Application(HookableMixin):
 
     def _close(self):
         '''Perform clean up actions.'''
-        self._builder.factory['WebProcessor'].close()
+        web_processor = self._builder.factory.instance_map.get(
+            'WebProcessor')
+
+        if web_processor:
+            web_processor.close()
+
         self._builder.factory['URLTable'].close()
 
     def add_server_task(self, task):
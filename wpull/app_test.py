@@ -5,11 +5,13 @@ import io
 import re
 import gzip
 import hashlib
+import json
 import logging
 import os
 import socket
 import sys
 import tempfile
+import threading
 import unittest
 
 from tornado.testing import AsyncHTTPSTestCase
@@ -18,8 +20,14 @@ import tornado.testing
 import trollius
 
 from wpull.builder import Builder
+from wpull.collections import BloomFilter
+from wpull.database.remote import URLTableServer
+from wpull.database.sqlite3_ import SQLite3URLTable, \
+    FingerprintSQLite3URLTable
+from wpull.database.threaded import ThreadedURLTable
 from wpull.dns import Resolver
 from wpull.errors import ExitStatus, SSLVerificationError
+from wpull.item import Status
 from wpull.http.web import WebSession
 from wpull.options import AppArgumentParser
 from wpull.testing.async import AsyncTestCase
@@ -153,6 +161,239 @@ class TestApp(GoodAppTestCase, TempDirMixin):
         self.assertGreater(builder.factory['Statistics'].files, 1)
         self.assertGreater(builder.factory['Statistics'].duration, 3)
 
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_host_frontier(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '--no-parent',
+            '--recursive',
+            '--page-requisites',
+            '--concurrent', '3',
+            '--host-concurrent', '1',
+            '--host-wait', '0.01',
+            '-4',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(builder.factory['Statistics'].files, 1)
+        self.assertEqual(0, len(builder.factory['Frontier']))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_retry_delay(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            self.get_url('/blog/?page=2'),
+            '--retry-delay', '0.1',
+            '--tries', '2',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertEqual(2, builder.factory['Statistics'].files)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_circuit_breaker(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            'http://127.0.0.1:{}/1'.format(port),
+            'http://127.0.0.1:{}/2'.format(port),
+            'http://127.0.0.1:{}/3'.format(port),
+            '--retry-connrefused',
+            '--tries', '2',
+            '--waitretry', '0',
+            '--circuit-breaker', '1',
+            '--circuit-breaker-cool-down', '0.1',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.network_failure, exit_code)
+
+        circuit_breaker = builder.factory['CircuitBreaker']
+
+        self.assertGreaterEqual(circuit_breaker.open_count, 2)
+        self.assertGreaterEqual(circuit_breaker.deferred_count, 2)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_dns_prefetch(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '--recursive',
+            '--no-robots',
+            '--dns-prefetch', '2',
+            '--preconnect',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(builder.factory['Statistics'].files, 1)
+        self.assertEqual(1, builder.factory['HostPrefetcher'].lookup_count)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_adaptive_concurrency(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '--recursive',
+            '--no-robots',
+            '--adaptive-concurrency',
+            '--concurrent', '2',
+            '--max-concurrent', '4',
+            '--host-concurrent', '2',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(builder.factory['Statistics'].files, 1)
+        self.assertIn('ConcurrencyController', builder.factory)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_crawl_order(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '--recursive',
+            '--no-robots',
+            '--crawl-order', 'breadth-first',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        levels = []
+
+        def dequeued_url(url_info, url_record):
+            if not url_record.try_count:
+                levels.append(url_record.level)
+
+        builder.factory['URLTable'].connect_hook(
+            'dequeued_url', dequeued_url)
+
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(max(levels), 1)
+        self.assertEqual(sorted(levels), levels)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_checkpoint(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/always200/'),
+            '--recursive',
+            '--checkpoint', 'checkpoint.json',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(0, exit_code)
+
+        with open('checkpoint.json') as in_file:
+            doc = json.load(in_file)
+
+        self.assertIn('dns', doc)
+        self.assertEqual(1, len(doc['robots_txt']))
+
+        builder = Builder(args, unit_test=True)
+        app = builder.build()
+        robots_txt_pool = builder.factory['RobotsTxtPool']
+
+        builder.factory['Checkpoint'].load()
+
+        self.assertTrue(robots_txt_pool.has_parser(
+            URLInfo.parse(self.get_url('/always200/'))))
+
+    @unittest.skipIf(sys.version_info[0:2] == (3, 2),
+                     'multiprocessing.connection.wait requires Python 3.3')
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_workers(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '--no-parent',
+            '--recursive',
+            '--page-requisites',
+            '--workers', '2',
+            '--warc-file', 'test',
+            '--no-robots',
+            '-4',
+        ])
+        builder = Builder(args, unit_test=True)
+
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(builder.factory['Statistics'].files, 1)
+        self.assertNotIn('WebProcessor', builder.factory)
+
+        warc_filenames = glob.glob('test-worker*.warc.gz')
+        self.assertTrue(warc_filenames)
+        self.assertFalse(os.path.exists('test.warc.gz'))
+
+    @unittest.skipIf(sys.version_info[0:2] == (3, 2),
+                     'multiprocessing.connection.wait requires Python 3.3')
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_coordinator(self):
+        url_table = ThreadedURLTable(lambda: SQLite3URLTable())
+        server = URLTableServer(url_table)
+        address = server.listen(('localhost', 0), b'secret')
+        server_thread = threading.Thread(target=server.serve)
+        server_thread.start()
+
+        try:
+            arg_parser = AppArgumentParser()
+            args = arg_parser.parse_args([
+                self.get_url('/blog/'),
+                '--no-parent',
+                '--recursive',
+                '--page-requisites',
+                '--coordinator', '{0}:{1}'.format(*address),
+                '--coordinator-key', 'secret',
+                '-4',
+            ])
+            builder = Builder(args, unit_test=True)
+
+            app = builder.build()
+            exit_code = yield From(app.run())
+        finally:
+            server.stop()
+            server_thread.join()
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(builder.factory['Statistics'].files, 1)
+
+        counts = url_table.count_by_status()
+        self.assertEqual(0, counts[Status.todo])
+        self.assertEqual(0, counts[Status.in_progress])
+        self.assertGreater(counts[Status.done], 1)
+
+        url_table.close()
+
     @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
     def test_app_args(self):
         arg_parser = AppArgumentParser()
@@ -620,6 +861,65 @@ class TestApp(GoodAppTestCase, TempDirMixin):
 
         self.assertEqual(0, exit_code)
 
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_database_backend_sqlite3(self):
+        yield From(self._database_backend_tester('sqlite3', SQLite3URLTable))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_database_backend_fingerprint(self):
+        yield From(self._database_backend_tester(
+            'sqlite3-fingerprint', FingerprintSQLite3URLTable))
+
+    @trollius.coroutine
+    def _database_backend_tester(self, backend_name, url_table_class):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '-r',
+            '--no-parent',
+            '--database', 'temp-unittest.db',
+            '--database-backend', backend_name,
+        ])
+        builder = Builder(args, unit_test=True)
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertIsInstance(
+            builder.factory['URLTableImplementation'], url_table_class)
+
+        url_records = tuple(builder.factory['URLTable'].get_all())
+
+        self.assertTrue(url_records)
+
+        for url_record in url_records:
+            self.assertNotIn(
+                url_record.status, (Status.todo, Status.in_progress))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_seen_url_filter(self):
+        arg_parser = AppArgumentParser()
+        args = arg_parser.parse_args([
+            self.get_url('/blog/'),
+            '-r',
+            '--no-parent',
+            '--page-requisites',
+            '--database-backend', 'sqlite3',
+            '--seen-url-filter', '0.0001',
+            '--seen-url-filter-memory', '1k',
+        ])
+        builder = Builder(args, unit_test=True)
+        app = builder.build()
+        exit_code = yield From(app.run())
+
+        self.assertEqual(ExitStatus.server_error, exit_code)
+        self.assertGreater(builder.factory['Statistics'].files, 1)
+        self.assertGreater(
+            builder.factory['URLTable'].seen_filter_absent_count, 0)
+        self.assertEqual(
+            BloomFilter.get_capacity(1024, 0.0001),
+            builder.factory['SeenURLFilter'].capacity)
+
     @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
     def test_save_cookie(self):
         arg_parser = AppArgumentParser()
@@ -96,6 +96,8 @@ class BandwidthMeter(object):
 
 class BandwidthLimiter(BandwidthMeter):
     '''Bandwidth rate limit calculator.'''
+    max_read_size = None
+
     def __init__(self, rate_limit):
         super().__init__(sample_min_time=0)
         self._rate_limit = rate_limit
@@ -121,3 +123,178 @@ class BandwidthLimiter(BandwidthMeter):
                 return sleep_time
         else:
             return 0
+
+    def consume(self, data_len, host=None):
+        '''Feed the limiter and return the sleep time.
+
+        The host is ignored.
+        '''
+        self.feed(data_len)
+        return self.sleep_time()
+
+
+class TokenBucket(object):
+    '''Token bucket rate limiter.
+
+    Tokens are added at `rate` per second up to `burst` tokens. Taking more
+    tokens than available puts the bucket into debt so later takers wait
+    behind earlier ones.
+
+    Args:
+        rate (float): The number of tokens added per second.
+        burst (float): The maximum number of tokens.
+    '''
+    def __init__(self, rate, burst):
+        assert rate > 0, 'Expect positive rate. Got {}.'.format(rate)
+
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last_time = None
+
+    @property
+    def rate(self):
+        '''Return the number of tokens added per second.'''
+        return self._rate
+
+    @property
+    def burst(self):
+        '''Return the maximum number of tokens.'''
+        return self._burst
+
+    def tokens(self, now=None):
+        '''Return the number of tokens available.
+
+        The value is negative if the bucket is in debt.
+        '''
+        self._refill(now)
+        return self._tokens
+
+    def full(self, now=None):
+        '''Return whether the bucket is full.'''
+        return self.tokens(now) >= self._burst
+
+    def take(self, amount, now=None):
+        '''Take tokens and return the time to wait.
+
+        Returns:
+            float: The number of seconds until the bucket is out of debt.
+        '''
+        self._refill(now)
+        self._tokens -= amount
+
+        if self._tokens < 0:
+            return -self._tokens / self._rate
+        else:
+            return 0
+
+    def _refill(self, now=None):
+        now = now or time.time()
+
+        if self._last_time is not None:
+            self._tokens = min(
+                self._burst,
+                self._tokens + (now - self._last_time) * self._rate
+            )
+
+        self._last_time = now
+
+
+class TokenBucketLimiter(object):
+    '''Bandwidth rate limiter with a global rate and per-host rates.
+
+    Every read takes tokens from the global bucket and from the bucket of
+    the host. Because a bucket in debt makes later readers wait behind
+    earlier ones, connections sharing a bucket take turns and get a fair
+    share of the rate. Reads are limited to :attr:`max_read_size` so one
+    large read does not hold up the other connections.
+
+    Args:
+        rate_limit (int): The global limit in bytes per second. If ``None``
+            or 0, only the host limit applies.
+        host_rate_limit (int): The limit in bytes per second for each
+            host. If ``None`` or 0, only the global limit applies.
+        burst (int): The bucket size in bytes. Defaults to a quarter of a
+            second of the rate of each bucket.
+    '''
+    MIN_BURST = 4096
+    '''The minimum default bucket size in bytes.'''
+
+    def __init__(self, rate_limit=None, host_rate_limit=None, burst=None):
+        assert rate_limit or host_rate_limit, 'Expect a rate limit.'
+
+        self._host_rate_limit = host_rate_limit
+
+        if host_rate_limit:
+            self._host_burst = burst or self._default_burst(host_rate_limit)
+        else:
+            self._host_burst = None
+
+        if rate_limit:
+            self._global_bucket = TokenBucket(
+                rate_limit, burst or self._default_burst(rate_limit))
+        else:
+            self._global_bucket = None
+
+        self._host_buckets = {}
+        self._consume_count = 0
+
+    @classmethod
+    def _default_burst(cls, rate):
+        return max(cls.MIN_BURST, rate / 4)
+
+    @property
+    def max_read_size(self):
+        '''Return the maximum number of bytes to read at once.
+
+        It is the size of the host buckets if hosts are limited, otherwise
+        the size of the global bucket.
+        '''
+        if self._host_burst:
+            burst = self._host_burst
+        else:
+            burst = self._global_bucket.burst
+
+        return max(1, int(burst))
+
+    def consume(self, data_len, host=None, now=None):
+        '''Account the bytes read and return the sleep time.
+
+        Args:
+            data_len (int): The number of bytes read.
+            host (str): The hostname of the connection.
+            now (float): Current time.
+
+        Returns:
+            float: The number of seconds to sleep.
+        '''
+        now = now or time.time()
+        sleep_time = 0
+
+        if self._global_bucket:
+            sleep_time = self._global_bucket.take(data_len, now)
+
+        if self._host_rate_limit:
+            bucket = self._host_buckets.get(host)
+
+            if not bucket:
+                bucket = self._host_buckets[host] = TokenBucket(
+                    self._host_rate_limit, self._host_burst)
+
+            sleep_time = max(sleep_time, bucket.take(data_len, now))
+
+            self._consume_count += 1
+
+            if self._consume_count % 1000 == 0:
+                self._clean_host_buckets(now)
+
+        if sleep_time < 0.001:
+            return 0
+        else:
+            return sleep_time
+
+    def _clean_host_buckets(self, now):
+        '''Remove full buckets of hosts that are not reading.'''
+        for host, bucket in tuple(self._host_buckets.items()):
+            if bucket.full(now):
+                del self._host_buckets[host]
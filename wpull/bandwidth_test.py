@@ -2,7 +2,8 @@
 import time
 import unittest
 
-from wpull.bandwidth import BandwidthMeter, BandwidthLimiter
+from wpull.bandwidth import BandwidthMeter, BandwidthLimiter, TokenBucket, \
+    TokenBucketLimiter
 
 
 class TestNetwork(unittest.TestCase):
@@ -24,4 +25,71 @@ class TestNetwork(unittest.TestCase):
 
         self.assertAlmostEqual(9.0, meter.sleep_time(), delta=0.2)
 
+    def test_token_bucket(self):
+        bucket = TokenBucket(100, burst=50)
 
+        self.assertEqual(0, bucket.take(50, now=1000.0))
+        self.assertAlmostEqual(1.0, bucket.take(100, now=1000.0))
+        self.assertAlmostEqual(-50, bucket.tokens(now=1000.5))
+        self.assertEqual(0, bucket.take(0, now=1001.0))
+        self.assertTrue(bucket.full(now=1010.0))
+        self.assertEqual(50, bucket.tokens(now=1010.0))
+
+    def test_token_bucket_limiter_rate(self):
+        limiter = TokenBucketLimiter(rate_limit=1000, burst=100)
+        now = 1000.0
+        total = 0
+
+        for dummy in range(100):
+            sleep_time = limiter.consume(100, now=now)
+            total += 100
+            now += sleep_time
+
+        self.assertAlmostEqual(1000, total / (now - 1000.0), delta=20)
+
+    def test_token_bucket_limiter_fair(self):
+        limiter = TokenBucketLimiter(rate_limit=1000, burst=100)
+        wake_times = {'a': 1000.0, 'b': 1000.0}
+        totals = {'a': 0, 'b': 0}
+
+        for dummy in range(200):
+            name = min(wake_times, key=lambda key: wake_times[key])
+            now = wake_times[name]
+            wake_times[name] = now + limiter.consume(100, now=now)
+            totals[name] += 100
+
+        self.assertAlmostEqual(totals['a'], totals['b'], delta=200)
+
+    def test_token_bucket_limiter_host(self):
+        limiter = TokenBucketLimiter(
+            rate_limit=1000, host_rate_limit=100, burst=100)
+
+        self.assertEqual(0, limiter.consume(100, 'a', now=1000.0))
+        self.assertAlmostEqual(
+            1.0, limiter.consume(100, 'a', now=1000.0))
+        self.assertAlmostEqual(
+            0.2, limiter.consume(100, 'b', now=1000.0))
+        self.assertEqual(100, limiter.max_read_size)
+
+        limiter = TokenBucketLimiter(host_rate_limit=100, burst=100)
+
+        self.assertEqual(0, limiter.consume(100, 'a', now=1000.0))
+        self.assertEqual(0, limiter.consume(100, 'b', now=1000.0))
+        self.assertAlmostEqual(
+            0.5, limiter.consume(50, 'b', now=1000.0))
+
+    def test_token_bucket_limiter_default_burst(self):
+        limiter = TokenBucketLimiter(
+            rate_limit=10 * 2 ** 20, host_rate_limit=10 * 2 ** 10)
+
+        self.assertEqual(4096, limiter.max_read_size)
+
+        for num in range(100):
+            self.assertEqual(
+                0, limiter.consume(4096, 'host{0}'.format(num), now=1000.0))
+
+        self.assertGreater(limiter.consume(4096, 'host0', now=1000.0), 0)
+
+        limiter = TokenBucketLimiter(rate_limit=10 * 2 ** 20)
+
+        self.assertEqual(10 * 2 ** 20 // 4, limiter.max_read_size)
@@ -8,6 +8,7 @@ import gettext
 import itertools
 import json
 import logging
+import multiprocessing.connection
 import os.path
 import socket
 import ssl
@@ -20,23 +21,35 @@ import trollius
 
 from wpull.app import Application
 from wpull.backport.logging import BraceMessage as __
-from wpull.bandwidth import BandwidthLimiter
-from wpull.connection import Connection, ConnectionPool, SSLConnection
+from wpull.bandwidth import TokenBucketLimiter
+from wpull.checkpoint import Checkpoint
+from wpull.circuit import CircuitBreaker
+from wpull.collections import BloomFilter
+from wpull.concurrency import ConcurrencyController
+from wpull.connection import Connection, ConnectionPool, SSLConnection, \
+    SSLSessionCache
 from wpull.converter import BatchDocumentConverter
 from wpull.cookie import DeFactoCookiePolicy, BetterMozillaCookieJar
 from wpull.coprocessor.phantomjs import PhantomJSCoprocessor, PhantomJSParams
 from wpull.coprocessor.proxy import ProxyCoprocessor
 from wpull.coprocessor.youtubedl import YoutubeDlCoprocessor
+from wpull.database.base import CrawlOrder
+from wpull.database.remote import RemoteURLTable, URLTableServer
+from wpull.database.sqlite3_ import SQLite3URLTable, \
+    FingerprintSQLite3URLTable
 from wpull.database.sqltable import URLTable as SQLURLTable, GenericSQLURLTable
+from wpull.database.threaded import ThreadedURLTable
 from wpull.database.wrap import URLTableHookWrapper
 from wpull.debug import DebugConsoleHandler
 from wpull.dns import Resolver, PythonResolver
 from wpull.driver.phantomjs import PhantomJSDriver
 from wpull.engine import Engine
 from wpull.factory import Factory
+from wpull.frontier import HostFrontier
 from wpull.ftp.client import Client as FTPClient
 from wpull.hook import HookEnvironment, PluginEnvironment
 from wpull.http.client import Client as HTTPClient
+from wpull.prefetch import HostPrefetcher
 from wpull.proxy.client import HTTPProxyConnectionPool
 from wpull.proxy.hostfilter import HostFilter as ProxyHostFilter
 from wpull.http.redirect import RedirectTracker
@@ -68,6 +81,7 @@ from wpull.scraper.css import CSSScraper
 from wpull.scraper.html import HTMLScraper, ElementWalker
 from wpull.scraper.javascript import JavaScriptScraper
 from wpull.scraper.sitemap import SitemapScraper
+from wpull.seed import SeedLoader
 from wpull.stats import Statistics
 from wpull.url import URLInfo
 from wpull.urlfilter import (DemuxURLFilter, HTTPSOnlyFilter, SchemeFilter,
@@ -77,9 +91,10 @@ from wpull.urlfilter import (DemuxURLFilter, HTTPSOnlyFilter, SchemeFilter,
                              BackwardFilenameFilter, ParentFilter,
                              FollowFTPFilter)
 from wpull.urlrewrite import URLRewriter
-from wpull.util import ASCIIStreamWriter, GzipPickleStream
+from wpull.util import ASCIIStreamWriter
 from wpull.waiter import LinearWaiter
 from wpull.wrapper import CookieJarWrapper
+from wpull.workers import WorkerPool, run_worker
 from wpull.writer import (NullWriter, OverwriteFileWriter,
                           IgnoreFileWriter, TimestampingFileWriter,
                           AntiClobberFileWriter)
@@ -98,22 +113,28 @@ class Builder(object):
 
     Args:
         args: Options from :class:`argparse.ArgumentParser`
+        worker (:class:`.workers.WorkerInfo`): If provided, the application
+            is built as a worker process using the URL table of the
+            coordinating process.
     '''
     UNSAFE_OPTIONS = frozenset(['save_headers', 'no_iri', 'output_document',
                                 'ignore_fatal_errors'])
 
-    def __init__(self, args, unit_test=False):
+    def __init__(self, args, unit_test=False, worker=None):
         self.default_user_agent = 'Wpull/{0} (gzip)'.format(
             wpull.version.__version__)
         self._args = args
         self._factory = Factory({
             'Application': Application,
             'BatchDocumentConverter': BatchDocumentConverter,
-            'BandwidthLimiter': BandwidthLimiter,
+            'BandwidthLimiter': TokenBucketLimiter,
             'HTTPClient': HTTPClient,
             'CookieJar': CookieJar,
+            'Checkpoint': Checkpoint,
+            'CircuitBreaker': CircuitBreaker,
             'CookieJarWrapper': CookieJarWrapper,
             'CookiePolicy': DeFactoCookiePolicy,
+            'ConcurrencyController': ConcurrencyController,
             'ConnectionPool': ConnectionPool,
             'CSSScraper': CSSScraper,
             'DemuxDocumentScraper': DemuxDocumentScraper,
@@ -124,12 +145,14 @@ class Builder(object):
             'ElementWalker': ElementWalker,
             'FetchRule': FetchRule,
             'FileWriter': NullWriter,
+            'Frontier': HostFrontier,
             'FTPClient': FTPClient,
             'FTPProcessorFetchParams': FTPProcessorFetchParams,
             'FTPProcessorInstances': FTPProcessorInstances,
             'HTTPProxyServer': HTTPProxyServer,
             'HTMLParser': NotImplemented,
             'HTMLScraper': HTMLScraper,
+            'HostPrefetcher': HostPrefetcher,
             'JavaScriptScraper': JavaScriptScraper,
             'OutputDocumentRecorder': OutputDocumentRecorder,
             'PathNamer': PathNamer,
@@ -148,11 +171,16 @@ class Builder(object):
             'ResultRule': ResultRule,
             'RobotsTxtChecker': RobotsTxtChecker,
             'RobotsTxtPool': RobotsTxtPool,
+            'SeedLoader': SeedLoader,
+            'SeenURLFilter': BloomFilter,
             'SitemapScraper': SitemapScraper,
+            'SSLSessionCache': SSLSessionCache,
             'Statistics': Statistics,
             'URLInfo': URLInfo,
             'URLTable': URLTableHookWrapper,
             'URLTableImplementation': SQLURLTable,
+            'URLTableServer': URLTableServer,
+            'URLTableThread': ThreadedURLTable,
             'URLRewriter': URLRewriter,
             'Waiter': LinearWaiter,
             'WARCRecorder': WARCRecorder,
@@ -160,16 +188,15 @@ class Builder(object):
             'WebProcessor': WebProcessor,
             'WebProcessorFetchParams': WebProcessorFetchParams,
             'WebProcessorInstances': WebProcessorInstances,
+            'WorkerPool': WorkerPool,
             'YoutubeDlCoprocessor': YoutubeDlCoprocessor,
             'ZipRecorder': ZipRecorder,
         })
-        self._input_urls_temp_file = tempfile.NamedTemporaryFile(
-            prefix='tmp-wpull-input_urls', dir=os.getcwd(),
-            suffix='.pickle')
         self._ca_certs_file = None
         self._file_log_handler = None
         self._console_log_handler = None
         self._unit_test = unit_test
+        self._worker = worker
 
     @property
     def factory(self):
@@ -202,72 +229,51 @@ class Builder(object):
 
         self._build_demux_document_scraper()
 
-        with wpull.util.reset_file_offset(self._input_urls_temp_file):
-            input_urls_pickle_stream = GzipPickleStream(
-                file=self._input_urls_temp_file, mode='wb'
-            )
-
-            for url_info in self._build_input_urls():
-                input_urls_pickle_stream.dump(url_info)
-
-            input_urls_pickle_stream.close()
-            del input_urls_pickle_stream
-
         statistics = self._factory.new('Statistics')
         statistics.quota = self._args.quota
 
-        if self._args.quota:
-            with wpull.util.reset_file_offset(self._input_urls_temp_file):
-                input_urls_pickle_stream = GzipPickleStream(
-                    file=self._input_urls_temp_file, mode='rb'
-                )
+        url_table = self._build_url_table()
 
-                for url_info in input_urls_pickle_stream.iter_load():
-                    statistics.required_urls_db[url_info.url] = True
+        if self._is_coordinator():
+            self._build_worker_pool(url_table)
+        else:
+            if self._worker:
+                seed_loader = None
+            else:
+                seed_loader = self._build_seed_loader(url_table)
 
-                input_urls_pickle_stream.close()
-                del input_urls_pickle_stream
+            processor = self._build_processor()
 
-        url_table = self._build_url_table()
-        processor = self._build_processor()
+            self._factory.new(
+                'Engine',
+                url_table,
+                processor,
+                statistics,
+                concurrent=self._args.concurrent,
+                ignore_exceptions=self._args.ignore_fatal_errors,
+                resource_monitor=resource_monitor,
+                prefetch_size=self._get_prefetch_size(),
+                frontier=self._build_frontier(),
+                seed_loader=seed_loader,
+                delayed_retries=bool(self._args.retry_delay),
+                concurrency_controller=self._build_concurrency_controller(),
+                circuit_breaker=self._factory.get('CircuitBreaker'),
+                lease_timeout=self._args.lease_timeout,
+                checkpoint=self._build_checkpoint(),
+                prefetcher=self._build_prefetcher(),
+            )
 
-        self._factory.new(
-            'Engine',
-            url_table,
-            processor,
-            statistics,
-            concurrent=self._args.concurrent,
-            ignore_exceptions=self._args.ignore_fatal_errors,
-            resource_monitor=resource_monitor,
-        )
         self._build_document_converter()
 
         self._setup_file_logger_close(self.factory['Application'])
         self._setup_console_logger_close(self.factory['Application'])
 
-        self._install_script_hooks()
+        if not self._is_coordinator():
+            self._install_script_hooks()
+
         self._warn_unsafe_options()
         self._warn_silly_options()
 
-        with wpull.util.reset_file_offset(self._input_urls_temp_file):
-            batch = []
-            input_urls_pickle_stream = GzipPickleStream(
-                file=self._input_urls_temp_file, mode='rb'
-            )
-
-            for url_info in input_urls_pickle_stream.iter_load():
-                batch.append({'url': url_info.url})
-                if len(batch) > 1000:
-                    url_table.add_many(batch)
-                    batch = []
-
-            url_table.add_many(batch)
-
-            input_urls_pickle_stream.close()
-            del input_urls_pickle_stream
-
-        self._input_urls_temp_file.close()
-
         return self._factory['Application']
 
     def build_and_run(self):
@@ -484,6 +490,32 @@ class Builder(object):
 
         atexit.register(sock.close)
 
+    def _is_coordinator(self):
+        '''Return whether the crawl is split across worker processes.'''
+        return self._args.workers > 1 and not self._worker
+
+    def _build_worker_pool(self, url_table):
+        '''Build the worker pool that replaces the engine.
+
+        Only the input URLs and the URL table are set up in this process.
+        Everything else is built by each worker.
+        '''
+        if self._args.warc_dedup:
+            self._populate_visits()
+
+        self._factory.class_map['Engine'] = self._factory.class_map[
+            'WorkerPool']
+
+        return self._factory.new(
+            'Engine',
+            url_table,
+            self._factory.new('URLTableServer', url_table),
+            self._factory['Statistics'],
+            self._args.workers,
+            functools.partial(run_worker, type(self), self._args),
+            seed_loader=self._build_seed_loader(url_table),
+        )
+
     def _build_resource_monitor(self):
         if not wpull.resmon.psutil:
             return
@@ -500,9 +532,135 @@ class Builder(object):
             min_disk=self._args.monitor_disk,
         )
 
+    def _build_frontier(self):
+        '''Build the host frontier if per-host scheduling is needed.'''
+        if not self._args.host_concurrent and not self._args.host_wait:
+            return
+
+        return self._factory.new(
+            'Frontier',
+            max_host_concurrent=self._args.host_concurrent,
+            host_wait=self._args.host_wait,
+        )
+
+    def _build_concurrency_controller(self):
+        '''Build the adaptive concurrency controller if requested.'''
+        if not self._args.adaptive_concurrency:
+            return
+
+        statistics = self._factory['Statistics']
+        controller = self._factory.new(
+            'ConcurrencyController',
+            self._args.concurrent or 1,
+            max_concurrent=max(self._args.max_concurrent,
+                               self._args.concurrent),
+            host_concurrent=self._args.host_concurrent,
+            bandwidth_meter=statistics.bandwidth_meter,
+        )
+
+        statistics.error_observer.add(controller.add_error)
+
+        return controller
+
+    def _get_prefetch_size(self):
+        '''Return the number of URLs the engine checks out at once.
+
+        With a crawl order, URLs are checked out as workers become free so
+        URLs added meanwhile take their place in the order.
+        '''
+        if self._args.crawl_order == CrawlOrder.default:
+            return 50
+        else:
+            return max(1, self._args.concurrent)
+
+    def _build_circuit_breaker(self):
+        '''Build the circuit breaker if requested.'''
+        if not self._args.circuit_breaker:
+            return
+
+        return self._factory.new(
+            'CircuitBreaker',
+            failure_threshold=self._args.circuit_breaker,
+            cool_down=self._args.circuit_breaker_cool_down,
+        )
+
+    def _build_checkpoint(self):
+        '''Build the checkpoint of the resolver and robots.txt caches.'''
+        if not self._args.checkpoint:
+            return
+
+        return self._factory.new(
+            'Checkpoint',
+            self._args.checkpoint,
+            resolver=self._factory.get('Resolver'),
+            robots_txt_pool=self._factory.get('RobotsTxtPool'),
+        )
+
+    def _build_prefetcher(self):
+        '''Build the prefetcher of upcoming hosts if requested.'''
+        if not self._args.dns_prefetch:
+            return
+
+        connection_pool = self._factory.get('ConnectionPool')
+
+        # Connections through a proxy are made to the proxy, not the host.
+        if not self._args.preconnect or \
+                isinstance(connection_pool, HTTPProxyConnectionPool):
+            connection_pool = None
+
+        return self._factory.new(
+            'HostPrefetcher',
+            self._factory['Resolver'],
+            connection_pool=connection_pool,
+            max_tasks=self._args.dns_prefetch,
+        )
+
+    def _build_seed_loader(self, url_table):
+        '''Build the loader of the input URLs.'''
+        seed_loader = self._factory.new(
+            'SeedLoader',
+            url_table,
+            self._build_input_urls(),
+            early_start=self._is_seed_early_start(),
+        )
+
+        if self._args.quota:
+            statistics = self._factory['Statistics']
+
+            def add_required_urls(url_infos):
+                for url_info in url_infos:
+                    statistics.required_urls_db[url_info.url] = True
+
+            seed_loader.batch_observer.add(add_required_urls)
+
+        return seed_loader
+
+    def _is_seed_early_start(self):
+        '''Return whether downloading can start while input URLs load.
+
+        The quota and the span hosts filter need every input URL before
+        they can make decisions. A coordinator holds check outs until other
+        instances add URLs, which would delay loading.
+        '''
+        args = self._args
+
+        if args.quota or args.coordinator:
+            return False
+        elif args.span_hosts:
+            return True
+        elif args.recursive:
+            return False
+        else:
+            return not args.page_requisites or \
+                'page-requisites' in args.span_hosts_allow
+
     def _build_input_urls(self, default_scheme='http'):
-        '''Read the URLs provided by the user.'''
+        '''Read the URLs provided by the user.
 
+        Returns:
+            iterator: An iterator of :class:`.url.URLInfo`. The input file
+            is read and parsed as the iterator is consumed.
+        '''
         url_string_iter = self._args.urls or ()
         url_rewriter = self._build_url_rewriter()
 
@@ -514,6 +672,12 @@ class Builder(object):
 
             url_string_iter = itertools.chain(url_string_iter, urls)
 
+        return self._parse_input_urls(
+            url_string_iter, url_rewriter, default_scheme)
+
+    def _parse_input_urls(self, url_string_iter, url_rewriter,
+                          default_scheme):
+        '''Parse and rewrite the URLs provided by the user.'''
         base_url = self._args.base
 
         for url_string in url_string_iter:
@@ -583,22 +747,20 @@ class Builder(object):
             FollowFTPFilter(follow=args.follow_ftp),
         ]
 
-        with wpull.util.reset_file_offset(self._input_urls_temp_file):
-            input_urls_pickle_stream = GzipPickleStream(
-                file=self._input_urls_temp_file, mode='rb'
-            )
+        span_hosts_filter = SpanHostsFilter(
+            (),
+            enabled=args.span_hosts,
+            page_requisites='page-requisites' in args.span_hosts_allow,
+            linked_pages='linked-pages' in args.span_hosts_allow,
+        )
 
-            filters.append(
-                SpanHostsFilter(
-                    input_urls_pickle_stream.iter_load(),
-                    enabled=args.span_hosts,
-                    page_requisites='page-requisites' in args.span_hosts_allow,
-                    linked_pages='linked-pages' in args.span_hosts_allow,
-                )
-            )
+        if self._worker:
+            span_hosts_filter.add_hostnames(self._worker.input_hostnames)
+        else:
+            self._factory['SeedLoader'].batch_observer.add(
+                span_hosts_filter.add_input_url_infos)
 
-            input_urls_pickle_stream.close()
-            del input_urls_pickle_stream
+        filters.append(span_hosts_filter)
 
         if args.no_parent:
             filters.append(ParentFilter())
@@ -704,18 +866,90 @@ class Builder(object):
         Returns:
             URLTable: An instance of :class:`.database.base.BaseURLTable`.
         '''
-        if self._args.database_uri:
+        if self._worker:
+            self._factory.class_map[
+                'URLTableImplementation'] = RemoteURLTable
+            url_table_impl_factory = functools.partial(
+                self._factory.new,
+                'URLTableImplementation', self._worker.connection)
+        elif self._args.coordinator:
+            self._factory.class_map[
+                'URLTableImplementation'] = RemoteURLTable
+            url_table_impl_factory = functools.partial(
+                self._factory.new,
+                'URLTableImplementation',
+                multiprocessing.connection.Client(
+                    self._args.coordinator,
+                    authkey=self._args.coordinator_key.encode('utf-8')),
+                heartbeat_interval=60,
+                close_connection=True)
+        elif self._args.database_uri:
             self._factory.class_map[
                 'URLTableImplementation'] = GenericSQLURLTable
-            url_table_impl = self._factory.new(
-                'URLTableImplementation', self._args.database_uri)
+            url_table_impl_factory = functools.partial(
+                self._factory.new,
+                'URLTableImplementation', self._args.database_uri,
+                crawl_order=self._args.crawl_order,
+                write_behind_size=100)
         else:
-            url_table_impl = self._factory.new(
-                'URLTableImplementation', path=self._args.database)
+            if self._args.database_backend == 'sqlite3':
+                self._factory.class_map[
+                    'URLTableImplementation'] = SQLite3URLTable
+            elif self._args.database_backend == 'sqlite3-fingerprint':
+                self._factory.class_map[
+                    'URLTableImplementation'] = FingerprintSQLite3URLTable
+
+            url_table_impl_factory = functools.partial(
+                self._factory.new,
+                'URLTableImplementation', path=self._args.database,
+                crawl_order=self._args.crawl_order,
+                write_behind_size=100)
+
+        url_table_thread = self._factory.new(
+            'URLTableThread', url_table_impl_factory)
+
+        if self._worker or self._args.coordinator:
+            # The table of the coordinating process has the filter
+            seen_filter = None
+        else:
+            seen_filter = self._build_seen_url_filter(url_table_thread)
 
-        url_table = self._factory.new('URLTable', url_table_impl)
+        url_table = self._factory.new(
+            'URLTable', url_table_thread, seen_filter=seen_filter)
         return url_table
 
+    def _build_seen_url_filter(self, url_table):
+        '''Create the seen URL filter.
+
+        The filter is only used with an empty table so it does not need
+        to be filled from the table.
+
+        Returns:
+            BloomFilter, None: An instance of
+            :class:`.collections.BloomFilter` or None.
+        '''
+        if not self._args.seen_url_filter:
+            return
+
+        if url_table.count():
+            _logger.info(_('Not using the seen URL filter because the '
+                           'database is not empty.'))
+            return
+
+        capacity = self._factory.class_map['SeenURLFilter'].get_capacity(
+            self._args.seen_url_filter_memory, self._args.seen_url_filter)
+        seen_filter = self._factory.new(
+            'SeenURLFilter', capacity, self._args.seen_url_filter,
+            max_size=self._args.seen_url_filter_memory
+        )
+
+        _logger.debug(__(
+            'Seen URL filter capacity {0}, size {1}.',
+            seen_filter.capacity, seen_filter.size
+        ))
+
+        return seen_filter
+
     def _build_recorder(self):
         '''Create the Recorder.
 
@@ -792,7 +1026,7 @@ class Builder(object):
                 human_format=not args.report_speed,
             ))
 
-        if args.warc_dedup:
+        if args.warc_dedup and not self._worker:
             self._populate_visits()
 
         if args.output_document:
@@ -900,6 +1134,9 @@ class Builder(object):
             retry_dns_error=args.retry_dns_error,
             waiter=waiter,
             statistics=self._factory['Statistics'],
+            retry_delay=args.retry_delay,
+            max_retry_delay=max(args.waitretry, args.retry_delay),
+            circuit_breaker=self._build_circuit_breaker(),
         )
 
         processing_rule = self._factory.new(
@@ -1109,9 +1346,13 @@ class Builder(object):
         if args.timeout:
             connect_timeout = read_timeout = args.timeout
 
-        if args.limit_rate:
-            bandwidth_limiter = self.factory.new('BandwidthLimiter',
-                                                 args.limit_rate)
+        if args.limit_rate or args.host_limit_rate:
+            bandwidth_limiter = self.factory.new(
+                'BandwidthLimiter',
+                rate_limit=args.limit_rate,
+                host_rate_limit=args.host_limit_rate,
+                burst=args.limit_rate_burst
+            )
         else:
             bandwidth_limiter = None
 
@@ -1128,7 +1369,9 @@ class Builder(object):
             timeout=read_timeout,
             connect_timeout=connect_timeout,
             bind_host=self._args.bind_address,
-            ssl_context=self._build_ssl_options()
+            ssl_context=self._build_ssl_options(),
+            ssl_session_cache=self._factory.new('SSLSessionCache'),
+            bandwidth_limiter=bandwidth_limiter,
         )
 
         if not self._args.no_proxy:
@@ -1171,13 +1414,15 @@ class Builder(object):
                     connection_factory=connection_factory,
                     ssl_connection_factory=ssl_connection_factory,
                     host_filter=host_filter,
+                    idle_timeout=self._args.keep_alive_timeout,
                 )
 
         return self._factory.new(
             'ConnectionPool',
             resolver=self._build_resolver(),
             connection_factory=connection_factory,
-            ssl_connection_factory=ssl_connection_factory
+            ssl_connection_factory=ssl_connection_factory,
+            idle_timeout=self._args.keep_alive_timeout,
         )
 
     def _build_resolver(self):
@@ -1211,6 +1456,8 @@ class Builder(object):
             timeout=dns_timeout,
             rotate=args.rotate_dns,
             cache_enabled=args.dns_cache,
+            cache_size=args.dns_cache_size,
+            negative_time_to_live=args.dns_negative_ttl,
         )
 
     def _build_http_client(self):
@@ -1226,10 +1473,16 @@ class Builder(object):
             ignore_length=self._args.ignore_length,
             keep_alive=self._args.http_keep_alive)
 
+        if self._args.http_keep_alive and not self._args.ignore_length:
+            pipeline_depth = self._args.http_pipelining
+        else:
+            pipeline_depth = None
+
         return self._factory.new('HTTPClient',
                                  connection_pool=self._build_connection_pool(),
                                  recorder=recorder,
-                                 stream_factory=stream_factory
+                                 stream_factory=stream_factory,
+                                 pipeline_depth=pipeline_depth,
         )
 
     def _build_web_client(self):
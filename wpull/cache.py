@@ -68,6 +68,10 @@ class FIFOCache(BaseCache):
         self._map = {}
         self._seq = collections.deque()
 
+    def peek(self, key):
+        '''Return the value without counting it as a use.'''
+        return self._map[key].value
+
     def trim(self):
         '''Remove items that are expired or exceed the max size.'''
         now_time = time.time()
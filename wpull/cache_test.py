@@ -59,6 +59,19 @@ class TestCache(unittest.TestCase):
         self.assertIn('a', cache)
         self.assertEqual(1, cache['a'])
 
+    def test_lru_peek(self):
+        cache = LRUCache(max_items=2)
+
+        cache['a'] = 1
+        cache['b'] = 2
+
+        self.assertEqual(1, cache.peek('a'))
+
+        cache['c'] = 3
+
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+
     def test_lru_size_2(self):
         cache = LRUCache(max_items=2)
 
@@ -0,0 +1,152 @@
+# encoding=utf-8
+'''Saving caches between runs.'''
+import errno
+import gettext
+import json
+import logging
+import os
+import time
+
+from trollius import From
+import trollius
+
+from wpull.backport.logging import BraceMessage as __
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+
+def _replace_file(src, dst):
+    '''Rename the file and overwrite any existing file.'''
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        # Python 3.2 only replaces an existing file on POSIX
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+
+        os.rename(src, dst)
+
+
+class Checkpoint(object):
+    '''Save caches that are slow to rebuild to a file.
+
+    Args:
+        path (str): The filename of the checkpoint.
+        resolver (:class:`.dns.Resolver`): If provided, the cached DNS
+            results are saved.
+        robots_txt_pool (:class:`.robotstxt.RobotsTxtPool`): If provided,
+            the robots.txt files are saved.
+        interval (float): The time in seconds between saves.
+
+    Call :meth:`start` to load the file and save it periodically in a
+    background task so a crawl that did not exit cleanly still resumes
+    without looking up every host again. The file is replaced atomically.
+    '''
+    VERSION = 1
+
+    def __init__(self, path, resolver=None, robots_txt_pool=None,
+                 interval=60.0):
+        self._path = path
+        self._resolver = resolver
+        self._robots_txt_pool = robots_txt_pool
+        self._interval = interval
+        self._task = None
+
+    def start(self):
+        '''Load the file and start saving in a background task.'''
+        self.load()
+
+        if not self._task:
+            self._task = trollius.async(self._run())
+
+    def stop(self):
+        '''Stop the background task and save.'''
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        self.save()
+
+    @trollius.coroutine
+    def _run(self):
+        while True:
+            yield From(trollius.sleep(self._interval))
+            self.save()
+
+    def load(self):
+        '''Load the file if it exists.
+
+        Returns:
+            bool: Whether the file was loaded.
+        '''
+        try:
+            with open(self._path, 'r', encoding='utf-8') as in_file:
+                doc = json.load(in_file)
+        except (IOError, OSError, ValueError) as error:
+            if getattr(error, 'errno', None) == errno.ENOENT:
+                return False
+
+            _logger.warning(__(
+                _('Could not load checkpoint {path}: {error}'),
+                path=self._path, error=error
+            ))
+            return False
+
+        if not isinstance(doc, dict) or doc.get('version') != self.VERSION:
+            _logger.warning(__(
+                _('Ignoring checkpoint {path} of an unknown version.'),
+                path=self._path
+            ))
+            return False
+
+        try:
+            age = time.time() - doc['time']
+
+            if self._resolver:
+                self._resolver.load_cache_entries(doc.get('dns', ()))
+
+            if self._robots_txt_pool:
+                self._robots_txt_pool.load_texts(doc.get('robots_txt', ()))
+        except (LookupError, TypeError, ValueError) as error:
+            _logger.warning(__(
+                _('Could not load checkpoint {path}: {error}'),
+                path=self._path, error=error
+            ))
+            return False
+
+        _logger.info(__(
+            _('Loaded checkpoint {path} from {age:.0f} seconds ago.'),
+            path=self._path, age=age
+        ))
+
+        return True
+
+    def save(self):
+        '''Write the file.'''
+        doc = {
+            'version': self.VERSION,
+            'time': time.time(),
+        }
+
+        if self._resolver:
+            doc['dns'] = self._resolver.get_cache_entries()
+
+        if self._robots_txt_pool:
+            doc['robots_txt'] = self._robots_txt_pool.get_texts()
+
+        temp_path = self._path + '-new'
+
+        _logger.debug(__('Saving checkpoint {0}.', self._path))
+
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as out_file:
+                json.dump(doc, out_file)
+
+            _replace_file(temp_path, self._path)
+        except (IOError, OSError) as error:
+            _logger.warning(__(
+                _('Could not save checkpoint {path}: {error}'),
+                path=self._path, error=error
+            ))
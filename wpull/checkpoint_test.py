@@ -0,0 +1,101 @@
+# encoding=utf-8
+import os.path
+import socket
+import tempfile
+import time
+import unittest
+
+from wpull.checkpoint import Checkpoint
+from wpull.dns import Resolver
+from wpull.robotstxt import RobotsTxtPool
+from wpull.url import URLInfo
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_save_load(self):
+        resolver = Resolver()
+        robots_txt_pool = RobotsTxtPool()
+        url_info = URLInfo.parse('http://example.com/')
+
+        resolver.load_cache_entries([
+            ('example.com', 80, Resolver.PREFER_IPv4,
+             [(socket.AF_INET, ('127.0.0.1', 80))], time.time() + 100),
+            ('example.net', 80, Resolver.PREFER_IPv4,
+             [(socket.AF_INET, ('127.0.0.2', 80))], time.time() - 1),
+        ])
+        robots_txt_pool.load_robots_txt(
+            url_info, b'User-agent: *\nDisallow: /admin\n')
+
+        checkpoint = Checkpoint(self.path, resolver=resolver,
+                                robots_txt_pool=robots_txt_pool)
+
+        self.assertFalse(checkpoint.load())
+
+        checkpoint.save()
+
+        self.assertTrue(os.path.exists(self.path))
+
+        resolver = Resolver()
+        robots_txt_pool = RobotsTxtPool()
+        checkpoint = Checkpoint(self.path, resolver=resolver,
+                                robots_txt_pool=robots_txt_pool)
+
+        self.assertTrue(checkpoint.load())
+
+        entries = resolver.get_cache_entries()
+
+        self.assertEqual(1, len(entries))
+        self.assertEqual(
+            ('example.com', 80, Resolver.PREFER_IPv4,
+             [(socket.AF_INET, ('127.0.0.1', 80))]),
+            entries[0][:4]
+        )
+        self.assertAlmostEqual(time.time() + 100, entries[0][4], delta=1)
+        self.assertTrue(robots_txt_pool.has_parser(url_info))
+        self.assertFalse(robots_txt_pool.can_fetch(
+            URLInfo.parse('http://example.com/admin'), 'wpull'))
+        self.assertTrue(robots_txt_pool.can_fetch(
+            URLInfo.parse('http://example.com/blog'), 'wpull'))
+
+    def test_load_bad_file(self):
+        with open(self.path, 'w') as out_file:
+            out_file.write('{"version": 1')
+
+        checkpoint = Checkpoint(self.path, resolver=Resolver())
+
+        self.assertFalse(checkpoint.load())
+
+        with open(self.path, 'w') as out_file:
+            out_file.write('{"version": 1000}')
+
+        self.assertFalse(checkpoint.load())
+
+    def test_load_corrupt_document(self):
+        checkpoint = Checkpoint(self.path, resolver=Resolver(),
+                                robots_txt_pool=RobotsTxtPool())
+        docs = [
+            '[1, 2]',
+            '{"version": 1}',
+            '{"version": 1, "time": "now"}',
+            '{"version": 1, "time": 0, "dns": [["example.com"]]}',
+            '{"version": 1, "time": 0, "dns": 5}',
+            '{"version": 1, "time": 0, "robots_txt": [1]}',
+        ]
+
+        for doc in docs:
+            with open(self.path, 'w') as out_file:
+                out_file.write(doc)
+
+            self.assertFalse(checkpoint.load(), doc)
+
+        checkpoint.save()
+        checkpoint.save()
+
+        self.assertTrue(checkpoint.load())
@@ -0,0 +1,232 @@
+# encoding=utf-8
+'''Per-host circuit breaker.'''
+import collections
+import gettext
+import logging
+import time
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.hook import HookableMixin, HookDisconnected
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+
+class CircuitState(object):
+    '''States of a host circuit.'''
+    closed = 'closed'
+    '''Items of the host are processed normally.'''
+    open = 'open'
+    '''Items of the host are deferred until the cool-down ends.'''
+    half_open = 'half_open'
+    '''A single item of the host is processed to test it.'''
+
+
+class Circuit(object):
+    '''The health of a host.
+
+    Attributes:
+        state (str): A value from :class:`CircuitState`.
+        failures (int): The number of consecutive failures.
+        cool_down (float): The current cool-down in seconds.
+        open_until (float): The timestamp when the cool-down ends.
+        probe_url (str): The URL of the probe item being processed or
+            None.
+    '''
+    def __init__(self, cool_down):
+        self.state = CircuitState.closed
+        self.failures = 0
+        self.cool_down = cool_down
+        self.open_until = None
+        self.probe_url = None
+
+
+class CircuitBreaker(HookableMixin):
+    '''Stop processing items of hosts that keep failing.
+
+    Args:
+        failure_threshold (int): The number of consecutive network errors
+            that opens the circuit of a host.
+        cool_down (float): The time in seconds items of an open host are
+            deferred.
+        max_cool_down (float): The maximum cool-down. The cool-down doubles
+            each time the probe fails.
+        probe_wait (float): The time in seconds items are deferred while
+            the probe of the host is being processed.
+        max_hosts (int): The number of failing hosts to remember.
+
+    When a host fails `failure_threshold` times in a row, its circuit
+    opens and its items are deferred for the cool-down. Afterwards, the
+    circuit is half open and a single item is processed as a probe. If it
+    succeeds, the circuit closes. Otherwise, the circuit opens again.
+    Failures of items started before the probe do not count as the result
+    of the probe.
+
+    The hook ``circuit_state`` is called with the hostname and the new
+    :class:`CircuitState` on each change.
+
+    Attributes:
+        open_count (int): The number of times a circuit opened.
+        deferred_count (int): The number of items deferred.
+    '''
+    def __init__(self, failure_threshold=5, cool_down=60.0,
+                 max_cool_down=3600.0, probe_wait=5.0, max_hosts=10000):
+        super().__init__()
+        assert failure_threshold > 0, \
+            'Expect positive threshold. Got {}.'.format(failure_threshold)
+
+        self._failure_threshold = failure_threshold
+        self._cool_down = cool_down
+        self._max_cool_down = max(cool_down, max_cool_down)
+        self._probe_wait = probe_wait
+        self._max_hosts = max_hosts
+        self._circuits = collections.OrderedDict()
+
+        self.open_count = 0
+        self.deferred_count = 0
+
+        self.register_hook('circuit_state')
+
+    def get_state(self, hostname):
+        '''Return the :class:`CircuitState` of the host.'''
+        circuit = self._circuits.get(hostname)
+
+        if not circuit:
+            return CircuitState.closed
+        elif circuit.state == CircuitState.open and \
+                time.time() >= circuit.open_until:
+            return CircuitState.half_open
+        else:
+            return circuit.state
+
+    @property
+    def open_hosts(self):
+        '''Return the hostnames whose circuits are not closed.'''
+        return [hostname for hostname, circuit in self._circuits.items()
+                if circuit.state != CircuitState.closed]
+
+    def acquire(self, hostname, url):
+        '''Return whether an item of the host may be processed now.
+
+        When the cool-down has ended, the first call returns True and the
+        item with the URL becomes the probe. Call :meth:`release` when the
+        item is finished.
+        '''
+        circuit = self._circuits.get(hostname)
+
+        if not circuit or circuit.state == CircuitState.closed:
+            return True
+
+        if circuit.state == CircuitState.open:
+            if time.time() < circuit.open_until:
+                self.deferred_count += 1
+                return False
+
+            self._change_state(hostname, circuit, CircuitState.half_open)
+
+        if circuit.probe_url is not None:
+            self.deferred_count += 1
+            return False
+
+        circuit.probe_url = url
+
+        return True
+
+    def release(self, hostname, url):
+        '''Mark an item of the host as finished.
+
+        If the probe finished without a result, another item may probe
+        the host.
+        '''
+        circuit = self._circuits.get(hostname)
+
+        if circuit and circuit.probe_url == url:
+            circuit.probe_url = None
+
+    def get_retry_time(self, hostname):
+        '''Return the timestamp when a deferred item may be tried again.'''
+        circuit = self._circuits.get(hostname)
+
+        if circuit and circuit.state == CircuitState.open and \
+                circuit.open_until > time.time():
+            return circuit.open_until
+        else:
+            return time.time() + self._probe_wait
+
+    def add_success(self, hostname):
+        '''Record a response from the host.'''
+        circuit = self._circuits.pop(hostname, None)
+
+        if circuit and circuit.state != CircuitState.closed:
+            _logger.info(__(_('Host {host} recovered.'), host=hostname))
+            self._call_state_hook(hostname, CircuitState.closed)
+
+    def add_failure(self, hostname, url=None):
+        '''Record a network error of the host.
+
+        Args:
+            hostname (str): The hostname.
+            url (str): The URL of the item. While the circuit is half
+                open, only a failure of the probe is counted. If None, the
+                failure is counted.
+        '''
+        circuit = self._circuits.get(hostname)
+
+        if circuit and circuit.state == CircuitState.half_open and \
+                url is not None and url != circuit.probe_url:
+            _logger.debug(__('Ignoring failure of {0} on half open {1}.',
+                             url, hostname))
+            return
+
+        circuit = self._circuits.pop(hostname, None) or \
+            Circuit(self._cool_down)
+        self._circuits[hostname] = circuit
+        circuit.failures += 1
+
+        if circuit.state == CircuitState.half_open:
+            circuit.cool_down = min(self._max_cool_down, circuit.cool_down * 2)
+            self._open(hostname, circuit)
+        elif circuit.state == CircuitState.closed:
+            if circuit.failures >= self._failure_threshold:
+                self._open(hostname, circuit)
+            else:
+                self._evict()
+
+    def _open(self, hostname, circuit):
+        circuit.open_until = time.time() + circuit.cool_down
+        circuit.probe_url = None
+        self.open_count += 1
+
+        _logger.warning(__(
+            _('Too many network errors on {host}. '
+              'Deferring its URLs for {time:.1f} seconds.'),
+            host=hostname, time=circuit.cool_down
+        ))
+
+        self._change_state(hostname, circuit, CircuitState.open)
+
+    def _change_state(self, hostname, circuit, state):
+        circuit.state = state
+
+        _logger.debug(__('Circuit of {0} is {1}.', hostname, state))
+
+        self._call_state_hook(hostname, state)
+
+    def _call_state_hook(self, hostname, state):
+        try:
+            self.call_hook('circuit_state', hostname, state)
+        except HookDisconnected:
+            pass
+
+    def _evict(self):
+        '''Forget the oldest hosts whose circuits are closed.'''
+        if len(self._circuits) <= self._max_hosts:
+            return
+
+        for hostname, circuit in tuple(self._circuits.items()):
+            if circuit.state == CircuitState.closed:
+                del self._circuits[hostname]
+
+                if len(self._circuits) <= self._max_hosts:
+                    break
@@ -0,0 +1,162 @@
+# encoding=utf-8
+import time
+import unittest
+
+from wpull.circuit import CircuitBreaker, CircuitState
+
+
+class TestCircuit(unittest.TestCase):
+    def new_breaker(self, **kwargs):
+        breaker = CircuitBreaker(**kwargs)
+        changes = []
+
+        def add_change(hostname, state):
+            changes.append((hostname, state))
+
+        breaker.connect_hook('circuit_state', add_change)
+
+        return breaker, changes
+
+    def test_open_after_failures(self):
+        breaker, changes = self.new_breaker(failure_threshold=3)
+
+        breaker.add_failure('example.com')
+        breaker.add_failure('example.com')
+        breaker.add_success('example.com')
+        breaker.add_failure('example.com')
+        breaker.add_failure('example.com')
+
+        self.assertEqual(CircuitState.closed, breaker.get_state('example.com'))
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/1'))
+        self.assertFalse(changes)
+
+        breaker.add_failure('example.com')
+
+        self.assertEqual(CircuitState.open, breaker.get_state('example.com'))
+        self.assertFalse(
+            breaker.acquire('example.com', 'http://example.com/2'))
+        self.assertTrue(
+            breaker.acquire('example.net', 'http://example.net/3'))
+        self.assertEqual([('example.com', CircuitState.open)], changes)
+        self.assertEqual(['example.com'], breaker.open_hosts)
+        self.assertEqual(1, breaker.open_count)
+        self.assertEqual(1, breaker.deferred_count)
+        self.assertAlmostEqual(
+            time.time() + 60, breaker.get_retry_time('example.com'), delta=1)
+
+    def test_probe_success(self):
+        breaker, changes = self.new_breaker(failure_threshold=1, cool_down=0)
+
+        breaker.add_failure('example.com')
+
+        self.assertEqual(
+            CircuitState.half_open, breaker.get_state('example.com'))
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/1'))
+        self.assertFalse(
+            breaker.acquire('example.com', 'http://example.com/2'))
+        self.assertGreater(breaker.get_retry_time('example.com'), time.time())
+
+        breaker.add_success('example.com')
+        breaker.release('example.com', 'http://example.com/1')
+
+        self.assertEqual(CircuitState.closed, breaker.get_state('example.com'))
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/3'))
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/4'))
+        self.assertFalse(breaker.open_hosts)
+        self.assertEqual(
+            [
+                ('example.com', CircuitState.open),
+                ('example.com', CircuitState.half_open),
+                ('example.com', CircuitState.closed),
+            ],
+            changes
+        )
+
+    def test_probe_failure(self):
+        breaker, changes = self.new_breaker(
+            failure_threshold=1, cool_down=0.01, max_cool_down=0.03)
+
+        breaker.add_failure('example.com')
+        time.sleep(0.02)
+
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/1'))
+
+        breaker.add_failure('example.com')
+        breaker.release('example.com', 'http://example.com/1')
+
+        self.assertEqual(CircuitState.open, breaker.get_state('example.com'))
+        self.assertFalse(
+            breaker.acquire('example.com', 'http://example.com/2'))
+        self.assertAlmostEqual(
+            time.time() + 0.02, breaker.get_retry_time('example.com'),
+            delta=0.01)
+        self.assertEqual(2, breaker.open_count)
+
+        time.sleep(0.03)
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/3'))
+        breaker.add_failure('example.com')
+
+        self.assertAlmostEqual(
+            time.time() + 0.03, breaker.get_retry_time('example.com'),
+            delta=0.01)
+
+    def test_probe_released_without_result(self):
+        breaker = CircuitBreaker(failure_threshold=1, cool_down=0)
+
+        breaker.add_failure('example.com')
+
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/1'))
+        self.assertFalse(
+            breaker.acquire('example.com', 'http://example.com/2'))
+
+        breaker.release('example.com', 'http://example.com/1')
+
+        self.assertTrue(
+            breaker.acquire('example.com', 'http://example.com/3'))
+
+    def test_probe_with_earlier_item(self):
+        breaker, changes = self.new_breaker(
+            failure_threshold=1, cool_down=0.01, max_cool_down=1)
+
+        self.assertTrue(breaker.acquire('example.com', 'http://example.com/1'))
+        breaker.add_failure('example.com', 'http://example.com/2')
+        time.sleep(0.02)
+
+        self.assertTrue(breaker.acquire('example.com', 'http://example.com/3'))
+
+        # The item started before the circuit opened finishes
+        breaker.add_failure('example.com', 'http://example.com/1')
+        breaker.release('example.com', 'http://example.com/1')
+
+        self.assertEqual(
+            CircuitState.half_open, breaker.get_state('example.com'))
+        self.assertFalse(
+            breaker.acquire('example.com', 'http://example.com/4'))
+
+        breaker.add_failure('example.com', 'http://example.com/3')
+        breaker.release('example.com', 'http://example.com/3')
+
+        self.assertEqual(CircuitState.open, breaker.get_state('example.com'))
+        self.assertAlmostEqual(
+            time.time() + 0.02, breaker.get_retry_time('example.com'),
+            delta=0.01)
+        self.assertEqual(2, breaker.open_count)
+
+    def test_max_hosts(self):
+        breaker = CircuitBreaker(failure_threshold=2, max_hosts=2)
+
+        breaker.add_failure('example.com')
+        breaker.add_failure('example.com')
+
+        for num in range(5):
+            breaker.add_failure('example{}.net'.format(num))
+
+        self.assertEqual(['example.com'], breaker.open_hosts)
+        self.assertEqual(2, len(breaker._circuits))
@@ -3,8 +3,10 @@
 from collections import OrderedDict
 import collections
 import copy
+import hashlib
 import itertools
 import functools
+import math
 
 
 class OrderedDefaultDict(OrderedDict):
@@ -259,3 +261,124 @@ class FrozenDict(collections.Mapping, collections.Hashable):
 
 
 EmptyFrozenDict = functools.partial(FrozenDict, {})
+
+
+class BloomFilter(object):
+    '''Probabilistic set of strings.
+
+    A string that was added is always reported as present. A string that
+    was not added may be reported as present with a probability up to the
+    false positive rate as long as the filter is not full.
+
+    Args:
+        capacity (int): The number of items expected to be added.
+        false_positive_rate (float): The false positive probability when
+            `capacity` items are added.
+        max_size (int): The maximum size of the bit array in bytes. If the
+            bit array for `capacity` items is larger, the capacity is
+            reduced instead.
+
+    The filter is blocked: the bits of an item are all in one block of
+    :attr:`BLOCK_SIZE` bytes so an item is tested and added with a single
+    digest and a single integer operation. Each byte of the digest is the
+    index of one bit in the block.
+    '''
+    BLOCK_SIZE = 32
+    '''The size of a block in bytes. A byte indexes any bit in it.'''
+    MAX_HASHES = 56
+    '''The number of bit indexes that fit in the digest.'''
+
+    _BIT_MASKS = tuple(1 << index for index in range(BLOCK_SIZE * 8))
+
+    def __init__(self, capacity, false_positive_rate=0.000001, max_size=None):
+        assert capacity > 0, \
+            'Expect positive capacity. Got {}.'.format(capacity)
+        assert 0 < false_positive_rate < 1, \
+            'Expect rate between 0 and 1. Got {}.'.format(false_positive_rate)
+
+        bits_per_item = self._get_bits_per_item(false_positive_rate)
+        num_bits = int(math.ceil(capacity * bits_per_item))
+
+        if max_size and num_bits > max_size * 8:
+            num_bits = max_size * 8
+            capacity = int(num_bits / bits_per_item)
+
+        block_bits = self.BLOCK_SIZE * 8
+
+        self._capacity = max(1, capacity)
+        self._num_blocks = max(1, num_bits // block_bits)
+        self._num_hashes = min(
+            self.MAX_HASHES, max(1, int(round(bits_per_item * math.log(2)))))
+        self._bits = bytearray(self._num_blocks * self.BLOCK_SIZE)
+        self._count = 0
+
+    @classmethod
+    def _get_bits_per_item(cls, false_positive_rate):
+        return - math.log(false_positive_rate) / math.log(2) ** 2
+
+    @classmethod
+    def get_capacity(cls, size, false_positive_rate=0.000001):
+        '''Return the number of items a bit array of `size` bytes holds.'''
+        return max(
+            1, int(size * 8 / cls._get_bits_per_item(false_positive_rate)))
+
+    def __len__(self):
+        '''Return the number of distinct items added.
+
+        Items that were false positives when added are not counted.
+        '''
+        return self._count
+
+    @property
+    def capacity(self):
+        '''The number of items that keep the false positive rate.'''
+        return self._capacity
+
+    @property
+    def size(self):
+        '''The size of the bit array in bytes.'''
+        return len(self._bits)
+
+    def is_full(self):
+        '''Return whether more items than the capacity were added.'''
+        return self._count > self._capacity
+
+    def _get_block(self, item):
+        '''Return the offset of the item's block and its bit mask.'''
+        digest = hashlib.sha512(item.encode('utf-8', 'surrogatepass')).digest()
+        offset = int.from_bytes(digest[:8], 'little') % self._num_blocks \
+            * self.BLOCK_SIZE
+
+        bit_masks = self._BIT_MASKS
+        mask = 0
+
+        for index in digest[8:8 + self._num_hashes]:
+            mask |= bit_masks[index]
+
+        return offset, mask
+
+    def __contains__(self, item):
+        offset, mask = self._get_block(item)
+        block = int.from_bytes(
+            self._bits[offset:offset + self.BLOCK_SIZE], 'little')
+
+        return block & mask == mask
+
+    def add(self, item):
+        '''Add a string.
+
+        Returns:
+            bool: Whether the item was not present.
+        '''
+        offset, mask = self._get_block(item)
+        block = int.from_bytes(
+            self._bits[offset:offset + self.BLOCK_SIZE], 'little')
+
+        if block & mask == mask:
+            return False
+
+        self._bits[offset:offset + self.BLOCK_SIZE] = \
+            (block | mask).to_bytes(self.BLOCK_SIZE, 'little')
+        self._count += 1
+
+        return True
@@ -3,7 +3,7 @@
 import copy
 import unittest
 
-from wpull.collections import LinkedList, OrderedDefaultDict
+from wpull.collections import LinkedList, OrderedDefaultDict, BloomFilter
 
 
 class TestCollections(unittest.TestCase):
@@ -165,3 +165,45 @@ class TestCollections(unittest.TestCase):
             self.assertEqual(('a', 'b'), tuple(linked_list))
 
             linked_list.clear()
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+
+        self.assertEqual(1000, bloom_filter.capacity)
+        self.assertNotIn('http://example.com/', bloom_filter)
+        self.assertTrue(bloom_filter.add('http://example.com/'))
+        self.assertFalse(bloom_filter.add('http://example.com/'))
+        self.assertIn('http://example.com/', bloom_filter)
+        self.assertEqual(1, len(bloom_filter))
+
+        for num in range(1100):
+            bloom_filter.add('http://example.com/{}'.format(num))
+
+        for num in range(1100):
+            self.assertIn('http://example.com/{}'.format(num), bloom_filter)
+
+        false_positives = sum(
+            'http://example.net/{}'.format(num) in bloom_filter
+            for num in range(10000)
+        )
+
+        self.assertLess(false_positives, 300)
+        self.assertTrue(bloom_filter.is_full())
+
+    def test_bloom_filter_max_size(self):
+        bloom_filter = BloomFilter(1000000, 0.01, max_size=1024)
+
+        self.assertEqual(1024, bloom_filter.size)
+        self.assertLess(bloom_filter.capacity, 1000)
+        self.assertGreater(bloom_filter.capacity, 800)
+
+    def test_bloom_filter_get_capacity(self):
+        capacity = BloomFilter.get_capacity(1024, 0.01)
+        bloom_filter = BloomFilter(capacity, 0.01, max_size=1024)
+
+        self.assertEqual(capacity, bloom_filter.capacity)
+        self.assertLessEqual(bloom_filter.size, 1024)
+        self.assertAlmostEqual(
+            capacity * 2, BloomFilter.get_capacity(2048, 0.01), delta=1)
+        self.assertLess(
+            BloomFilter.get_capacity(1024, 0.0001), capacity)
@@ -0,0 +1,276 @@
+# encoding=utf-8
+'''Adaptive concurrency.'''
+import collections
+import gettext
+import logging
+import time
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.errors import ServerError, NetworkError, AuthenticationError, \
+    DNSNotFound
+import wpull.observer
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+
+def is_congestion_error(error_class):
+    '''Return whether the error suggests the server or network is overloaded.
+    '''
+    return issubclass(error_class, (ServerError, NetworkError)) and \
+        not issubclass(error_class, (AuthenticationError, DNSNotFound))
+
+
+class ResultWindow(object):
+    '''Results of items finished since the last decision.'''
+    def __init__(self):
+        self.start_time = time.time()
+        self.count = 0
+        self.failures = 0
+        self.errors = 0
+        self.duration_sum = 0.0
+
+    @property
+    def latency(self):
+        '''Return the mean duration of the items.'''
+        return self.duration_sum / self.count if self.count else 0.0
+
+    @property
+    def failure_rate(self):
+        '''Return the fraction of items with errors.'''
+        if not self.count:
+            return 0.0
+
+        return min(1.0, max(self.failures, self.errors) / self.count)
+
+    def add(self, duration, failed):
+        self.count += 1
+        self.duration_sum += duration
+
+        if failed:
+            self.failures += 1
+
+
+class ConcurrencyController(object):
+    '''Adjust the number of concurrent items using additive increase and
+    multiplicative decrease (AIMD).
+
+    Args:
+        concurrent (int): The starting number of concurrent items.
+        min_concurrent (int): The lower bound.
+        max_concurrent (int): The upper bound.
+        host_concurrent (int): The upper bound of concurrent items per
+            host. If ``0``, hosts are not limited.
+        interval (float): The minimum time in seconds between decisions
+            about the global concurrency.
+        min_samples (int): The number of finished items needed for a
+            decision.
+        error_threshold (float): The fraction of items with errors above
+            which the concurrency is decreased.
+        latency_tolerance (float): The factor of the lowest recent latency
+            above which the concurrency is decreased.
+        decrease_factor (float): The factor applied on a decrease.
+        bandwidth_meter (:class:`.bandwidth.BandwidthMeter`): If provided,
+            the concurrency is not increased further while the speed drops
+            after an increase.
+        max_hosts (int): The number of hosts to keep results and limits
+            for. The least recently finished hosts use the default limit
+            again.
+
+    Every `interval` seconds, the concurrency is decreased if too many
+    items failed or the items took much longer than before. Otherwise, it
+    is increased by one. Each host is decided on the same way after
+    every `min_samples` items of the host.
+
+    Attributes:
+        change_observer (:class:`.observer.Observer`): Called with a
+            hostname, or None for the global value, and the new
+            concurrency.
+    '''
+    def __init__(self, concurrent, min_concurrent=1, max_concurrent=16,
+                 host_concurrent=0, interval=10.0, min_samples=10,
+                 error_threshold=0.1, latency_tolerance=2.0,
+                 decrease_factor=0.5, bandwidth_meter=None, max_hosts=10000):
+        assert 0 < min_concurrent <= max_concurrent, \
+            'Expect valid bounds. Got {}, {}.'.format(
+                min_concurrent, max_concurrent)
+        assert 0 < decrease_factor < 1, \
+            'Expect factor between 0 and 1. Got {}.'.format(decrease_factor)
+
+        self._concurrent = max(min_concurrent, min(max_concurrent, concurrent))
+        self._min_concurrent = min_concurrent
+        self._max_concurrent = max_concurrent
+        self._host_concurrent = host_concurrent
+        self._interval = interval
+        self._min_samples = min_samples
+        self._error_threshold = error_threshold
+        self._latency_tolerance = latency_tolerance
+        self._decrease_factor = decrease_factor
+        self._bandwidth_meter = bandwidth_meter
+        self._max_hosts = max_hosts
+
+        self._window = ResultWindow()
+        self._base_latency = None
+        self._last_speed = None
+        self._last_increased = False
+        self._host_windows = collections.OrderedDict()
+        self._host_base_latencies = {}
+        self._host_limits = {}
+
+        self.change_observer = wpull.observer.Observer()
+
+    @property
+    def concurrent(self):
+        '''Return the current global concurrency.'''
+        return self._concurrent
+
+    def host_concurrent(self, hostname):
+        '''Return the current concurrency of the host.'''
+        return self._host_limits.get(hostname, self._host_concurrent)
+
+    def add_error(self, error_class):
+        '''Count an error from :attr:`.stats.Statistics.error_observer`.'''
+        if is_congestion_error(error_class):
+            self._window.errors += 1
+
+    def add_result(self, hostname, duration, failed=False):
+        '''Record a finished item and adjust the concurrency if needed.
+
+        Args:
+            hostname (str): The hostname of the item.
+            duration (float): The time in seconds to process the item.
+            failed (bool): Whether the item has an error.
+        '''
+        self._window.add(duration, failed)
+
+        if self._host_concurrent and hostname:
+            self._add_host_result(hostname, duration, failed)
+
+        if self._window.count >= self._min_samples and \
+                time.time() - self._window.start_time >= self._interval:
+            self._adjust()
+
+    def _add_host_result(self, hostname, duration, failed):
+        window = self._host_windows.pop(hostname, None) or ResultWindow()
+        window.add(duration, failed)
+
+        if window.count >= self._min_samples:
+            self._adjust_host(hostname, window)
+            window = ResultWindow()
+
+        self._host_windows[hostname] = window
+
+        while len(self._host_windows) > self._max_hosts:
+            old_hostname = self._host_windows.popitem(last=False)[0]
+            self._host_base_latencies.pop(old_hostname, None)
+
+            if self._host_limits.pop(old_hostname, None) is not None:
+                self.change_observer.notify(
+                    old_hostname, self._host_concurrent)
+
+    def _get_decrease_reason(self, window, base_latency):
+        '''Return why the concurrency should decrease or None.'''
+        if window.failure_rate > self._error_threshold:
+            return __(_('error rate {rate:.0%}'), rate=window.failure_rate)
+
+        if window.latency > base_latency * self._latency_tolerance:
+            return __(
+                _('latency {latency:.2f}s over {base_latency:.2f}s'),
+                latency=window.latency, base_latency=base_latency
+            )
+
+    def _update_base_latency(self, base_latency, latency):
+        '''Return the lowest recent latency.
+
+        The previous value rises slowly so a lasting change of the server
+        is accepted eventually.
+        '''
+        if base_latency is None:
+            return latency
+        else:
+            return min(latency, base_latency * 1.05)
+
+    def _adjust(self):
+        '''Decide on the global concurrency.'''
+        window = self._window
+        self._window = ResultWindow()
+        base_latency = self._base_latency or window.latency
+        reason = self._get_decrease_reason(window, base_latency)
+        self._base_latency = self._update_base_latency(
+            self._base_latency, window.latency)
+
+        speed = self._bandwidth_meter.speed() \
+            if self._bandwidth_meter else None
+        old_speed = self._last_speed
+        self._last_speed = speed
+        old_value = self._concurrent
+
+        if reason:
+            new_value = max(self._min_concurrent,
+                            int(old_value * self._decrease_factor))
+        elif self._last_increased and speed is not None and old_speed \
+                and speed < old_speed * 0.9:
+            _logger.debug(__(
+                'Speed dropped from {0:.0f} to {1:.0f} B/s. Not increasing.',
+                old_speed, speed
+            ))
+            new_value = old_value
+        else:
+            new_value = min(self._max_concurrent, old_value + 1)
+
+        self._last_increased = new_value > old_value
+
+        if new_value == old_value:
+            return
+
+        if reason:
+            _logger.info(__(
+                _('Decreasing concurrency from {old} to {new} ({reason}).'),
+                old=old_value, new=new_value, reason=reason
+            ))
+        else:
+            _logger.info(__(
+                _('Increasing concurrency from {old} to {new}.'),
+                old=old_value, new=new_value
+            ))
+
+        self._concurrent = new_value
+        self.change_observer.notify(None, new_value)
+
+    def _adjust_host(self, hostname, window):
+        '''Decide on the concurrency of the host.'''
+        base_latency = self._host_base_latencies.get(hostname) or \
+            window.latency
+        reason = self._get_decrease_reason(window, base_latency)
+        self._host_base_latencies[hostname] = self._update_base_latency(
+            self._host_base_latencies.get(hostname), window.latency)
+
+        old_value = self.host_concurrent(hostname)
+
+        if reason:
+            new_value = max(1, int(old_value * self._decrease_factor))
+        else:
+            new_value = min(self._host_concurrent, old_value + 1)
+
+        if new_value == old_value:
+            return
+
+        if new_value == self._host_concurrent:
+            del self._host_limits[hostname]
+        else:
+            self._host_limits[hostname] = new_value
+
+        if reason:
+            _logger.info(__(
+                _('Decreasing concurrency of {host} from {old} to {new} '
+                  '({reason}).'),
+                host=hostname, old=old_value, new=new_value, reason=reason
+            ))
+        else:
+            _logger.debug(__(
+                'Increasing concurrency of {0} from {1} to {2}.',
+                hostname, old_value, new_value
+            ))
+
+        self.change_observer.notify(hostname, new_value)
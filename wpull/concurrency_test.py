@@ -0,0 +1,143 @@
+# encoding=utf-8
+import unittest
+
+from wpull.concurrency import ConcurrencyController, is_congestion_error
+from wpull.errors import ServerError, NetworkTimedOut, DNSNotFound, \
+    AuthenticationError, ProtocolError, ConnectionRefused
+
+
+class MockBandwidthMeter(object):
+    def __init__(self):
+        self.value = 0
+
+    def speed(self):
+        return self.value
+
+
+class TestConcurrency(unittest.TestCase):
+    def new_controller(self, **kwargs):
+        kwargs.setdefault('interval', 0)
+        kwargs.setdefault('min_samples', 4)
+        controller = ConcurrencyController(**kwargs)
+        changes = []
+
+        def add_change(hostname, value):
+            changes.append((hostname, value))
+
+        controller.change_observer.add(add_change)
+
+        return controller, changes
+
+    def add_results(self, controller, count, duration=0.1, failed=False,
+                    hostname='example.com'):
+        for dummy in range(count):
+            controller.add_result(hostname, duration, failed=failed)
+
+    def test_congestion_error(self):
+        self.assertTrue(is_congestion_error(ServerError))
+        self.assertTrue(is_congestion_error(NetworkTimedOut))
+        self.assertTrue(is_congestion_error(ConnectionRefused))
+        self.assertFalse(is_congestion_error(DNSNotFound))
+        self.assertFalse(is_congestion_error(AuthenticationError))
+        self.assertFalse(is_congestion_error(ProtocolError))
+
+    def test_increase_decrease(self):
+        controller, changes = self.new_controller(
+            concurrent=4, max_concurrent=6)
+
+        self.add_results(controller, 4)
+        self.assertEqual(5, controller.concurrent)
+
+        self.add_results(controller, 4)
+        self.add_results(controller, 4)
+        self.assertEqual(6, controller.concurrent)
+
+        self.add_results(controller, 4, failed=True)
+        self.assertEqual(3, controller.concurrent)
+
+        self.assertEqual([(None, 5), (None, 6), (None, 3)], changes)
+
+    def test_min_samples(self):
+        controller, changes = self.new_controller(concurrent=2)
+
+        self.add_results(controller, 3)
+
+        self.assertEqual(2, controller.concurrent)
+        self.assertFalse(changes)
+
+    def test_errors(self):
+        controller, changes = self.new_controller(concurrent=4)
+
+        controller.add_error(DNSNotFound)
+        controller.add_error(ServerError)
+        controller.add_error(NetworkTimedOut)
+        self.add_results(controller, 4)
+
+        self.assertEqual(2, controller.concurrent)
+
+    def test_latency(self):
+        controller, changes = self.new_controller(
+            concurrent=4, min_concurrent=3)
+
+        self.add_results(controller, 4, duration=0.1)
+        self.assertEqual(5, controller.concurrent)
+
+        self.add_results(controller, 4, duration=0.5)
+        self.assertEqual(3, controller.concurrent)
+
+    def test_speed_hold(self):
+        bandwidth_meter = MockBandwidthMeter()
+        controller, changes = self.new_controller(
+            concurrent=4, bandwidth_meter=bandwidth_meter)
+
+        bandwidth_meter.value = 1000
+        self.add_results(controller, 4)
+        self.assertEqual(5, controller.concurrent)
+
+        bandwidth_meter.value = 500
+        self.add_results(controller, 4)
+        self.assertEqual(5, controller.concurrent)
+
+        bandwidth_meter.value = 400
+        self.add_results(controller, 4)
+        self.assertEqual(6, controller.concurrent)
+
+    def test_host(self):
+        controller, changes = self.new_controller(
+            concurrent=4, host_concurrent=4, interval=1000)
+
+        self.assertEqual(4, controller.host_concurrent('a.example'))
+
+        self.add_results(controller, 4, failed=True, hostname='a.example')
+        self.add_results(controller, 2, hostname='b.example')
+
+        self.assertEqual(2, controller.host_concurrent('a.example'))
+        self.assertEqual(4, controller.host_concurrent('b.example'))
+
+        self.add_results(controller, 4, hostname='a.example')
+        self.add_results(controller, 4, hostname='a.example')
+
+        self.assertEqual(4, controller.host_concurrent('a.example'))
+        self.assertEqual(4, controller.concurrent)
+        self.assertEqual(
+            [('a.example', 2), ('a.example', 3), ('a.example', 4)],
+            changes
+        )
+
+    def test_host_eviction(self):
+        controller, changes = self.new_controller(
+            concurrent=4, host_concurrent=4, interval=1000, max_hosts=2)
+
+        self.add_results(controller, 4, failed=True, hostname='a.example')
+        self.add_results(controller, 1, hostname='b.example')
+
+        self.assertEqual(2, controller.host_concurrent('a.example'))
+
+        self.add_results(controller, 1, hostname='c.example')
+
+        self.assertEqual(4, controller.host_concurrent('a.example'))
+        self.assertEqual(['b.example', 'c.example'],
+                         list(controller._host_windows))
+        self.assertNotIn('a.example', controller._host_base_latencies)
+        self.assertFalse(controller._host_limits)
+        self.assertEqual([('a.example', 2), ('a.example', 4)], changes)
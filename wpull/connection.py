@@ -1,5 +1,6 @@
 # encoding=utf8
 '''Network connections.'''
+import collections
 import contextlib
 import errno
 import functools
@@ -7,6 +8,7 @@ import logging
 import os
 import socket
 import ssl
+import time
 
 from tornado.netutil import SSLCertificateError
 from trollius import From, Return
@@ -14,7 +16,7 @@ import tornado.netutil
 import trollius
 
 from wpull.backport.logging import BraceMessage as __
-from wpull.cache import FIFOCache
+from wpull.cache import FIFOCache, LRUCache
 from wpull.dns import Resolver
 from wpull.errors import NetworkError, ConnectionRefused, SSLVerificationError, \
     NetworkTimedOut
@@ -125,11 +127,15 @@ class HostPool(object):
 
         Coroutine.
         '''
-        with (yield From(self._lock)):
+        yield From(self._lock.acquire())
+
+        try:
             for connection in tuple(self.ready):
                 if force or connection.closed():
                     connection.close()
                     self.ready.remove(connection)
+        finally:
+            self._lock.release()
 
     def close(self):
         '''Forcibly close all connections.
@@ -205,27 +211,50 @@ class ConnectionPool(object):
             ``hostname`` arguments and returns a :class:`Connection` instance.
         ssl_connection_factory: A function that returns a
             :class:`SSLConnection` instance. See `connection_factory`.
-        max_count (int): Limit on number of connections
+        max_count (int): Limit on number of connections. When exceeded, the
+            least recently used idle connections are closed.
+        idle_timeout (float): If given, idle connections are closed after
+            this many seconds.
+
+    Attributes:
+        checkout_count (int): Number of connections checked out.
+        reuse_count (int): Number of connections checked out that were
+            already connected.
+        evict_count (int): Number of idle connections closed because of
+            `max_count` or `idle_timeout`.
     '''
     def __init__(self, max_host_count=6, resolver=None,
                  connection_factory=None, ssl_connection_factory=None,
-                 max_count=100):
+                 max_count=100, idle_timeout=None):
         self._max_host_count = max_host_count
         self._resolver = resolver or Resolver()
         self._connection_factory = connection_factory or Connection
         self._ssl_connection_factory = ssl_connection_factory or SSLConnection
         self._max_count = max_count
+        self._idle_timeout = idle_timeout
         self._host_pools = {}
         self._host_pool_waiters = {}
         self._host_pools_lock = trollius.Lock()
+        self._idle_connections = collections.OrderedDict()
         self._release_tasks = set()
         self._closed = False
         self._happy_eyeballs_table = HappyEyeballsTable()
+        self.checkout_count = 0
+        self.reuse_count = 0
+        self.evict_count = 0
 
     @property
     def host_pools(self):
         return self._host_pools
 
+    @property
+    def reuse_rate(self):
+        '''Return the fraction of check outs that reused a connection.'''
+        if self.checkout_count:
+            return self.reuse_count / self.checkout_count
+        else:
+            return 0.0
+
     @trollius.coroutine
     def acquire(self, host, port, use_ssl=False, host_key=None):
         '''Return an available connection.
@@ -243,6 +272,7 @@ class ConnectionPool(object):
         assert not self._closed
 
         yield From(self._process_no_wait_releases())
+        self._evict_idle()
 
         if use_ssl:
             connection_factory = functools.partial(
@@ -259,7 +289,11 @@ class ConnectionPool(object):
 
         key = host_key or (host, port, use_ssl)
 
-        with (yield From(self._host_pools_lock)):
+        # Explicit acquire and release instead of ``with (yield From(lock))``
+        # avoids scheduling an extra task for every check out.
+        yield From(self._host_pools_lock.acquire())
+
+        try:
             if key not in self._host_pools:
                 host_pool = self._host_pools[key] = HostPool(
                     connection_factory,
@@ -269,19 +303,28 @@ class ConnectionPool(object):
             else:
                 host_pool = self._host_pools[key]
                 self._host_pool_waiters[key] += 1
+        finally:
+            self._host_pools_lock.release()
 
         _logger.debug('Check out %s', key)
 
         connection = yield From(host_pool.acquire())
         connection.key = key
 
+        self._idle_connections.pop(connection, None)
+        self.checkout_count += 1
+
+        if not connection.closed():
+            self.reuse_count += 1
+
         # TODO: Verify this assert is always true
         # assert host_pool.count() <= host_pool.max_connections
         # assert key in self._host_pools
         # assert self._host_pools[key] == host_pool
 
-        with (yield From(self._host_pools_lock)):
-            self._host_pool_waiters[key] -= 1
+        yield From(self._host_pools_lock.acquire())
+        self._host_pool_waiters[key] -= 1
+        self._host_pools_lock.release()
 
         raise Return(connection)
 
@@ -298,10 +341,93 @@ class ConnectionPool(object):
 
         _logger.debug('Check in %s', key)
 
-        yield From(host_pool.release(connection))
+        reuse = not connection.closed()
+
+        yield From(host_pool.release(connection, reuse=reuse))
+
+        if reuse:
+            self._idle_connections[connection] = (key, time.time())
+        else:
+            self._remove_empty_host_pool(key)
+
+        self._evict_idle()
+
+    @trollius.coroutine
+    def preconnect(self, host, port, use_ssl=False):
+        '''Open an idle connection to the host ahead of time.
+
+        Nothing is done if the pool already has connections to the host.
+        The connection is not counted in :attr:`checkout_count`.
+
+        Returns:
+            bool: Whether a connection was opened.
+
+        Coroutine.
+        '''
+        if (host, port, use_ssl) in self._host_pools:
+            raise Return(False)
+
+        connection = yield From(self.acquire(host, port, use_ssl))
+        self.checkout_count -= 1
+
+        try:
+            yield From(connection.connect())
+        except BaseException:
+            connection.close()
+            self.no_wait_release(connection)
+            raise
+
+        yield From(self.release(connection))
+
+        raise Return(True)
 
-        force = self.count() > self._max_count
-        yield From(self.clean(force=force))
+    def _evict_idle(self):
+        '''Close the least recently used idle connections.
+
+        Connections are closed while there are more than `max_count`
+        connections or while they are idle longer than `idle_timeout`.
+        '''
+        if not self._idle_connections:
+            return
+
+        over_count = self.count() - self._max_count
+
+        if self._idle_timeout is not None:
+            expire_time = time.time() - self._idle_timeout
+        else:
+            expire_time = None
+
+        while self._idle_connections:
+            connection, (key, idle_time) = \
+                next(iter(self._idle_connections.items()))
+
+            if over_count <= 0 and (expire_time is None or
+                                    idle_time > expire_time):
+                break
+
+            del self._idle_connections[connection]
+            host_pool = self._host_pools.get(key)
+
+            if not host_pool or connection not in host_pool.ready:
+                continue
+
+            _logger.debug('Evict idle connection %s', key)
+
+            host_pool.ready.remove(connection)
+            connection.close()
+            self.evict_count += 1
+            over_count -= 1
+
+            self._remove_empty_host_pool(key)
+
+    def _remove_empty_host_pool(self, key):
+        '''Remove the host pool if it has no connections and no waiters.'''
+        host_pool = self._host_pools.get(key)
+
+        if host_pool and not self._host_pool_waiters[key] \
+                and host_pool.empty():
+            del self._host_pools[key]
+            del self._host_pool_waiters[key]
 
     def no_wait_release(self, connection):
         '''Synchronous version of :meth:`release`.'''
@@ -357,13 +483,21 @@ class ConnectionPool(object):
         '''
         assert not self._closed
 
-        with (yield From(self._host_pools_lock)):
+        yield From(self._host_pools_lock.acquire())
+
+        try:
             for key, pool in tuple(self._host_pools.items()):
                 yield From(pool.clean(force=force))
+                self._remove_empty_host_pool(key)
+        finally:
+            self._host_pools_lock.release()
 
-                if not self._host_pool_waiters[key] and pool.empty():
-                    del self._host_pools[key]
-                    del self._host_pool_waiters[key]
+        for connection, (key, dummy) in \
+                tuple(self._idle_connections.items()):
+            host_pool = self._host_pools.get(key)
+
+            if not host_pool or connection not in host_pool.ready:
+                del self._idle_connections[connection]
 
     def close(self):
         '''Close all the connections and clean up.
@@ -376,6 +510,7 @@ class ConnectionPool(object):
             del self._host_pools[key]
             del self._host_pool_waiters[key]
 
+        self._idle_connections.clear()
         self._closed = True
 
     def count(self):
@@ -438,6 +573,7 @@ class BaseConnection(object):
         self.writer = None
         self._close_timer = None
         self._state = ConnectionState.ready
+        self._bandwidth_limiter = None
 
     @property
     def address(self):
@@ -539,22 +675,35 @@ class BaseConnection(object):
             fut = self.writer.drain()
 
             if fut:
-                yield From(self.run_network_operation(
-                    fut, close_timeout=self._timeout, name='Write')
-                )
+                with self._network_errors('Write'), \
+                        self._close_timeout('Write'):
+                    yield From(fut)
 
     @trollius.coroutine
     def read(self, amount=-1):
-        '''Read data.'''
+        '''Read data.
+
+        If a bandwidth limiter is set, this function sleeps as needed after
+        reading.
+        '''
         assert self._state == ConnectionState.created, \
             'Expect conn created. Got {}.'.format(self._state)
 
-        data = yield From(
-            self.run_network_operation(
-                self.reader.read(amount),
-                close_timeout=self._timeout,
-                name='Read')
-        )
+        limiter = self._bandwidth_limiter
+        max_read_size = limiter and limiter.max_read_size
+
+        if max_read_size and amount > max_read_size:
+            amount = max_read_size
+
+        with self._network_errors('Read'), self._close_timeout('Read'):
+            data = yield From(self.reader.read(amount))
+
+        if limiter:
+            sleep_time = limiter.consume(len(data), self._hostname)
+
+            if sleep_time:
+                _logger.debug('Sleep %s', sleep_time)
+                yield From(trollius.sleep(sleep_time))
 
         raise Return(data)
 
@@ -564,13 +713,9 @@ class BaseConnection(object):
         assert self._state == ConnectionState.created, \
             'Expect conn created. Got {}.'.format(self._state)
 
-        with self._close_timer.with_timeout():
-            data = yield From(
-                self.run_network_operation(
-                    self.reader.readline(),
-                    close_timeout=self._timeout,
-                    name='Readline')
-            )
+        with self._network_errors('Readline'), \
+                self._close_timeout('Readline'):
+            data = yield From(self.reader.readline())
 
         raise Return(data)
 
@@ -586,22 +731,37 @@ class BaseConnection(object):
             raise Exception(
                 'Cannot use wait_timeout and close_timeout at the same time')
 
-        try:
+        with self._network_errors(name):
             if close_timeout is not None:
-                with self._close_timer.with_timeout():
+                with self._close_timeout(name):
                     data = yield From(task)
-
-                if self._close_timer.is_timeout():
-                    raise NetworkTimedOut(
-                        '{name} timed out.'.format(name=name))
-                else:
-                    raise Return(data)
             elif wait_timeout is not None:
                 data = yield From(trollius.wait_for(task, wait_timeout))
-                raise Return(data)
             else:
-                raise Return((yield From(task)))
+                data = yield From(task)
+
+        raise Return(data)
+
+    @contextlib.contextmanager
+    def _close_timeout(self, name):
+        '''Apply the close timer to the operation in the context.
+
+        The read and write functions use this and :meth:`_network_errors`
+        directly instead of :meth:`run_network_operation` because each
+        nested coroutine is scheduled as a separate task.
+        '''
+        with self._close_timer.with_timeout():
+            yield
 
+        if self._close_timer.is_timeout():
+            raise NetworkTimedOut('{name} timed out.'.format(name=name))
+
+    @contextlib.contextmanager
+    def _network_errors(self, name):
+        '''Close the connection and raise a :class:`.errors.NetworkError`
+        if the operation in the context fails.'''
+        try:
+            yield
         except trollius.TimeoutError as error:
             self.close()
             raise NetworkTimedOut(
@@ -644,8 +804,9 @@ class Connection(BaseConnection):
     '''Network stream.
 
     Args:
-        bandwidth_limiter (class:`.bandwidth.BandwidthLimiter`): Bandwidth
-            limiter for connection speed limiting.
+        bandwidth_limiter (class:`.bandwidth.TokenBucketLimiter`): Bandwidth
+            limiter for connection speed limiting. The limiter may be shared
+            between connections.
 
     Attributes:
         key: Value used by the ConnectionPool for its host pool map. Internal
@@ -690,20 +851,6 @@ class Connection(BaseConnection):
     def proxied(self, value):
         self._proxied = value
 
-    @trollius.coroutine
-    def read(self, amount=-1):
-        data = yield From(super().read(amount))
-
-        if self._bandwidth_limiter:
-            self._bandwidth_limiter.feed(len(data))
-
-            sleep_time = self._bandwidth_limiter.sleep_time()
-            if sleep_time:
-                _logger.debug('Sleep %s', sleep_time)
-                yield From(trollius.sleep(sleep_time))
-
-        raise Return(data)
-
     @trollius.coroutine
     def start_tls(self, ssl_context=True):
         '''Start client TLS on this connection and return SSLConnection.
@@ -729,10 +876,16 @@ class SSLConnection(Connection):
 
     Args:
         ssl_context: SSLContext
+        ssl_session_cache (:class:`SSLSessionCache`): If provided, the
+            session of the previous connection to the host is resumed.
     '''
-    def __init__(self, *args, ssl_context=True, **kwargs):
+    def __init__(self, *args, ssl_context=True, ssl_session_cache=None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
         self._ssl_context = ssl_context
+        self._ssl_session_cache = ssl_session_cache
+        self._session_ssl_context = None
+        self._verified_ssl_object = None
 
         if self._ssl_context is True:
             self._ssl_context = tornado.netutil.ssl_options_to_context({})
@@ -747,7 +900,15 @@ class SSLConnection(Connection):
         kwargs = super()._connection_kwargs()
 
         if self._ssl_context:
-            kwargs['ssl'] = self._ssl_context
+            if self._ssl_session_cache and SSLSessionCache.supported:
+                self._session_ssl_context = SessionSSLContext(
+                    self._ssl_context,
+                    self._ssl_session_cache.get(self._session_key())
+                )
+                kwargs['ssl'] = self._session_ssl_context
+            else:
+                kwargs['ssl'] = self._ssl_context
+
             kwargs['server_hostname'] = self._hostname
 
             return kwargs
@@ -757,8 +918,29 @@ class SSLConnection(Connection):
         result = yield From(super().connect())
         sock = self.writer.transport.get_extra_info('socket')
         self._verify_cert(sock)
+
+        if self._session_ssl_context:
+            ssl_object = self._session_ssl_context.ssl_object
+            self._verified_ssl_object = ssl_object
+
+            self._ssl_session_cache.count_handshake(ssl_object.session_reused)
+            self._ssl_session_cache.put(self._session_key(),
+                                        ssl_object.session)
+
         raise Return(result)
 
+    def close(self):
+        if self._verified_ssl_object:
+            # TLS 1.3 servers send session tickets after the handshake
+            self._ssl_session_cache.put(self._session_key(),
+                                        self._verified_ssl_object.session)
+            self._verified_ssl_object = None
+
+        super().close()
+
+    def _session_key(self):
+        return self._hostname, self._address[1]
+
     def _verify_cert(self, sock):
         # Based on tornado.iostream.SSLIOStream
         # Needed for older Python versions
@@ -906,6 +1088,85 @@ class HappyEyeballsConnection(object):
         return primary_address, secondary_address
 
 
+class SSLSessionCache(object):
+    '''Cache of SSL sessions for resuming handshakes.
+
+    Sessions are keyed by hostname and port.
+
+    Args:
+        max_items (int): The maximum number of sessions to keep.
+        time_to_live (float): Discard sessions after `time_to_live` seconds.
+
+    Attributes:
+        resumed_count (int): Number of handshakes that resumed a session.
+        full_count (int): Number of full handshakes.
+    '''
+    supported = hasattr(ssl, 'SSLSession')
+    '''Whether the Python version supports resuming sessions.'''
+
+    def __init__(self, max_items=1000, time_to_live=3600):
+        self._cache = LRUCache(max_items=max_items, time_to_live=time_to_live)
+        self.resumed_count = 0
+        self.full_count = 0
+
+    def get(self, key):
+        '''Return the session or None.'''
+        return self._cache.get(key)
+
+    def put(self, key, session):
+        '''Store the session.'''
+        if session:
+            self._cache[key] = session
+
+    def count_handshake(self, resumed):
+        '''Count a completed handshake.'''
+        if resumed:
+            self.resumed_count += 1
+        else:
+            self.full_count += 1
+
+
+class SessionSSLContext(object):
+    '''SSL context wrapper that resumes a session.
+
+    The event loop creates the SSL object when it starts the handshake. This
+    wrapper passes the session to the SSL context and keeps the SSL object.
+
+    Args:
+        ssl_context: The SSLContext to wrap.
+        session: An :class:`ssl.SSLSession` or None.
+
+    Attributes:
+        ssl_object: The SSL object or SSL socket after the handshake starts.
+    '''
+    def __init__(self, ssl_context, session):
+        self._ssl_context = ssl_context
+        self._session = session
+        self.ssl_object = None
+
+    def __getattr__(self, name):
+        return getattr(self._ssl_context, name)
+
+    def wrap_bio(self, *args, **kwargs):
+        self.ssl_object = self._wrap(self._ssl_context.wrap_bio, args, kwargs)
+        return self.ssl_object
+
+    def wrap_socket(self, *args, **kwargs):
+        self.ssl_object = self._wrap(
+            self._ssl_context.wrap_socket, args, kwargs)
+        return self.ssl_object
+
+    def _wrap(self, func, args, kwargs):
+        if self._session:
+            try:
+                return func(*args, session=self._session, **kwargs)
+            except ValueError as error:
+                # The session is from a different SSLContext
+                _logger.debug(__('Session not resumed: {0}', error))
+
+        return func(*args, **kwargs)
+
+
 class HappyEyeballsTable(object):
     def __init__(self, max_items=100, time_to_live=600):
         '''Happy eyeballs connection cache table.'''
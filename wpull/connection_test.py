@@ -4,12 +4,15 @@ import socket
 import ssl
 import sys
 import functools
+import time
+import unittest
 
-from trollius import From
+from trollius import From, Return
 import trollius
 
+from wpull.bandwidth import TokenBucketLimiter
 from wpull.connection import Connection, ConnectionPool, HostPool, \
-    HappyEyeballsTable
+    HappyEyeballsTable, SSLConnection, SSLSessionCache
 from wpull.dns import Resolver
 from wpull.errors import NetworkError, NetworkTimedOut, SSLVerificationError
 import wpull.testing.async
@@ -145,6 +148,62 @@ class TestConnection(BadAppTestCase):
 
                 bytes_left -= len(data)
 
+    @trollius.coroutine
+    def _read_big(self, limiter, hostname, byte_count):
+        connection = Connection(
+            ('127.0.0.1', self.get_http_port()), hostname,
+            bandwidth_limiter=limiter)
+        yield From(connection.connect())
+        yield From(connection.write(b'GET /big HTTP/1.1\r\n\r\n'))
+
+        bytes_read = 0
+
+        while bytes_read < byte_count:
+            data = yield From(connection.read(4096 * 128))
+
+            if not data:
+                break
+
+            bytes_read += len(data)
+
+        connection.close()
+
+        raise Return(time.time())
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_bandwidth_limit(self):
+        limiter = TokenBucketLimiter(rate_limit=500000, burst=20000)
+        start_time = time.time()
+
+        end_times = yield From(trollius.gather(
+            self._read_big(limiter, 'localhost', 500000),
+            self._read_big(limiter, 'localhost', 500000),
+        ))
+
+        rate = 1000000 / (max(end_times) - start_time)
+
+        self.assertAlmostEqual(500000, rate, delta=100000)
+        # Both connections get half of the rate so they finish together
+        self.assertLess(
+            (max(end_times) - min(end_times)) / (max(end_times) - start_time),
+            0.2
+        )
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_bandwidth_limit_host(self):
+        limiter = TokenBucketLimiter(
+            rate_limit=10000000, host_rate_limit=250000, burst=20000)
+        start_time = time.time()
+
+        yield From(trollius.wait([
+            self._read_big(limiter, 'localhost', 500000),
+            self._read_big(limiter, '127.0.0.1', 500000),
+        ]))
+
+        rate = 500000 / (time.time() - start_time)
+
+        self.assertAlmostEqual(250000, rate, delta=50000)
+
     @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
     def test_sock_reuse(self):
         connection1 = Connection(('127.0.0.1', self.get_http_port()))
@@ -246,6 +305,29 @@ class TestConnectionSSL(SSLBadAppTestCase):
         data = yield From(ssl_connection.readline())
         self.assertEqual(b'HTTP', data[:4])
 
+    @unittest.skipUnless(SSLSessionCache.supported, 'Requires SSLSession')
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_ssl_session_cache(self):
+        session_cache = SSLSessionCache()
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+
+        for dummy in range(3):
+            connection = SSLConnection(
+                ('127.0.0.1', self.get_http_port()), 'localhost',
+                ssl_context=ssl_context, ssl_session_cache=session_cache)
+
+            yield From(connection.connect())
+            yield From(connection.write(b'GET / HTTP/1.1\r\n\r\n'))
+
+            data = yield From(connection.readline())
+            self.assertEqual(b'HTTP', data[:4])
+
+            connection.close()
+
+        self.assertEqual(1, session_cache.full_count)
+        self.assertEqual(2, session_cache.resumed_count)
+        self.assertTrue(session_cache.get(('localhost', self.get_http_port())))
+
 
 class TestConnectionPool(BadAppTestCase):
     @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
@@ -375,3 +457,48 @@ class TestConnectionPool(BadAppTestCase):
 
         # This line should not KeyError crash:
         yield From(pool.release(connection_2))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_idle_eviction(self):
+        pool = ConnectionPool(max_count=2)
+        connections = []
+
+        for host_key in ('a', 'b', 'c'):
+            connection = yield From(pool.acquire(
+                'localhost', self.get_http_port(), host_key=host_key))
+            yield From(connection.connect())
+            yield From(pool.release(connection))
+            connections.append(connection)
+
+        self.assertTrue(connections[0].closed())
+        self.assertFalse(connections[1].closed())
+        self.assertFalse(connections[2].closed())
+        self.assertEqual(['b', 'c'], sorted(pool.host_pools.keys()))
+        self.assertEqual(1, pool.evict_count)
+
+        connection = yield From(pool.acquire(
+            'localhost', self.get_http_port(), host_key='b'))
+
+        self.assertIs(connections[1], connection)
+        self.assertEqual(4, pool.checkout_count)
+        self.assertEqual(1, pool.reuse_count)
+        self.assertAlmostEqual(0.25, pool.reuse_rate)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_idle_timeout(self):
+        pool = ConnectionPool(idle_timeout=0.1)
+
+        connection = yield From(pool.acquire(
+            'localhost', self.get_http_port()))
+        yield From(connection.connect())
+        yield From(pool.release(connection))
+
+        yield From(trollius.sleep(0.2))
+
+        connection_2 = yield From(pool.acquire(
+            'localhost', self.get_http_port()))
+
+        self.assertTrue(connection.closed())
+        self.assertIsNot(connection, connection_2)
+        self.assertEqual(1, pool.evict_count)
+        self.assertEqual(0, pool.reuse_count)
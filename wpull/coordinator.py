@@ -0,0 +1,156 @@
+# encoding=utf-8
+'''Stand-alone URL table server for crawling with several machines.
+
+Start the coordinator and then run Wpull on each machine with
+``--coordinator HOST:PORT`` and the same ``--coordinator-key``::
+
+    python3 -m wpull.coordinator --database crawl.db --port 6150 --key SECRET
+'''
+import argparse
+import binascii
+import gettext
+import logging
+import os
+import signal
+import sys
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.database.base import CrawlOrder, CRAWL_ORDERS
+from wpull.database.remote import URLTableServer
+from wpull.database.sqlite3_ import SQLite3URLTable, \
+    FingerprintSQLite3URLTable
+from wpull.database.sqltable import SQLiteURLTable
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+URL_TABLE_CLASSES = {
+    'sqlalchemy': SQLiteURLTable,
+    'sqlite3': SQLite3URLTable,
+    'sqlite3-fingerprint': FingerprintSQLite3URLTable,
+}
+'''Mapping of ``--database-backend`` names to URL table classes.'''
+
+
+def new_argument_parser():
+    '''Return the argument parser of the coordinator.'''
+    parser = argparse.ArgumentParser(
+        prog='python3 -m wpull.coordinator',
+        description=_('Share a URL table with Wpull instances over TCP.'),
+    )
+    parser.add_argument(
+        '--database',
+        metavar='FILE',
+        default=':memory:',
+        help=_('save database tables into FILE instead of memory'),
+    )
+    parser.add_argument(
+        '--database-backend',
+        metavar='NAME',
+        choices=sorted(URL_TABLE_CLASSES),
+        default='sqlite3',
+        help=_('use backend NAME to access the database tables'),
+    )
+    parser.add_argument(
+        '--crawl-order',
+        metavar='ORDER',
+        choices=CRAWL_ORDERS,
+        default=CrawlOrder.default,
+        help=_('check out URLs in ORDER'),
+    )
+    parser.add_argument(
+        '--address',
+        metavar='HOST',
+        default='localhost',
+        help=_('listen on HOST'),
+    )
+    parser.add_argument(
+        '--port',
+        metavar='PORT',
+        type=int,
+        default=0,
+        help=_('listen on PORT instead of a random port'),
+    )
+    parser.add_argument(
+        '--key',
+        metavar='KEY',
+        help=_('require clients to know the secret KEY instead of a '
+               'random key'),
+    )
+    parser.add_argument(
+        '--lease-timeout',
+        metavar='SECONDS',
+        type=float,
+        default=300,
+        help=_('put back URLs of clients silent for SECONDS'),
+    )
+    parser.add_argument(
+        '--batch-size',
+        metavar='N',
+        type=int,
+        default=100,
+        help=_('check out N URLs from the database at a time'),
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help=_('print debugging messages'),
+    )
+
+    return parser
+
+
+def main(argv=None):
+    parser = new_argument_parser()
+    args = parser.parse_args(argv)
+
+    if sys.version_info < (3, 3):
+        parser.error(_('the coordinator requires Python 3.3 or greater'))
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format='%(levelname)s %(message)s'
+    )
+
+    key = args.key or binascii.hexlify(os.urandom(16)).decode('ascii')
+    url_table = URL_TABLE_CLASSES[args.database_backend](
+        args.database, crawl_order=args.crawl_order)
+    server = URLTableServer(
+        url_table, batch_size=args.batch_size,
+        lease_timeout=args.lease_timeout)
+
+    url_table.release()
+
+    address = server.listen((args.address, args.port), key.encode('utf-8'))
+
+    _logger.info(__(
+        _('Coordinator listening at {host}:{port}.'),
+        host=address[0], port=address[1]
+    ))
+
+    if not args.key:
+        _logger.info(__(_('The key is {key}.'), key=key))
+
+    status = {'stop_called': False}
+
+    def stop_callback(signal_number, frame):
+        if status['stop_called']:
+            raise KeyboardInterrupt()
+
+        status['stop_called'] = True
+
+        _logger.info(_('Stopping once all clients finish...'))
+        _logger.info(_('Interrupt again to force stopping immediately.'))
+        server.stop()
+
+    signal.signal(signal.SIGINT, stop_callback)
+
+    try:
+        server.serve()
+    finally:
+        url_table.close()
+
+
+if __name__ == '__main__':
+    main()
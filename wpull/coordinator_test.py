@@ -0,0 +1,25 @@
+# encoding=utf-8
+import unittest
+
+from wpull.coordinator import new_argument_parser, URL_TABLE_CLASSES
+
+
+class TestCoordinator(unittest.TestCase):
+    def test_argument_parser(self):
+        parser = new_argument_parser()
+        args = parser.parse_args([])
+
+        self.assertEqual(':memory:', args.database)
+        self.assertEqual('localhost', args.address)
+        self.assertIn(args.database_backend, URL_TABLE_CLASSES)
+        self.assertFalse(args.key)
+
+        args = parser.parse_args([
+            '--database', 'test.db', '--port', '6150', '--key', 'secret',
+            '--lease-timeout', '10',
+        ])
+
+        self.assertEqual('test.db', args.database)
+        self.assertEqual(6150, args.port)
+        self.assertEqual('secret', args.key)
+        self.assertEqual(10, args.lease_timeout)
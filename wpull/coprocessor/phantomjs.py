@@ -291,15 +291,19 @@ class PhantomJSCoprocessorSession(object):
             self._warc_recorder.set_length_and_maybe_checksums(record)
             self._warc_recorder.write_record(record)
 
+    @trollius.coroutine
     def _scrape_document(self):
-        '''Extract links from the DOM.'''
+        '''Extract links from the DOM.
+
+        Coroutine.
+        '''
         mock_response = self._new_mock_response(
             self._response, self._get_temp_path('phantom', '.html')
         )
 
-        self._processing_rule.scrape_document(
+        yield From(self._processing_rule.scrape_document(
             self._request, mock_response, self._url_item
-        )
+        ))
 
         if mock_response.body:
             mock_response.body.close()
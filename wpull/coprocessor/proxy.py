@@ -18,7 +18,7 @@ class MockURLItem(object):
     def skip(self):
         pass
 
-    def set_status(self, dummy1, dummy2=None, dummy3=None):
+    def set_status(self, dummy1, dummy2=None, dummy3=None, **kwargs):
         pass
 
 
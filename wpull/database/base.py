@@ -1,5 +1,55 @@
 '''Base table class.'''
 import abc
+import collections
+
+from trollius import Return
+import trollius
+
+from wpull.item import Status
+
+
+STATUSES = (
+    Status.todo, Status.in_progress, Status.done, Status.error,
+    Status.skipped,
+)
+'''All the URL statuses.'''
+
+
+class CrawlOrder(object):
+    '''Orders in which URLs are checked out of the table.
+
+    Each order other than :attr:`default` is backed by an index so a
+    check out does not sort the table.
+    '''
+    default = 'default'
+    '''The order of the table, which is usually the order URLs were added.'''
+    breadth_first = 'breadth-first'
+    '''Lowest ``level`` first.'''
+    depth_first = 'depth-first'
+    '''Highest ``level`` first and the newest URLs first.'''
+    inline_first = 'inline-first'
+    '''Page requisites, deepest ``inline`` first, before other URLs.'''
+    priority = 'priority'
+    '''Highest ``priority`` first.'''
+
+
+CRAWL_ORDERS = (
+    CrawlOrder.default, CrawlOrder.breadth_first, CrawlOrder.depth_first,
+    CrawlOrder.inline_first, CrawlOrder.priority,
+)
+'''All the crawl orders.'''
+
+
+def status_counts(items):
+    '''Return a mapping of every status to a count.
+
+    Args:
+        items: An iterable of status and count pairs. Statuses not
+            included are counted as zero.
+    '''
+    counts = dict((status, 0) for status in STATUSES)
+    counts.update(items)
+    return counts
 
 
 class DatabaseError(Exception):
@@ -20,6 +70,21 @@ class BaseURLTable(object, metaclass=abc.ABCMeta):
         This call may be expensive.
         '''
 
+    def count_by_status(self):
+        '''Return the number of URLs for each status.
+
+        Tables that maintain counters return them without scanning the
+        table. The default implementation iterates :meth:`get_all`.
+
+        Returns:
+            dict: A mapping of each status from :class:`.item.Status` to
+            an integer.
+        '''
+        counter = collections.Counter(
+            url_record.status for url_record in self.get_all())
+
+        return status_counts(counter.items())
+
     @abc.abstractmethod
     def get_one(self, url):
         '''Return a URLRecord for the URL.
@@ -52,7 +117,9 @@ class BaseURLTable(object, metaclass=abc.ABCMeta):
         Args:
             urls: An iterable of `dict` column-value mapping. Each
                 map must contain a ``url`` key.
-            kwargs: Additional values to be saved for all the URLs
+            kwargs: Additional values to be saved for all the URLs.
+                The optional ``absent_urls`` is a set of URLs known not to
+                be in the table. Tables may skip looking them up.
 
         Returns:
             list: The URLs added. Useful for tracking duplicates.
@@ -77,6 +144,29 @@ class BaseURLTable(object, metaclass=abc.ABCMeta):
             NotFound
         '''
 
+    def check_out_many(self, filter_status, amount, filter_level=None):
+        '''Find URLs, mark them in progress, and return them.
+
+        Args:
+            filter_status: A status from :class:`.item.Status`.
+            amount (int): The maximum number of URLs to return.
+            filter_level (int): Return items with `level` or lower.
+
+        Returns:
+            list: A list of :class:`.item.URLRecord`. The list is empty if
+            no URLs are found.
+        '''
+        url_records = []
+
+        for dummy in range(amount):
+            try:
+                url_records.append(
+                    self.check_out(filter_status, filter_level))
+            except NotFound:
+                break
+
+        return url_records
+
     @abc.abstractmethod
     def check_in(self, url, new_status, increment_try_count=True,
                  **kwargs):
@@ -90,13 +180,38 @@ class BaseURLTable(object, metaclass=abc.ABCMeta):
             kwargs: Additional values.
         '''
 
+    def get_retry_time(self):
+        '''Return when the next URL with an error may be checked out.
+
+        A URL checked in with ``error`` status and a ``retry_time``
+        timestamp is not checked out before that time.
+
+        Tables that do not store retry times return None.
+
+        Returns:
+            float, None: The earliest retry time of the ``error`` URLs or
+            None if no URLs have one.
+        '''
+
     @abc.abstractmethod
     def update_one(self, url, **kwargs):
         '''Arbitrarily update values for a URL.'''
 
     @abc.abstractmethod
-    def release(self):
-        '''Mark any ``in_progress`` URLs to ``todo`` status.'''
+    def release(self, before=None):
+        '''Mark any ``in_progress`` URLs to ``todo`` status.
+
+        Args:
+            before (float): If provided, only URLs whose lease is older
+                than this timestamp are released. URLs checked out by
+                tables that do not store lease times are always released.
+        '''
+
+    def renew_leases(self, urls):
+        '''Update the lease time of the ``in_progress`` URLs to now.
+
+        Tables that do not store lease times ignore this.
+        '''
 
     @abc.abstractmethod
     def remove_many(self, urls):
@@ -106,6 +221,9 @@ class BaseURLTable(object, metaclass=abc.ABCMeta):
         '''Remove a URL from the database.'''
         self.remove_many([url])
 
+    def flush(self):
+        '''Write any buffered changes.'''
+
     @abc.abstractmethod
     def close(self):
         '''Run any clean-up actions and close the table.'''
@@ -126,3 +244,27 @@ class BaseURLTable(object, metaclass=abc.ABCMeta):
         Returns:
             str, None
         '''
+
+    @trollius.coroutine
+    def add_many_async(self, urls, **kwargs):
+        '''Add the URLs to the table.
+
+        Coroutine version of :meth:`add_many`.
+        '''
+        raise Return(self.add_many(urls, **kwargs))
+
+    @trollius.coroutine
+    def check_out_many_async(self, filter_status, amount, filter_level=None):
+        '''Find URLs, mark them in progress, and return them.
+
+        Coroutine version of :meth:`check_out_many`.
+        '''
+        raise Return(self.check_out_many(filter_status, amount, filter_level))
+
+    @trollius.coroutine
+    def get_retry_time_async(self):
+        '''Return when the next URL with an error may be checked out.
+
+        Coroutine version of :meth:`get_retry_time`.
+        '''
+        raise Return(self.get_retry_time())
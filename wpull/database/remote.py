@@ -0,0 +1,663 @@
+'''URL table shared with other processes.'''
+import collections
+import gettext
+import logging
+import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+import time
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.database.base import BaseURLTable, NotFound, DatabaseError
+from wpull.frontier import hostname_key
+from wpull.item import Status
+import wpull.observer
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+_PASSTHROUGH_METHODS = frozenset([
+    'count', 'count_by_status', 'get_one', 'contains', 'add_many',
+    'update_one', 'remove_many', 'flush', 'add_visits', 'get_revisit_id',
+    'get_retry_time',
+])
+'''Methods called on the served table without any changes.'''
+
+_HELD = object()
+'''Result of a check out that is answered later.'''
+
+
+class RemoteClientState(object):
+    '''Bookkeeping of a connected client.
+
+    Attributes:
+        name: The name of the client used in log messages.
+        connection: The connection to the client.
+        checked_out_urls (set): URLs handed out but not checked in.
+        buffers (dict): A mapping of status to a deque of checked out
+            records waiting to be handed to the client.
+        held_request (tuple, None): The status and amount of a check out
+            that is waiting for records.
+        iterator: The iterator of :meth:`.BaseURLTable.get_all`.
+        last_seen (float): The time of the last request. The checked out
+            URLs are leased until this time plus the lease timeout.
+    '''
+    def __init__(self, name, connection):
+        self.name = name
+        self.connection = connection
+        self.checked_out_urls = set()
+        self.buffers = collections.defaultdict(collections.deque)
+        self.held_request = None
+        self.iterator = None
+        self.last_seen = time.time()
+
+    def is_idle(self):
+        '''Return whether the client has nothing checked out.'''
+        return not self.checked_out_urls
+
+    def buffered_count(self):
+        return sum(len(buffer) for buffer in self.buffers.values())
+
+
+class URLTableServer(object):
+    '''Serve a URL table to clients over connections.
+
+    Requires Python 3.3 or greater.
+
+    Args:
+        url_table (:class:`.database.base.BaseURLTable`): The table.
+        batch_size (int): The number of records checked out from the table
+            at a time.
+        max_buffer_size (int): The maximum number of records checked out
+            and waiting for their clients.
+        lease_timeout (float): If provided, a client holding URLs that does
+            not send a request within this many seconds is dropped as if it
+            disconnected.
+
+    Each host is assigned to the first client that receives one of its
+    URLs. Later URLs of the host are only handed to that client, so the
+    per-host limits of each client still apply.
+
+    A check out from a client that has nothing checked out waits until
+    URLs are available instead of returning nothing, because other clients
+    may still add URLs. Once every client is waiting and no URLs are left,
+    all of them receive nothing and finish. URLs with errors waiting for
+    their retry time are handed out when the time passes.
+
+    When a client disconnects, its URLs that were not checked in are put
+    back and its hosts are assigned again.
+
+    Clients connect through connections given to :meth:`add_connection`
+    or over TCP after :meth:`listen`.
+
+    The server is not thread safe. :meth:`stop` may be called from another
+    thread.
+
+    Attributes:
+        report_observer (:class:`.observer.Observer`): Called with the
+            client name and the arguments of a ``report`` request.
+    '''
+    def __init__(self, url_table, batch_size=100, max_buffer_size=10000,
+                 lease_timeout=None):
+        self._url_table = url_table
+        self._batch_size = batch_size
+        self._max_buffer_size = max_buffer_size
+        self._lease_timeout = lease_timeout
+        self._clients = {}
+        self._host_assignments = {}
+        self._stopping = False
+        self._listener = None
+        self._accepted_connections = queue.Queue()
+        self._accept_reader, self._accept_writer = \
+            multiprocessing.Pipe(duplex=False)
+        self.report_observer = wpull.observer.Observer()
+
+    def add_connection(self, connection, name=None):
+        '''Add a client connection.'''
+        if name is None:
+            name = len(self._clients)
+
+        self._clients[connection] = RemoteClientState(name, connection)
+
+    def listen(self, address, authkey):
+        '''Accept clients over TCP.
+
+        Args:
+            address (tuple): The host and port. Port 0 picks a free port.
+            authkey (bytes): The shared secret that clients must know.
+
+        Returns:
+            tuple: The address listened on.
+        '''
+        assert not self._listener
+        self._listener = multiprocessing.connection.Listener(
+            address, authkey=authkey)
+
+        thread = threading.Thread(
+            target=self._accept_clients, name='URLTableServerAccept',
+            daemon=True)
+        thread.start()
+
+        return self._listener.address
+
+    def _accept_clients(self):
+        '''Accept and authenticate connections on a separate thread.'''
+        while True:
+            try:
+                connection = self._listener.accept()
+            except multiprocessing.AuthenticationError as error:
+                _logger.warning(__(
+                    _('Rejected a client of the URL table: {error}'),
+                    error=error
+                ))
+            except (EOFError, OSError) as error:
+                if not self._listener:
+                    return
+
+                _logger.debug(__('Accept failed: {0}', error))
+            else:
+                self._accepted_connections.put(connection)
+                self._accept_writer.send(None)
+
+    def stop(self):
+        '''Stop handing out URLs so the clients finish.'''
+        self._stopping = True
+
+    def serve(self):
+        '''Handle requests until every client disconnects.
+
+        When listening, serving continues until :meth:`stop` is called and
+        every client disconnects.
+        '''
+        while self._clients or self._listener and not self._stopping:
+            connections = multiprocessing.connection.wait(
+                tuple(self._clients) + (self._accept_reader,), timeout=1)
+
+            self._expire_clients()
+
+            for connection in connections:
+                if connection is self._accept_reader:
+                    self._add_accepted_connections()
+                    continue
+                elif connection not in self._clients:
+                    continue
+
+                try:
+                    request = connection.recv()
+                except (EOFError, OSError):
+                    self._remove_client(self._clients[connection])
+                else:
+                    self._handle_request(self._clients[connection], request)
+
+            self._serve_held_requests()
+
+        self._close_listener()
+
+    def _add_accepted_connections(self):
+        self._accept_reader.recv()
+
+        while not self._accepted_connections.empty():
+            connection = self._accepted_connections.get_nowait()
+
+            try:
+                address = self._listener.last_accepted
+                name = '{0}:{1}'.format(*address)
+            except (AttributeError, TypeError):
+                name = None
+
+            self.add_connection(connection, name)
+
+            _logger.info(__(
+                _('Client {name} connected to the URL table.'),
+                name=self._clients[connection].name
+            ))
+
+    def _close_listener(self):
+        if self._listener:
+            listener = self._listener
+            self._listener = None
+            listener.close()
+
+    def _expire_clients(self):
+        '''Drop clients whose leases expired.'''
+        if not self._lease_timeout:
+            return
+
+        deadline = time.time() - self._lease_timeout
+
+        for client in tuple(self._clients.values()):
+            if client.last_seen < deadline and not client.held_request \
+                    and (client.checked_out_urls or client.buffered_count()):
+                _logger.warning(__(
+                    _('Client {name} of the URL table did not respond in '
+                      '{timeout} seconds. Its URLs are released.'),
+                    name=client.name, timeout=self._lease_timeout
+                ))
+                self._remove_client(client)
+
+    def _handle_request(self, client, request):
+        '''Run a request and send the reply.'''
+        name, args, kwargs = request
+        client.last_seen = time.time()
+
+        try:
+            if name == 'batch':
+                result = self._run_batch(client, *args)
+            else:
+                result = self._run_request(client, name, args, kwargs)
+        except Exception as error:
+            _logger.debug(__('Request {0} failed: {1}', name, error))
+            self._send(client, (False, error))
+        else:
+            if result is not _HELD:
+                self._send(client, (True, result))
+
+    def _run_batch(self, client, requests):
+        '''Run several requests and return the result of the last one.'''
+        result = None
+
+        for name, args, kwargs in requests:
+            result = self._run_request(client, name, args, kwargs)
+
+        return result
+
+    def _run_request(self, client, name, args, kwargs):
+        '''Run a request and return the result.'''
+        if name == 'check_out_many':
+            result = self._check_out(client, *args, **kwargs)
+
+            if result is None:
+                return _HELD
+        elif name == 'heartbeat':
+            result = None
+        elif name == 'check_in':
+            client.checked_out_urls.discard(args[0])
+            result = self._url_table.check_in(*args, **kwargs)
+        elif name == 'release':
+            result = self._release_client(client)
+        elif name == 'get_all':
+            client.iterator = iter(self._url_table.get_all())
+            result = None
+        elif name == 'get_all_batch':
+            result = self._get_all_batch(client, *args)
+        elif name == 'close':
+            result = self._url_table.flush()
+        elif name == 'report':
+            result = self.report_observer.notify(client.name, *args)
+        elif name in _PASSTHROUGH_METHODS:
+            result = getattr(self._url_table, name)(*args, **kwargs)
+        else:
+            raise DatabaseError('Unknown method {}.'.format(name))
+
+        return result
+
+    def _send(self, client, reply):
+        try:
+            client.connection.send(reply)
+        except OSError as error:
+            _logger.debug(__('Client {0} failed: {1}', client.name, error))
+            self._remove_client(client)
+
+    def _check_out(self, client, filter_status, amount, filter_level=None):
+        '''Return records for the client.
+
+        Returns:
+            list, None: The records or None if the request is held.
+        '''
+        if self._stopping:
+            return []
+        elif filter_level is not None:
+            url_records = self._url_table.check_out_many(
+                filter_status, amount, filter_level)
+            client.checked_out_urls.update(
+                url_record.url for url_record in url_records)
+            return url_records
+
+        url_records = self._take_records(client, (filter_status,), amount)
+
+        if url_records or not client.is_idle() \
+                or filter_status == Status.todo:
+            # A busy client asks again after its items finish. An empty
+            # result for "todo" makes the client ask for "error".
+            return url_records
+
+        _logger.debug(__('Hold check out of client {0}.', client.name))
+        client.held_request = (filter_status, amount)
+
+    def _take_records(self, client, statuses, amount):
+        '''Take buffered records of the client checking out more as needed.
+
+        Returns:
+            list
+        '''
+        url_records = []
+
+        if self._stopping:
+            return url_records
+
+        for status in statuses:
+            buffer = client.buffers[status]
+
+            while len(url_records) < amount:
+                if buffer:
+                    url_records.append(buffer.popleft())
+                elif not self._fill_buffers(client, status):
+                    break
+
+        client.checked_out_urls.update(
+            url_record.url for url_record in url_records)
+
+        return url_records
+
+    def _fill_buffers(self, client, status):
+        '''Check out records from the table into the clients' buffers.
+
+        Returns:
+            bool: Whether any records were checked out.
+        '''
+        if self._stopping:
+            return False
+
+        buffered_count = sum(
+            other_client.buffered_count()
+            for other_client in self._clients.values()
+        )
+
+        if buffered_count >= self._max_buffer_size:
+            return False
+
+        url_records = self._url_table.check_out_many(
+            status, self._batch_size)
+
+        for url_record in url_records:
+            key = hostname_key(url_record)
+            owner = self._host_assignments.get(key)
+
+            if owner is None:
+                owner = self._host_assignments[key] = client
+                _logger.debug(__('Assigned host {0} to client {1}.',
+                                 key, client.name))
+
+            owner.buffers[status].append(url_record)
+
+        return bool(url_records)
+
+    def _serve_held_requests(self):
+        '''Reply to held check outs that can be answered now.'''
+        served = True
+
+        # Records checked out for one client may belong to another client
+        # that was already skipped.
+        while served:
+            served = False
+            held_clients = [
+                client for client in self._clients.values()
+                if client.held_request
+            ]
+
+            for client in held_clients:
+                filter_status, amount = client.held_request
+                url_records = self._take_records(
+                    client, (Status.todo, filter_status), amount)
+
+                if url_records or self._stopping:
+                    served = True
+                    client.held_request = None
+                    self._send(client, (True, url_records))
+
+        all_held = all(
+            client.held_request for client in self._clients.values())
+        any_buffered = any(
+            client.buffered_count() for client in self._clients.values())
+
+        if all_held and not any_buffered \
+                and self._url_table.get_retry_time() is None:
+            _logger.debug('All clients are waiting. Finishing.')
+
+            for client in tuple(self._clients.values()):
+                client.held_request = None
+                self._send(client, (True, []))
+
+    def _get_all_batch(self, client, size):
+        '''Return the next records of the client's iterator.'''
+        url_records = []
+
+        for url_record in client.iterator:
+            url_records.append(url_record)
+
+            if len(url_records) >= size:
+                break
+        else:
+            client.iterator = None
+
+        return url_records
+
+    def _release_client(self, client):
+        '''Put back the URLs held for or by the client.'''
+        urls = set(client.checked_out_urls)
+
+        for buffer in client.buffers.values():
+            urls.update(url_record.url for url_record in buffer)
+            buffer.clear()
+
+        client.checked_out_urls.clear()
+
+        if urls:
+            _logger.debug(__('Release {0} URLs of client {1}.',
+                             len(urls), client.name))
+
+        for url in urls:
+            self._url_table.check_in(
+                url, Status.todo, increment_try_count=False)
+
+    def _remove_client(self, client):
+        '''Forget the disconnected client.'''
+        if client.connection not in self._clients:
+            return
+
+        _logger.debug(__('Client {0} disconnected.', client.name))
+        del self._clients[client.connection]
+        self._release_client(client)
+
+        for key, owner in tuple(self._host_assignments.items()):
+            if owner is client:
+                del self._host_assignments[key]
+
+        client.connection.close()
+
+
+class RemoteURLTable(BaseURLTable):
+    '''URL table client of :class:`URLTableServer`.
+
+    Args:
+        connection: A :class:`multiprocessing.connection.Connection`.
+        get_all_batch_size (int): The number of records fetched at a time
+            by :meth:`get_all`.
+        max_pending (int): The number of check ins and updates sent
+            together. They are also sent with the next request.
+        heartbeat_interval (float): If provided, a request is sent at this
+            interval in seconds while idle so the lease of the checked out
+            URLs does not expire.
+        close_connection (bool): Whether :meth:`close` closes the
+            connection.
+
+    :meth:`check_in` and :meth:`update_one` do not wait for the server. If
+    one of them fails, the error is raised by a later call.
+
+    :meth:`check_out_many` may block until other clients add URLs.
+    '''
+    def __init__(self, connection, get_all_batch_size=1000, max_pending=100,
+                 heartbeat_interval=None, close_connection=False):
+        super().__init__()
+        self._connection = connection
+        self._get_all_batch_size = get_all_batch_size
+        self._max_pending = max_pending
+        self._close_connection = close_connection
+        self._pending_requests = []
+        self._lock = threading.Lock()
+        self._closed_event = threading.Event()
+        self._error = None
+
+        if heartbeat_interval:
+            thread = threading.Thread(
+                target=self._run_heartbeat, args=(heartbeat_interval,),
+                name='RemoteURLTableHeartbeat', daemon=True)
+            thread.start()
+
+    @classmethod
+    def connect(cls, address, authkey, **kwargs):
+        '''Connect to a server over TCP.
+
+        Returns:
+            RemoteURLTable: A table that closes the connection when closed.
+        '''
+        connection = multiprocessing.connection.Client(
+            address, authkey=authkey)
+        return cls(connection, close_connection=True, **kwargs)
+
+    def _call(self, name, *args, **kwargs):
+        '''Send the request and return the result.'''
+        with self._lock:
+            if self._error:
+                error = self._error
+                self._error = None
+                raise error
+
+            return self._send_request(name, args, kwargs)
+
+    def _send_request(self, name, args, kwargs):
+        if self._pending_requests:
+            requests = self._pending_requests
+            requests.append((name, args, kwargs))
+            self._pending_requests = []
+            name, args, kwargs = 'batch', (requests,), {}
+
+        self._connection.send((name, args, kwargs))
+        is_ok, result = self._connection.recv()
+
+        if not is_ok:
+            raise result
+
+        return result
+
+    def _call_later(self, name, *args, **kwargs):
+        '''Queue the request to be sent with the next request.'''
+        with self._lock:
+            self._pending_requests.append((name, args, kwargs))
+
+            if len(self._pending_requests) >= self._max_pending:
+                self._send_request('heartbeat', (), {})
+
+    def _run_heartbeat(self, interval):
+        '''Send requests while idle.'''
+        while not self._closed_event.wait(interval):
+            # A check out in progress is a heartbeat too
+            if not self._lock.acquire(blocking=False):
+                continue
+
+            try:
+                self._send_request('heartbeat', (), {})
+            except (EOFError, OSError) as error:
+                _logger.debug(__('Heartbeat failed: {0}', error))
+                return
+            except Exception as error:
+                if not self._error:
+                    self._error = error
+            finally:
+                self._lock.release()
+
+    def heartbeat(self):
+        '''Send the pending requests and renew the lease.'''
+        self._call('heartbeat')
+
+    def count(self):
+        return self._call('count')
+
+    def count_by_status(self):
+        return self._call('count_by_status')
+
+    def get_one(self, url):
+        return self._call('get_one', url)
+
+    def contains(self, url):
+        return self._call('contains', url)
+
+    def get_all(self):
+        self._call('get_all')
+
+        while True:
+            url_records = self._call(
+                'get_all_batch', self._get_all_batch_size)
+
+            for url_record in url_records:
+                yield url_record
+
+            if len(url_records) < self._get_all_batch_size:
+                break
+
+    def add_many(self, urls, **kwargs):
+        return self._call('add_many', tuple(urls), **kwargs)
+
+    def check_out(self, filter_status, filter_level=None):
+        url_records = self.check_out_many(filter_status, 1, filter_level)
+
+        if not url_records:
+            raise NotFound()
+
+        return url_records[0]
+
+    def check_out_many(self, filter_status, amount, filter_level=None):
+        return self._call(
+            'check_out_many', filter_status, amount, filter_level)
+
+    def check_in(self, url, new_status, increment_try_count=True, **kwargs):
+        self._call_later('check_in', url, new_status,
+                         increment_try_count=increment_try_count, **kwargs)
+
+    def get_retry_time(self):
+        return self._call('get_retry_time')
+
+    def update_one(self, url, **kwargs):
+        self._call_later('update_one', url, **kwargs)
+
+    def release(self, before=None):
+        '''Put back URLs checked out by this client only.
+
+        The server expires the leases of its clients itself, so if
+        `before` is provided, the held URLs are kept and the lease of this
+        client is renewed instead.
+        '''
+        if before is None:
+            self._call('release')
+        else:
+            self._call('heartbeat')
+
+    def remove_many(self, urls):
+        self._call('remove_many', tuple(urls))
+
+    def flush(self):
+        self._call('flush')
+
+    def close(self):
+        self._closed_event.set()
+
+        try:
+            self._call('close')
+        finally:
+            if self._close_connection:
+                self._connection.close()
+
+    def add_visits(self, visits):
+        self._call('add_visits', tuple(visits))
+
+    def get_revisit_id(self, url, payload_digest):
+        return self._call('get_revisit_id', url, payload_digest)
+
+    def report(self, *args):
+        '''Send information to the server's ``report_observer``.'''
+        self._call('report', *args)
+
+
+__all__ = ('URLTableServer', 'RemoteURLTable')
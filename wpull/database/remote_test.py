@@ -0,0 +1,301 @@
+# encoding=utf-8
+import multiprocessing
+import sys
+import threading
+import time
+import unittest
+
+from wpull.database.base import NotFound
+from wpull.database.remote import URLTableServer, RemoteURLTable
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.database.threaded import ThreadedURLTable
+from wpull.item import Status
+
+
+@unittest.skipIf(sys.version_info[0:2] == (3, 2),
+                 'multiprocessing.connection.wait requires Python 3.3')
+class TestRemote(unittest.TestCase):
+    def setUp(self):
+        self.url_table = ThreadedURLTable(lambda: SQLiteURLTable(':memory:'))
+        self.server = URLTableServer(
+            self.url_table, batch_size=2, lease_timeout=0.5)
+        self.server_thread = None
+        self.clients = []
+
+    def tearDown(self):
+        self.server.stop()
+
+        for client in self.clients:
+            client._connection.close()
+
+        if self.server_thread:
+            self.server_thread.join(timeout=10)
+            self.assertFalse(self.server_thread.is_alive())
+
+        self.url_table.close()
+
+    def new_client(self, name):
+        connection, client_connection = multiprocessing.Pipe()
+        self.server.add_connection(connection, name)
+        client = RemoteURLTable(client_connection, get_all_batch_size=2)
+        self.clients.append(client)
+        return client
+
+    def start_server(self):
+        self.server_thread = threading.Thread(target=self.server.serve)
+        self.server_thread.start()
+
+    def test_remote_url_table(self):
+        client = self.new_client(1)
+        self.start_server()
+
+        urls = ['http://example.com/{}'.format(num) for num in range(5)]
+        added_urls = client.add_many([{'url': url} for url in urls], level=0)
+
+        self.assertEqual(urls, list(added_urls))
+        self.assertEqual(5, client.count())
+        self.assertTrue(client.contains(urls[0]))
+        self.assertEqual(urls, [record.url for record in client.get_all()])
+
+        url_record = client.check_out(Status.todo)
+        self.assertEqual(urls[0], url_record.url)
+
+        client.update_one(url_record.url, status_code=200)
+        client.check_in(url_record.url, Status.done)
+
+        self.assertEqual(200, client.get_one(urls[0]).status_code)
+        self.assertEqual(1, client.count_by_status()[Status.done])
+
+        url_records = client.check_out_many(Status.todo, 10)
+        self.assertEqual(urls[1:], [record.url for record in url_records])
+
+        client.release()
+
+        self.assertEqual(4, client.count_by_status()[Status.todo])
+
+        with self.assertRaises(NotFound):
+            client.get_one('http://example.com/missing')
+
+        client.add_visits([('http://example.com/1', 'id123', 'digest123')])
+        self.assertEqual(
+            'id123',
+            client.get_revisit_id('http://example.com/1', 'digest123'))
+
+        client.close()
+
+    def test_host_affinity(self):
+        client_1 = self.new_client(1)
+        client_2 = self.new_client(2)
+        self.start_server()
+
+        client_1.add_many([
+            {'url': 'http://a.example/1'},
+            {'url': 'http://b.example/1'},
+            {'url': 'http://a.example/2'},
+            {'url': 'http://b.example/2'},
+        ])
+
+        url_records = client_1.check_out_many(Status.todo, 1)
+        self.assertEqual(['http://a.example/1'],
+                         [record.url for record in url_records])
+
+        # b.example was checked out in the same batch so it belongs to
+        # the first client as well.
+        self.assertEqual([], client_2.check_out_many(Status.todo, 10))
+
+        url_records = client_1.check_out_many(Status.todo, 10)
+        self.assertEqual(
+            ['http://b.example/1', 'http://a.example/2', 'http://b.example/2'],
+            [record.url for record in url_records])
+
+        client_1.add_many([
+            {'url': 'http://c.example/1'},
+            {'url': 'http://a.example/3'},
+        ])
+
+        url_records = client_2.check_out_many(Status.todo, 10)
+        self.assertEqual(['http://c.example/1'],
+                         [record.url for record in url_records])
+
+        url_records = client_1.check_out_many(Status.todo, 10)
+        self.assertEqual(['http://a.example/3'],
+                         [record.url for record in url_records])
+
+    def test_wait_for_urls(self):
+        client_1 = self.new_client(1)
+        client_2 = self.new_client(2)
+        self.start_server()
+
+        client_1.add_many([{'url': 'http://a.example/1'}])
+        client_1.check_out(Status.todo)
+
+        results = []
+
+        def wait_for_urls():
+            results.append(client_2.check_out_many(Status.error, 10))
+
+            for url_record in results[0]:
+                client_2.check_in(url_record.url, Status.done)
+
+            results.append(client_2.check_out_many(Status.error, 10))
+
+        thread = threading.Thread(target=wait_for_urls)
+        thread.start()
+        thread.join(timeout=0.1)
+
+        self.assertTrue(thread.is_alive())
+
+        client_1.add_many([{'url': 'http://b.example/1'}])
+        client_1.check_in('http://a.example/1', Status.done)
+
+        # The last client waiting ends the crawl
+        self.assertEqual([], client_1.check_out_many(Status.error, 10))
+
+        thread.join(timeout=5)
+
+        self.assertEqual(['http://b.example/1'],
+                         [record.url for record in results[0]])
+        self.assertEqual([], results[1])
+
+    def test_disconnect(self):
+        client_1 = self.new_client(1)
+        client_2 = self.new_client(2)
+        self.start_server()
+
+        client_1.add_many([
+            {'url': 'http://a.example/1'},
+            {'url': 'http://a.example/2'},
+        ])
+        client_1.check_out(Status.todo)
+        client_1._connection.close()
+
+        url_records = client_2.check_out_many(Status.todo, 10)
+        self.assertEqual(
+            ['http://a.example/1', 'http://a.example/2'],
+            sorted(record.url for record in url_records))
+        self.assertEqual(0, url_records[0].try_count)
+
+    def test_stop(self):
+        client = self.new_client(1)
+        self.start_server()
+
+        client.add_many([{'url': 'http://a.example/1'}])
+        self.server.stop()
+
+        self.assertEqual([], client.check_out_many(Status.todo, 10))
+
+    def test_batched_check_in(self):
+        client = self.new_client(1)
+        client._max_pending = 3
+        self.start_server()
+
+        client.add_many([
+            {'url': 'http://a.example/{}'.format(num)} for num in range(3)
+        ])
+        url_records = client.check_out_many(Status.todo, 3)
+
+        client.update_one(url_records[0].url, status_code=200)
+        client.check_in(url_records[0].url, Status.done)
+
+        self.assertEqual(
+            Status.in_progress, self.url_table.get_one(url_records[0].url).status)
+
+        self.assertEqual(1, client.count_by_status()[Status.done])
+        self.assertEqual(200, client.get_one(url_records[0].url).status_code)
+
+        client.check_in(url_records[1].url, Status.done)
+        client.check_in(url_records[2].url, Status.done)
+        client.check_in('http://a.example/0', Status.done)
+
+        self.assertEqual(
+            Status.done, self.url_table.get_one(url_records[2].url).status)
+
+    def test_lease_expiry(self):
+        client_1 = self.new_client(1)
+        client_2 = self.new_client(2)
+        self.start_server()
+
+        client_1.add_many([{'url': 'http://a.example/1'}])
+        client_1.check_out(Status.todo)
+
+        time.sleep(0.6)
+
+        url_record = client_2.check_out(Status.todo)
+        self.assertEqual('http://a.example/1', url_record.url)
+
+        with self.assertRaises((EOFError, OSError)):
+            client_1.count()
+
+    def test_release_before(self):
+        client_1 = self.new_client(1)
+        client_2 = self.new_client(2)
+        self.start_server()
+
+        client_1.add_many([{'url': 'http://a.example/1'}])
+        client_1.check_out(Status.todo)
+
+        time.sleep(0.3)
+        client_1.release(before=time.time())
+        time.sleep(0.3)
+
+        self.assertEqual([], client_2.check_out_many(Status.todo, 1))
+        self.assertEqual(
+            Status.in_progress,
+            client_1.get_one('http://a.example/1').status)
+
+        client_1.release()
+
+        self.assertEqual(
+            Status.todo, client_1.get_one('http://a.example/1').status)
+
+    def test_heartbeat(self):
+        client_1 = self.new_client(1)
+        client_2 = self.new_client(2)
+        self.start_server()
+
+        client_1.add_many([{'url': 'http://a.example/1'}])
+        client_1.check_out(Status.todo)
+
+        heartbeat_client = RemoteURLTable(
+            client_1._connection, heartbeat_interval=0.1)
+
+        time.sleep(0.8)
+
+        self.assertEqual([], client_2.check_out_many(Status.todo, 1))
+
+        heartbeat_client._closed_event.set()
+
+    def test_wait_for_retry(self):
+        client = self.new_client(1)
+        self.start_server()
+
+        client.add_many([{'url': 'http://a.example/1'}])
+        client.check_out(Status.todo)
+        client.check_in('http://a.example/1', Status.error,
+                        retry_time=time.time() + 0.3)
+
+        self.assertTrue(client.get_retry_time())
+
+        # The idle client is held instead of finishing the crawl
+        url_record = client.check_out(Status.error)
+        self.assertEqual('http://a.example/1', url_record.url)
+
+    def test_tcp(self):
+        address = self.server.listen(('localhost', 0), b'secret')
+        self.start_server()
+
+        client = RemoteURLTable.connect(address, b'secret')
+        self.clients.append(client)
+
+        client.add_many([{'url': 'http://a.example/1'}])
+        url_record = client.check_out(Status.todo)
+        self.assertEqual('http://a.example/1', url_record.url)
+
+        with self.assertRaises(multiprocessing.AuthenticationError):
+            RemoteURLTable.connect(address, b'wrong')
+
+        client.check_in(url_record.url, Status.done)
+        client.close()
+
+        self.assertEqual(
+            Status.done, self.url_table.get_one(url_record.url).status)
@@ -0,0 +1,669 @@
+'''URL table using the sqlite3 module directly.'''
+import contextlib
+import gettext
+import hashlib
+import itertools
+import logging
+import sqlite3
+import time
+
+from sqlalchemy.dialects import sqlite as sqlite_dialect
+from sqlalchemy.schema import CreateTable, CreateIndex
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.database.base import BaseURLTable, NotFound, DatabaseError, \
+    status_counts, CrawlOrder, CRAWL_ORDERS
+from wpull.database.sqlmodel import DBBase
+from wpull.database.sqltable import WriteBehindMixin, \
+    create_sqlite_url_counts, add_column_statement
+from wpull.item import Status, URLRecord
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+
+_SELECT_URL_RECORD = '''
+SELECT
+    url_strings.url, urls.status, urls.try_count, urls.level,
+    top_url_strings.url, urls.status_code, referrer_url_strings.url,
+    urls.inline, urls.link_type, urls.post_data, urls.filename
+FROM urls
+JOIN url_strings ON urls.url_str_id = url_strings.id
+LEFT JOIN url_strings AS top_url_strings
+    ON urls.top_url_str_id = top_url_strings.id
+LEFT JOIN url_strings AS referrer_url_strings
+    ON urls.referrer_id = referrer_url_strings.id
+'''
+
+_INSERT_COLUMNS = (
+    'status', 'try_count', 'level', 'status_code', 'inline', 'link_type',
+    'post_data', 'filename', 'priority'
+)
+'''Columns of the ``urls`` table that can be given to :meth:`add_many`.'''
+
+_COLUMN_DEFAULTS = {
+    'status': Status.todo,
+    'try_count': 0,
+    'level': 0,
+    'priority': 0,
+}
+
+_CRAWL_ORDER_CLAUSES = {
+    CrawlOrder.default: '',
+    CrawlOrder.breadth_first: ' ORDER BY urls.level, urls.id',
+    CrawlOrder.depth_first: ' ORDER BY urls.level DESC, urls.id DESC',
+    CrawlOrder.inline_first: ' ORDER BY urls.inline DESC, urls.id',
+    CrawlOrder.priority: ' ORDER BY urls.priority DESC, urls.id',
+}
+'''Mapping of crawl orders to the ORDER BY clauses of check outs.'''
+
+_MAX_VARIABLES = 900
+'''Number of parameters per statement kept below SQLite's default 999.'''
+
+_URL_INDEX_NAME = 'ix_url_strings_url'
+
+
+def _iter_batches(items, size=_MAX_VARIABLES):
+    '''Split the items into tuples of at most `size` items.'''
+    items = iter(items)
+
+    while True:
+        batch = tuple(itertools.islice(items, size))
+
+        if not batch:
+            break
+
+        yield batch
+
+
+def _placeholders(items):
+    return ', '.join('?' for dummy in items)
+
+
+def url_fingerprint(url):
+    '''Return the integer fingerprint of the URL.
+
+    The fingerprint is the first 64 bits of the MD5 hash shifted to a
+    non-negative 62-bit value so probing past it cannot overflow a SQLite
+    integer.
+    '''
+    digest = hashlib.md5(url.encode('utf-8', 'surrogatepass')).digest()
+    return int.from_bytes(digest[:8], 'big') >> 2
+
+
+class SQLite3URLTable(WriteBehindMixin, BaseURLTable):
+    '''URL table with SQLite storage using the sqlite3 module directly.
+
+    The schema is the same as :class:`.database.sqltable.SQLiteURLTable` so
+    either table can open the same database file. Unlike the SQLAlchemy
+    table, it does not build ORM objects and uses a single joined query to
+    produce records.
+
+    Args:
+        path: A SQLite filename
+        crawl_order (str): A value from :class:`.database.base.CrawlOrder`.
+        kwargs: Arguments passed to
+            :class:`.database.sqltable.WriteBehindMixin`.
+    '''
+    url_index = True
+    '''Whether URL strings are found using an index on the text.'''
+
+    def __init__(self, path=':memory:', crawl_order=CrawlOrder.default,
+                 **kwargs):
+        super().__init__(**kwargs)
+        assert crawl_order in CRAWL_ORDERS, crawl_order
+        self._order_by = _CRAWL_ORDER_CLAUSES[crawl_order]
+        self._path = path
+        self._connection = None
+        self.connection
+
+    @property
+    def connection(self):
+        '''Return the sqlite3 connection, opening it if needed.'''
+        if not self._connection:
+            # The connection is owned by whichever single thread uses the
+            # table, such as ThreadedURLTable, so it may not be the thread
+            # that created it.
+            self._connection = sqlite3.connect(
+                self._path, check_same_thread=False)
+            self._apply_pragmas(self._connection)
+            self._create_tables(self._connection)
+
+        return self._connection
+
+    @classmethod
+    def _apply_pragmas(cls, connection):
+        '''Set SQLite pragmas.
+
+        Write-ahead logging, synchronous=NORMAL is used.
+        '''
+        _logger.debug('Setting pragmas.')
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+
+    @classmethod
+    def _create_tables(cls, connection):
+        '''Create the tables and indexes of the SQLAlchemy model.'''
+        dialect = sqlite_dialect.dialect()
+
+        with contextlib.closing(connection.cursor()) as cursor, connection:
+            cursor.execute('SELECT name FROM sqlite_master')
+            names = frozenset(row[0] for row in cursor.fetchall())
+
+            if 'url_strings' in names and \
+                    (_URL_INDEX_NAME in names) != cls.url_index:
+                raise DatabaseError(
+                    'The database uses a different URL string schema.')
+
+            for table in DBBase.metadata.sorted_tables:
+                if table.name not in names:
+                    cursor.execute(
+                        str(CreateTable(table).compile(dialect=dialect)))
+                else:
+                    cls._add_missing_columns(cursor, table, dialect)
+
+                for index in table.indexes:
+                    if index.name == _URL_INDEX_NAME and not cls.url_index:
+                        continue
+
+                    if index.name not in names:
+                        if table.name in names:
+                            _logger.info(__(
+                                _('Creating database index {name}. '
+                                  'This may take a while.'),
+                                name=index.name
+                            ))
+
+                        cursor.execute(
+                            str(CreateIndex(index).compile(dialect=dialect)))
+
+            create_sqlite_url_counts(cursor)
+
+    @classmethod
+    def _add_missing_columns(cls, cursor, table, dialect):
+        '''Add columns of the model missing from an existing table.'''
+        cursor.execute('PRAGMA table_info({0})'.format(table.name))
+        column_names = frozenset(row[1] for row in cursor.fetchall())
+
+        for column in table.columns:
+            if column.name not in column_names:
+                _logger.debug(__('Adding column {0}.{1}.',
+                                 table.name, column.name))
+                cursor.execute(add_column_statement(table, column, dialect))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        '''Provide a cursor in a transaction.
+
+        Buffered updates are written first in the same transaction.
+        '''
+        connection = self.connection
+        pending_updates = self._pop_pending_updates()
+        cursor = connection.cursor()
+
+        try:
+            self._write_updates(cursor, pending_updates)
+            yield cursor
+            connection.commit()
+        except:
+            connection.rollback()
+            self._restore_pending_updates(pending_updates)
+            raise
+        finally:
+            cursor.close()
+
+    def flush(self):
+        '''Write any buffered updates.'''
+        if self._pending_updates:
+            with self._transaction():
+                pass
+
+    def _write_updates(self, cursor, pending_updates):
+        '''Execute the buffered updates.'''
+        if not pending_updates:
+            return
+
+        _logger.debug(__('Writing {0} buffered updates.',
+                         len(pending_updates)))
+
+        url_str_ids = self._get_url_str_ids(cursor, pending_updates.keys())
+        groups = self._group_pending_updates(pending_updates)
+
+        for (names, increment_try_count), all_row_values in groups.items():
+            assignments = [
+                '{0} = :_value_{0}'.format(name) for name in names
+            ]
+
+            if increment_try_count:
+                assignments.append(
+                    'try_count = try_count + :_try_count_increment')
+
+            if not assignments:
+                continue
+
+            for row_values in all_row_values:
+                row_values['_url_str_id'] = url_str_ids.get(row_values['_url'])
+
+            query = 'UPDATE urls SET {0} WHERE url_str_id = :_url_str_id'\
+                .format(', '.join(assignments))
+
+            cursor.executemany(query, all_row_values)
+
+    def _get_url_str_ids(self, cursor, urls):
+        '''Return the IDs of the URL strings.
+
+        Returns:
+            dict: A mapping of URL to ID of the URLs found.
+        '''
+        url_str_ids = {}
+
+        for batch in _iter_batches(set(urls)):
+            cursor.execute(
+                'SELECT url, id FROM url_strings WHERE url IN ({0})'
+                .format(_placeholders(batch)),
+                batch
+            )
+            url_str_ids.update(cursor.fetchall())
+
+        return url_str_ids
+
+    def _add_url_strings(self, cursor, urls):
+        '''Add the URL strings if needed and return their IDs.
+
+        Returns:
+            dict: A mapping of URL to ID.
+        '''
+        cursor.executemany(
+            'INSERT OR IGNORE INTO url_strings (url) VALUES (?)',
+            ((url,) for url in urls)
+        )
+
+        return self._get_url_str_ids(cursor, urls)
+
+    @classmethod
+    def _to_url_record(cls, row):
+        return URLRecord(*row)
+
+    def count(self):
+        return sum(self.count_by_status().values())
+
+    def count_by_status(self):
+        with self._transaction() as cursor:
+            cursor.execute('SELECT status, count FROM url_counts')
+            return status_counts(cursor.fetchall())
+
+    def get_one(self, url):
+        with self._transaction() as cursor:
+            url_str_id = self._get_url_str_ids(cursor, [url]).get(url)
+
+            if url_str_id is None:
+                raise NotFound()
+
+            cursor.execute(
+                _SELECT_URL_RECORD + 'WHERE urls.url_str_id = ?',
+                (url_str_id,)
+            )
+            row = cursor.fetchone()
+
+        if not row:
+            raise NotFound()
+
+        return self._to_url_record(row)
+
+    def get_all(self):
+        query = _SELECT_URL_RECORD.replace('SELECT', 'SELECT urls.id,', 1) + \
+            'WHERE urls.id > ? ORDER BY urls.id LIMIT 1000'
+        last_id = 0
+
+        # Fetch in pages so other calls can commit between them
+        while True:
+            with self._transaction() as cursor:
+                cursor.execute(query, (last_id,))
+                rows = cursor.fetchall()
+
+            if not rows:
+                break
+
+            last_id = rows[-1][0]
+
+            for row in rows:
+                yield self._to_url_record(row[1:])
+
+    def add_many(self, new_urls, **kwargs):
+        assert not isinstance(new_urls, (str, bytes)), \
+            'Expected a list-like. Got {}'.format(new_urls)
+        referrer = kwargs.pop('referrer', None)
+        top_url = kwargs.pop('top_url', None)
+        absent_urls = kwargs.pop('absent_urls', None) or frozenset()
+
+        new_urls = tuple(new_urls)
+
+        if not new_urls:
+            return ()
+
+        assert isinstance(new_urls[0], dict), type(new_urls[0])
+        url_strings = list(item['url'] for item in new_urls)
+
+        if referrer:
+            url_strings.append(referrer)
+
+        if top_url:
+            url_strings.append(top_url)
+
+        with self._transaction() as cursor:
+            url_str_ids = self._add_url_strings(cursor, url_strings)
+            existing_url_str_ids = self._get_existing_url_str_ids(
+                cursor, [url_str_ids[item['url']] for item in new_urls
+                         if item['url'] not in absent_urls])
+
+            column_names = set(kwargs.keys())
+            column_names.update(_COLUMN_DEFAULTS.keys())
+
+            for item in new_urls:
+                assert 'url' in item
+                assert 'referrer' not in item
+                assert 'top_url' not in item
+                column_names.update(name for name in item if name != 'url')
+
+            column_names = sorted(column_names)
+
+            for name in column_names:
+                assert name in _INSERT_COLUMNS, name
+
+            all_row_values = []
+            added_urls = []
+
+            for item in new_urls:
+                url = item['url']
+                url_str_id = url_str_ids[url]
+
+                if url_str_id in existing_url_str_ids:
+                    continue
+
+                existing_url_str_ids.add(url_str_id)
+                added_urls.append(url)
+
+                row_values = [
+                    url_str_id,
+                    url_str_ids.get(referrer),
+                    url_str_ids.get(top_url),
+                ]
+
+                for name in column_names:
+                    if name in item:
+                        row_values.append(item[name])
+                    elif name in kwargs:
+                        row_values.append(kwargs[name])
+                    else:
+                        row_values.append(_COLUMN_DEFAULTS.get(name))
+
+                all_row_values.append(row_values)
+
+            query = '''INSERT OR IGNORE INTO urls
+                (url_str_id, referrer_id, top_url_str_id, {0})
+                VALUES (?, ?, ?, {1})'''.format(
+                ', '.join(column_names), _placeholders(column_names)
+            )
+
+            cursor.executemany(query, all_row_values)
+
+        return added_urls
+
+    @classmethod
+    def _get_existing_url_str_ids(cls, cursor, url_str_ids):
+        '''Return the URL string IDs that are in the ``urls`` table.
+
+        Returns:
+            set
+        '''
+        existing_url_str_ids = set()
+
+        for batch in _iter_batches(url_str_ids):
+            cursor.execute(
+                'SELECT url_str_id FROM urls WHERE url_str_id IN ({0})'
+                .format(_placeholders(batch)),
+                batch
+            )
+            existing_url_str_ids.update(row[0] for row in cursor.fetchall())
+
+        return existing_url_str_ids
+
+    def check_out(self, filter_status, filter_level=None):
+        url_records = self.check_out_many(filter_status, 1, filter_level)
+
+        if not url_records:
+            raise NotFound()
+
+        return url_records[0]
+
+    def check_out_many(self, filter_status, amount, filter_level=None):
+        query = _SELECT_URL_RECORD.replace(
+            'SELECT', 'SELECT urls.id,', 1) + 'WHERE urls.status = ?'
+        params = [filter_status]
+
+        if filter_level is not None:
+            query += ' AND urls.level < ?'
+            params.append(filter_level)
+
+        if filter_status == Status.error:
+            query += ' AND (urls.retry_time IS NULL OR urls.retry_time <= ?)'
+            params.append(time.time())
+
+        query += self._order_by + ' LIMIT ?'
+        params.append(amount)
+
+        with self._transaction() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+            lease_time = time.time()
+            cursor.executemany(
+                'UPDATE urls SET status = ?, lease_time = ? WHERE id = ?',
+                ((Status.in_progress, lease_time, row[0]) for row in rows)
+            )
+
+        return [
+            self._to_url_record(row[1:])._replace(status=Status.in_progress)
+            for row in rows
+        ]
+
+    def get_retry_time(self):
+        with self._transaction() as cursor:
+            cursor.execute(
+                'SELECT min(retry_time) FROM urls WHERE status = ?',
+                (Status.error,)
+            )
+            return cursor.fetchone()[0]
+
+    def release(self, before=None):
+        query = 'UPDATE urls SET status = ? WHERE status = ?'
+        params = [Status.todo, Status.in_progress]
+
+        if before is not None:
+            query += ' AND (lease_time IS NULL OR lease_time < ?)'
+            params.append(before)
+
+        with self._transaction() as cursor:
+            cursor.execute(query, params)
+
+    def renew_leases(self, urls):
+        assert not isinstance(urls, (str, bytes)), \
+            'Expected list-like. Got {}.'.format(urls)
+
+        with self._transaction() as cursor:
+            url_str_ids = self._get_url_str_ids(cursor, urls)
+            lease_time = time.time()
+            cursor.executemany(
+                'UPDATE urls SET lease_time = ? '
+                'WHERE url_str_id = ? AND status = ?',
+                ((lease_time, url_str_id, Status.in_progress)
+                 for url_str_id in url_str_ids.values())
+            )
+
+    def remove_many(self, urls):
+        assert not isinstance(urls, (str, bytes)), \
+            'Expected list-like. Got {}.'.format(urls)
+
+        with self._transaction() as cursor:
+            url_str_ids = self._get_url_str_ids(cursor, urls)
+            cursor.executemany(
+                'DELETE FROM urls WHERE url_str_id = ?',
+                ((url_str_id,) for url_str_id in url_str_ids.values())
+            )
+
+    def close(self):
+        self.flush()
+
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def add_visits(self, visits):
+        with self._transaction() as cursor:
+            cursor.executemany(
+                'INSERT OR IGNORE INTO visits (url, warc_id, payload_digest) '
+                'VALUES (?, ?, ?)',
+                visits
+            )
+
+    def get_revisit_id(self, url, payload_digest):
+        with self._transaction() as cursor:
+            cursor.execute(
+                'SELECT warc_id FROM visits '
+                'WHERE url = ? AND payload_digest = ?',
+                (url, payload_digest)
+            )
+            row = cursor.fetchone()
+
+        if row:
+            return row[0]
+
+
+class FingerprintSQLite3URLTable(SQLite3URLTable):
+    '''URL table keyed by URL fingerprints.
+
+    The ID of each URL string is its :func:`url_fingerprint`, so URL
+    strings are found by the primary key. The text index on the URL
+    strings is not created, which makes the database much smaller for
+    large crawls.
+
+    If the ID is used by a different URL, the next free ID is used
+    instead. URL strings are never deleted, so a lookup follows the
+    consecutive IDs from the fingerprint until the URL or a free ID is
+    found.
+
+    Databases created by this table cannot be used by the other
+    tables, and the reverse.
+    '''
+    url_index = False
+
+    _PROBE_SIZE = 16
+
+    def _get_url_str_ids(self, cursor, urls):
+        return self._find_url_str_ids(cursor, urls)[0]
+
+    def _find_url_str_ids(self, cursor, urls):
+        '''Find the URL strings.
+
+        Returns:
+            tuple: A mapping of URL to ID of the URLs found and a list of
+            the URLs not found whose fingerprint ID is free.
+        '''
+        fingerprints = dict((url, url_fingerprint(url)) for url in set(urls))
+        slot_urls = {}
+
+        for batch in _iter_batches(frozenset(fingerprints.values())):
+            cursor.execute(
+                'SELECT id, url FROM url_strings WHERE id IN ({0})'
+                .format(_placeholders(batch)),
+                batch
+            )
+            slot_urls.update(cursor.fetchall())
+
+        url_str_ids = {}
+        free_urls = []
+
+        for url, fingerprint in fingerprints.items():
+            slot_url = slot_urls.get(fingerprint)
+
+            if slot_url == url:
+                url_str_ids[url] = fingerprint
+            elif slot_url is None:
+                free_urls.append(url)
+            else:
+                url_str_id, found = self._probe(cursor, url, fingerprint)
+
+                if found:
+                    url_str_ids[url] = url_str_id
+
+        return url_str_ids, free_urls
+
+    def _probe(self, cursor, url, fingerprint):
+        '''Follow the IDs after a colliding fingerprint.
+
+        Returns:
+            tuple: The ID and whether it contains the URL. If the URL is
+            not found, the ID is the first free ID.
+        '''
+        _logger.debug(__('Fingerprint collision for {0}.', url))
+
+        url_str_id = fingerprint
+
+        while True:
+            cursor.execute(
+                'SELECT id, url FROM url_strings WHERE id >= ? '
+                'ORDER BY id LIMIT ?',
+                (url_str_id, self._PROBE_SIZE)
+            )
+            rows = cursor.fetchall()
+
+            for row_id, row_url in rows:
+                if row_id != url_str_id:
+                    return url_str_id, False
+                elif row_url == url:
+                    return url_str_id, True
+
+                url_str_id += 1
+
+            if len(rows) < self._PROBE_SIZE:
+                return url_str_id, False
+
+    def _add_url_strings(self, cursor, urls):
+        url_str_ids, free_urls = self._find_url_str_ids(cursor, urls)
+        free_urls = frozenset(free_urls)
+        new_rows = []
+        used_ids = set()
+
+        for url in urls:
+            if url in url_str_ids:
+                continue
+
+            fingerprint = url_fingerprint(url)
+
+            if url in free_urls and fingerprint not in used_ids:
+                url_str_id = fingerprint
+            else:
+                # Rows added in this call are not visible yet
+                cursor.executemany(
+                    'INSERT INTO url_strings (id, url) VALUES (?, ?)',
+                    new_rows
+                )
+                new_rows = []
+                url_str_id, found = self._probe(cursor, url, fingerprint)
+
+                if found:
+                    url_str_ids[url] = url_str_id
+                    continue
+
+            new_rows.append((url_str_id, url))
+            used_ids.add(url_str_id)
+            url_str_ids[url] = url_str_id
+
+        cursor.executemany(
+            'INSERT INTO url_strings (id, url) VALUES (?, ?)', new_rows)
+
+        return url_str_ids
+
+
+__all__ = ('SQLite3URLTable', 'FingerprintSQLite3URLTable', 'url_fingerprint')
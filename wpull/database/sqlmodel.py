@@ -2,8 +2,8 @@
 
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql.schema import Column, ForeignKey
-from sqlalchemy.sql.sqltypes import Integer, Enum, Boolean, String
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
+from sqlalchemy.sql.sqltypes import Integer, Enum, Boolean, String, Float
 import sqlalchemy.ext.declarative
 
 from wpull.item import Status, URLRecord, LinkType
@@ -77,6 +77,32 @@ class URL(DBBase):
     )
     post_data = Column(String, doc='Additional percent-encoded data for POST.')
     filename = Column(String, doc='Local filename of the item.')
+    retry_time = Column(
+        Float,
+        doc='Timestamp before which an item with an error is not '
+            'checked out again.'
+    )
+    lease_time = Column(
+        Float,
+        doc='Timestamp when an item in progress was checked out or its '
+            'lease was last renewed.'
+    )
+    priority = Column(
+        Integer, nullable=False, server_default='0',
+        doc='Items with higher values are checked out first when ordered '
+            'by priority.'
+    )
+
+    __table_args__ = (
+        # Check outs filtered by level seek to the matching rows instead
+        # of scanning every row of the status. SQLite indexes include the
+        # row ID so the status index already orders by ID.
+        Index('ix_urls_status_level', 'status', 'level'),
+        Index('ix_urls_status_retry_time', 'status', 'retry_time'),
+        # Descending so that ties are still ordered by ascending ID.
+        Index('ix_urls_status_inline', 'status', inline.desc()),
+        Index('ix_urls_status_priority', 'status', priority.desc()),
+    )
 
     def to_plain(self):
         return URLRecord(
@@ -1,27 +1,296 @@
 '''SQLAlchemy table implementations.'''
 import abc
+import collections
 import contextlib
+import gettext
 import logging
 import urllib.parse
 import os
+import time
 
 from sqlalchemy.engine import create_engine
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.session import sessionmaker
 from sqlalchemy.pool import SingletonThreadPool
-from sqlalchemy.sql.expression import insert, update, select, and_, delete, \
-    bindparam
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql.expression import insert, update, select, and_, or_, \
+    delete, bindparam
 from sqlalchemy.sql.functions import func
 import sqlalchemy.event
+import sqlalchemy.inspection
 
-from wpull.database.base import BaseURLTable, NotFound
+from wpull.backport.logging import BraceMessage as __
+from wpull.database.base import BaseURLTable, NotFound, STATUSES, \
+    status_counts, CrawlOrder, CRAWL_ORDERS
 from wpull.database.sqlmodel import URL, URLString, Visit, DBBase
 from wpull.item import Status
 
 
 _logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+_URL_COUNT_TRIGGERS = (
+    ('url_counts_insert', '''
+        CREATE TRIGGER url_counts_insert AFTER INSERT ON urls
+        BEGIN
+            UPDATE url_counts SET count = count + 1
+            WHERE status = NEW.status;
+        END
+    '''),
+    ('url_counts_delete', '''
+        CREATE TRIGGER url_counts_delete AFTER DELETE ON urls
+        BEGIN
+            UPDATE url_counts SET count = count - 1
+            WHERE status = OLD.status;
+        END
+    '''),
+    ('url_counts_update', '''
+        CREATE TRIGGER url_counts_update AFTER UPDATE OF status ON urls
+        WHEN OLD.status != NEW.status
+        BEGIN
+            UPDATE url_counts SET count = count - 1
+            WHERE status = OLD.status;
+            UPDATE url_counts SET count = count + 1
+            WHERE status = NEW.status;
+        END
+    '''),
+)
+
+
+def add_column_statement(table, column, dialect):
+    '''Return the SQL statement that adds the column to an existing table.
+
+    Only columns that are nullable or have a server default are added this
+    way.
+    '''
+    assert column.default is None, column.name
+    assert column.nullable or column.server_default is not None, column.name
+
+    return 'ALTER TABLE {0} ADD COLUMN {1}'.format(
+        table.name, CreateColumn(column).compile(dialect=dialect))
+
+
+def create_schema(engine):
+    '''Create the tables and any columns or indexes missing from existing
+    tables.
+
+    Columns and indexes added to the model after a database was created
+    are added here so older ``--database`` files get them too.
+    '''
+    inspector = sqlalchemy.inspection.inspect(engine)
+    table_names = frozenset(inspector.get_table_names())
+
+    DBBase.metadata.create_all(engine)
+
+    for table in DBBase.metadata.sorted_tables:
+        if table.name not in table_names:
+            continue
+
+        column_names = frozenset(
+            column_info['name']
+            for column_info in inspector.get_columns(table.name)
+        )
+
+        for column in table.columns:
+            if column.name not in column_names:
+                _logger.debug(__('Adding column {0}.{1}.',
+                                 table.name, column.name))
+                engine.execute(
+                    add_column_statement(table, column, engine.dialect))
+
+        index_names = frozenset(
+            index_info['name']
+            for index_info in inspector.get_indexes(table.name)
+        )
+
+        for index in table.indexes:
+            if index.name not in index_names:
+                _logger.info(__(
+                    _('Creating database index {name}. '
+                      'This may take a while.'),
+                    name=index.name
+                ))
+                index.create(engine)
+
+
+def create_sqlite_url_counts(connection):
+    '''Create the SQLite table of URL counts for each status.
+
+    The counts are maintained by triggers on the ``urls`` table so they
+    are updated in the same transaction as the rows. If the triggers are
+    missing, such as in a database created by an older version, the counts
+    are computed once from the ``urls`` table.
+
+    Args:
+        connection: A connection or cursor with an ``execute`` method that
+            accepts a SQL string. The caller commits.
+    '''
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS url_counts ('
+        'status VARCHAR NOT NULL PRIMARY KEY, '
+        'count INTEGER NOT NULL DEFAULT 0)'
+    )
+
+    for status in STATUSES:
+        connection.execute(
+            "INSERT OR IGNORE INTO url_counts (status, count) "
+            "VALUES ('{0}', 0)".format(status)
+        )
+
+    rows = connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    trigger_names = frozenset(row[0] for row in rows)
+
+    if all(name in trigger_names for name, dummy in _URL_COUNT_TRIGGERS):
+        return
+
+    _logger.debug('Creating URL count triggers.')
+
+    for name, statement in _URL_COUNT_TRIGGERS:
+        if name not in trigger_names:
+            connection.execute(statement)
 
+    connection.execute(
+        'UPDATE url_counts SET count = '
+        '(SELECT count(*) FROM urls WHERE urls.status = url_counts.status)'
+    )
+
+
+class WriteBehindMixin(object):
+    '''Buffer calls to :meth:`check_in` and :meth:`update_one`.
+
+    Args:
+        write_behind_size (int): The number of calls to :meth:`check_in` and
+            :meth:`update_one` to buffer before they are written. Use ``1``
+            to write each call immediately.
+        write_behind_delay (float): The maximum age in seconds of a buffered
+            call before the next table operation writes it.
+
+    Buffered updates for the same URL are merged and written in the same
+    transaction as the next table operation, such as :meth:`add_many` or
+    :meth:`check_out`, so reads always see them. The updates are written
+    in order and atomically. If the process is interrupted, only the
+    newest updates are lost: their URLs remain ``in_progress`` and are
+    fetched again on resume, which is the same outcome as losing the last
+    transactions under ``synchronous=NORMAL``.
+
+    Subclasses write the updates returned by :meth:`_pop_pending_updates`
+    at the start of each transaction and implement :meth:`flush`.
+    '''
+    def __init__(self, write_behind_size=1, write_behind_delay=0.005):
+        super().__init__()
+        assert write_behind_size > 0, \
+            'Expect positive size. Got {}.'.format(write_behind_size)
+        self._write_behind_size = write_behind_size
+        self._write_behind_delay = write_behind_delay
+        self._pending_updates = collections.OrderedDict()
+        self._pending_count = 0
+        self._pending_time = None
+
+    def check_in(self, url, new_status, increment_try_count=True, **kwargs):
+        values = dict(kwargs)
+        values['status'] = new_status
+
+        self._queue_update(url, values, 1 if increment_try_count else 0)
+
+    def update_one(self, url, **kwargs):
+        self._queue_update(url, kwargs)
+
+    def _queue_update(self, url, values, try_count_increment=0):
+        '''Buffer an update for the URL.'''
+        for name in values:
+            # Check the column exists now instead of on write
+            getattr(URL, name)
+
+        if not self._pending_updates:
+            self._pending_time = time.time()
+
+        if url in self._pending_updates:
+            pending_values, pending_increment = self._pending_updates[url]
+            pending_values.update(values)
+            self._pending_updates[url] = (
+                pending_values, pending_increment + try_count_increment
+            )
+        else:
+            self._pending_updates[url] = (dict(values), try_count_increment)
+
+        self._pending_count += 1
+
+        if self._pending_count >= self._write_behind_size or \
+                time.time() - self._pending_time >= self._write_behind_delay:
+            self.flush()
+
+    def _pop_pending_updates(self):
+        '''Remove and return the buffered updates.'''
+        pending_updates = self._pending_updates
+        self._pending_updates = collections.OrderedDict()
+        self._pending_count = 0
+
+        return pending_updates
+
+    def _restore_pending_updates(self, pending_updates):
+        '''Put back updates that failed to be written.'''
+        for url, (values, try_count_increment) in \
+                self._pending_updates.items():
+            if url in pending_updates:
+                pending_values, pending_increment = pending_updates[url]
+                pending_values.update(values)
+                pending_updates[url] = (
+                    pending_values, pending_increment + try_count_increment
+                )
+            else:
+                pending_updates[url] = (values, try_count_increment)
+
+        self._pending_updates = pending_updates
+        self._pending_count = len(pending_updates)
+
+    @classmethod
+    def _group_pending_updates(cls, pending_updates):
+        '''Group the updates by the columns changed.
+
+        Returns:
+            dict: Each key is a tuple of the column names and whether the
+            try count is incremented. Each value is a list of parameter
+            dicts using the keys ``_url``, ``_try_count_increment``, and
+            ``_value_`` followed by the column name.
+        '''
+        groups = collections.OrderedDict()
+
+        for url, (values, try_count_increment) in pending_updates.items():
+            key = (tuple(sorted(values.keys())), bool(try_count_increment))
+            row_values = dict(
+                ('_value_' + name, value) for name, value in values.items()
+            )
+            row_values['_url'] = url
+            row_values['_try_count_increment'] = try_count_increment
+
+            groups.setdefault(key, []).append(row_values)
+
+        return groups
+
+
+_CRAWL_ORDER_CLAUSES = {
+    CrawlOrder.default: (),
+    CrawlOrder.breadth_first: (URL.level, URL.id),
+    CrawlOrder.depth_first: (URL.level.desc(), URL.id.desc()),
+    CrawlOrder.inline_first: (URL.inline.desc(), URL.id),
+    CrawlOrder.priority: (URL.priority.desc(), URL.id),
+}
+'''Mapping of crawl orders to the ORDER BY clauses of check outs.'''
+
+
+class BaseSQLURLTable(WriteBehindMixin, BaseURLTable):
+    '''Base class for SQLAlchemy URL tables.
+
+    Args:
+        crawl_order (str): A value from :class:`.database.base.CrawlOrder`.
+        kwargs: Arguments passed to :class:`WriteBehindMixin`.
+    '''
+    def __init__(self, crawl_order=CrawlOrder.default, **kwargs):
+        super().__init__(**kwargs)
+        assert crawl_order in CRAWL_ORDERS, crawl_order
+        self._order_by = _CRAWL_ORDER_CLAUSES[crawl_order]
 
-class BaseSQLURLTable(BaseURLTable):
     @abc.abstractproperty
     def _session_maker(self):
         pass
@@ -31,19 +300,68 @@ class BaseSQLURLTable(BaseURLTable):
         """Provide a transactional scope around a series of operations."""
         # Taken from the session docs.
         session = self._session_maker()
+        pending_updates = self._pop_pending_updates()
+
         try:
+            self._write_updates(session, pending_updates)
             yield session
             session.commit()
         except:
             session.rollback()
+            self._restore_pending_updates(pending_updates)
             raise
         finally:
             session.close()
 
+    def flush(self):
+        '''Write any buffered updates.'''
+        if self._pending_updates:
+            with self._session():
+                pass
+
+    @classmethod
+    def _write_updates(cls, session, pending_updates):
+        '''Execute the buffered updates.'''
+        if not pending_updates:
+            return
+
+        _logger.debug(__('Writing {0} buffered updates.',
+                         len(pending_updates)))
+
+        groups = cls._group_pending_updates(pending_updates)
+
+        for (names, increment_try_count), all_row_values in groups.items():
+            bind_values = dict(
+                (getattr(URL, name), bindparam('_value_' + name))
+                for name in names
+            )
+
+            if increment_try_count:
+                bind_values[URL.try_count] = \
+                    URL.try_count + bindparam('_try_count_increment')
+
+            if not bind_values:
+                continue
+
+            subquery = select([URLString.id])\
+                .where(URLString.url == bindparam('_url'))\
+                .limit(1)
+            query = update(URL).values(bind_values)\
+                .where(URL.url_str_id == subquery)
+
+            session.execute(query, all_row_values)
+
     def count(self):
         with self._session() as session:
             return session.query(URL).count()
 
+    def count_by_status(self):
+        with self._session() as session:
+            rows = session.query(URL.status, func.count(URL.id))\
+                .group_by(URL.status).all()
+
+        return status_counts(rows)
+
     def get_one(self, url):
         with self._session() as session:
             result = session.query(URL).filter_by(url=url).first()
@@ -63,6 +381,7 @@ class BaseSQLURLTable(BaseURLTable):
             'Expected a list-like. Got {}'.format(new_urls)
         referrer = kwargs.pop('referrer', None)
         top_url = kwargs.pop('top_url', None)
+        kwargs.pop('absent_urls', None)
 
         new_urls = tuple(new_urls)
 
@@ -125,65 +444,96 @@ class BaseSQLURLTable(BaseURLTable):
 
         return added_urls
 
+    @classmethod
+    def _filter_retry_time(cls, query, filter_status):
+        '''Exclude items with errors that are waiting to be retried.'''
+        if filter_status == Status.error:
+            query = query.filter(or_(
+                URL.retry_time == None,  # NOQA
+                URL.retry_time <= time.time()
+            ))
+
+        return query
+
     def check_out(self, filter_status, level=None):
         with self._session() as session:
-            if level is None:
-                url_record = session.query(URL).filter_by(
-                    status=filter_status).first()
-            else:
-                url_record = session.query(URL)\
-                    .filter(
-                        URL.status == filter_status,
-                        URL.level < level,
-                ).first()
+            query = session.query(URL).filter(URL.status == filter_status)
+
+            if level is not None:
+                query = query.filter(URL.level < level)
+
+            query = self._filter_retry_time(query, filter_status)
+            url_record = query.order_by(*self._order_by).first()
 
             if not url_record:
                 raise NotFound()
 
             url_record.status = Status.in_progress
+            url_record.lease_time = time.time()
 
             return url_record.to_plain()
 
-    def check_in(self, url, new_status, increment_try_count=True, **kwargs):
+    def check_out_many(self, filter_status, amount, filter_level=None):
         with self._session() as session:
-            values = {
-                URL.status: new_status
-            }
-
-            for key, value in kwargs.items():
-                values[getattr(URL, key)] = value
+            query = session.query(URL)\
+                .options(
+                    joinedload(URL.url_str_record),
+                    joinedload(URL.top_url_record),
+                    joinedload(URL.referrer_record),
+                )\
+                .filter(URL.status == filter_status)
+
+            if filter_level is not None:
+                query = query.filter(URL.level < filter_level)
+
+            query = self._filter_retry_time(query, filter_status)\
+                .order_by(*self._order_by)
+            url_records = []
+            lease_time = time.time()
+
+            for url_record in query.limit(amount):
+                url_record.status = Status.in_progress
+                url_record.lease_time = lease_time
+                url_records.append(url_record.to_plain())
+
+            return url_records
+
+    def get_retry_time(self):
+        with self._session() as session:
+            return session.query(func.min(URL.retry_time))\
+                .filter(URL.status == Status.error).scalar()
 
-            if increment_try_count:
-                values[URL.try_count] = URL.try_count + 1
+    def release(self, before=None):
+        with self._session() as session:
+            query = update(URL).values({URL.status: Status.todo})\
+                .where(URL.status==Status.in_progress)
 
-            # TODO: rewrite as a join for clarity
-            subquery = select([URLString.id]).where(URLString.url == url)\
-                .limit(1)
-            query = update(URL).values(values)\
-                .where(URL.url_str_id == subquery)
+            if before is not None:
+                query = query.where(or_(
+                    URL.lease_time == None,  # NOQA
+                    URL.lease_time < before
+                ))
 
             session.execute(query)
 
-    def update_one(self, url, **kwargs):
-        with self._session() as session:
-            values = {}
+    def renew_leases(self, urls):
+        assert not isinstance(urls, (str, bytes)), \
+            'Expected list-like. Got {}.'.format(urls)
 
-            for key, value in kwargs.items():
-                values[getattr(URL, key)] = value
+        if not urls:
+            return
 
-            # TODO: rewrite as a join for clarity
-            subquery = select([URLString.id]).where(URLString.url == url)\
+        with self._session() as session:
+            subquery = select([URLString.id])\
+                .where(URLString.url == bindparam('_url'))\
                 .limit(1)
-            query = update(URL).values(values)\
-                .where(URL.url_str_id == subquery)
-
-            session.execute(query)
+            query = update(URL).values({URL.lease_time: time.time()})\
+                .where(and_(
+                    URL.url_str_id == subquery,
+                    URL.status == Status.in_progress
+                ))
 
-    def release(self):
-        with self._session() as session:
-            query = update(URL).values({URL.status: Status.todo})\
-                .where(URL.status==Status.in_progress)
-            session.execute(query)
+            session.execute(query, [{'_url': url} for url in urls])
 
     def remove_many(self, urls):
         assert not isinstance(urls, (str, bytes)), \
@@ -228,9 +578,13 @@ class SQLiteURLTable(BaseSQLURLTable):
 
     Args:
         path: A SQLite filename
+        kwargs: Arguments passed to :class:`BaseSQLURLTable`.
+
+    The number of URLs for each status is kept in a counter table so
+    :meth:`count` and :meth:`count_by_status` do not scan the table.
     '''
-    def __init__(self, path=':memory:'):
-        super().__init__()
+    def __init__(self, path=':memory:', **kwargs):
+        super().__init__(**kwargs)
         # We use a SingletonThreadPool always because we are using WAL
         # and want SQLite to handle the checkpoints. Otherwise NullPool
         # will open and close the connection rapidly, defeating the purpose
@@ -240,7 +594,11 @@ class SQLiteURLTable(BaseSQLURLTable):
             'sqlite:///{0}'.format(escaped_path), poolclass=SingletonThreadPool)
         sqlalchemy.event.listen(
             self._engine, 'connect', self._apply_pragmas_callback)
-        DBBase.metadata.create_all(self._engine)
+        create_schema(self._engine)
+
+        with self._engine.begin() as connection:
+            create_sqlite_url_counts(connection)
+
         self._session_maker_instance = sessionmaker(bind=self._engine)
 
     @classmethod
@@ -257,7 +615,18 @@ class SQLiteURLTable(BaseSQLURLTable):
     def _session_maker(self):
         return self._session_maker_instance
 
+    def count(self):
+        return sum(self.count_by_status().values())
+
+    def count_by_status(self):
+        with self._session() as session:
+            rows = session.execute(
+                'SELECT status, count FROM url_counts').fetchall()
+
+        return status_counts(rows)
+
     def close(self):
+        self.flush()
         self._engine.dispose()
 
 
@@ -266,11 +635,12 @@ class GenericSQLURLTable(BaseSQLURLTable):
 
     Args:
         url: A SQLAlchemy database URL.
+        kwargs: Arguments passed to :class:`BaseSQLURLTable`.
     '''
-    def __init__(self, url):
-        super().__init__()
+    def __init__(self, url, **kwargs):
+        super().__init__(**kwargs)
         self._engine = create_engine(url)
-        DBBase.metadata.create_all(self._engine)
+        create_schema(self._engine)
         self._session_maker_instance = sessionmaker(bind=self._engine)
 
     @property
@@ -278,6 +648,7 @@ class GenericSQLURLTable(BaseSQLURLTable):
         return self._session_maker_instance
 
     def close(self):
+        self.flush()
         self._engine.dispose()
 
 
@@ -286,5 +657,6 @@ URLTable = SQLiteURLTable
 
 
 __all__ = (
-    'BaseSQLURLTable', 'SQLiteURLTable', 'GenericSQLURLTable', 'URLTable'
+    'WriteBehindMixin', 'BaseSQLURLTable', 'SQLiteURLTable', 'GenericSQLURLTable', 'URLTable',
+    'add_column_statement', 'create_schema', 'create_sqlite_url_counts',
 )
@@ -1,12 +1,19 @@
 # encoding=utf-8
 
 
+import contextlib
+import os.path
+import sqlite3
+import tempfile
 import time
 import unittest
 
+from wpull.database.sqlite3_ import SQLite3URLTable, \
+    FingerprintSQLite3URLTable
+import wpull.database.sqlite3_
 from wpull.database.sqltable import SQLiteURLTable
 from wpull.item import Status
-from wpull.database.base import NotFound
+from wpull.database.base import NotFound, DatabaseError, CrawlOrder
 
 
 class TestDatabase(unittest.TestCase):
@@ -14,6 +21,29 @@ class TestDatabase(unittest.TestCase):
         url_table = SQLiteURLTable(':memory:')
         self._generic_url_table_tester(url_table)
 
+    def test_sqlite_url_table_write_behind(self):
+        url_table = SQLiteURLTable(
+            ':memory:', write_behind_size=100, write_behind_delay=60)
+        self._generic_url_table_tester(url_table)
+
+    def test_sqlite3_url_table(self):
+        url_table = SQLite3URLTable(':memory:')
+        self._generic_url_table_tester(url_table)
+
+    def test_sqlite3_url_table_write_behind(self):
+        url_table = SQLite3URLTable(
+            ':memory:', write_behind_size=100, write_behind_delay=60)
+        self._generic_url_table_tester(url_table)
+
+    def test_fingerprint_url_table(self):
+        url_table = FingerprintSQLite3URLTable(':memory:')
+        self._generic_url_table_tester(url_table)
+
+    def test_fingerprint_url_table_write_behind(self):
+        url_table = FingerprintSQLite3URLTable(
+            ':memory:', write_behind_size=100, write_behind_delay=60)
+        self._generic_url_table_tester(url_table)
+
     def _generic_url_table_tester(self, url_table):
         urls = [
             'http://example.com',
@@ -87,6 +117,481 @@ class TestDatabase(unittest.TestCase):
             url_table.get_revisit_id('http://example.com/asdf', 'digest123')
         )
 
+    def test_check_out_many(self):
+        self._check_out_many_tester(SQLiteURLTable(':memory:'))
+
+    def test_sqlite3_check_out_many(self):
+        self._check_out_many_tester(SQLite3URLTable(':memory:'))
+
+    def test_fingerprint_check_out_many(self):
+        self._check_out_many_tester(FingerprintSQLite3URLTable(':memory:'))
+
+    def _check_out_many_tester(self, url_table):
+        urls = ['http://example.com/{}'.format(num) for num in range(10)]
+
+        url_table.add_many(
+            [{'url': url} for url in urls[:5]],
+            referrer='http://example.com', top_url='http://example.net',
+            level=1
+        )
+        url_table.add_many([{'url': url} for url in urls[5:]], level=2)
+
+        url_records = url_table.check_out_many(Status.todo, 3)
+
+        self.assertEqual(urls[:3], [record.url for record in url_records])
+
+        for url_record in url_records:
+            self.assertEqual(Status.in_progress, url_record.status)
+            self.assertEqual('http://example.com', url_record.referrer)
+            self.assertEqual('http://example.net', url_record.top_url)
+            self.assertEqual(
+                Status.in_progress, url_table.get_one(url_record.url).status)
+
+        url_records = url_table.check_out_many(Status.todo, 10, 2)
+
+        self.assertEqual(urls[3:5], [record.url for record in url_records])
+
+        url_records = url_table.check_out_many(Status.todo, 10)
+
+        self.assertEqual(urls[5:], [record.url for record in url_records])
+        self.assertFalse(url_table.check_out_many(Status.todo, 10))
+
+        url_table.release()
+
+        self.assertEqual(10, len(url_table.check_out_many(Status.todo, 20)))
+
+    def test_retry_time(self):
+        self._retry_time_tester(SQLiteURLTable(':memory:'))
+
+    def test_sqlite3_retry_time(self):
+        self._retry_time_tester(SQLite3URLTable(':memory:'))
+
+    def test_fingerprint_retry_time(self):
+        self._retry_time_tester(FingerprintSQLite3URLTable(':memory:'))
+
+    def _retry_time_tester(self, url_table):
+        urls = ['http://example.com/{}'.format(num) for num in range(3)]
+        url_table.add_many([{'url': url} for url in urls])
+        url_table.check_out_many(Status.todo, 3)
+
+        self.assertIsNone(url_table.get_retry_time())
+
+        retry_time = time.time() + 1000
+        url_table.check_in(urls[0], Status.error, retry_time=retry_time)
+        url_table.check_in(urls[1], Status.error,
+                           retry_time=time.time() - 1)
+        url_table.check_in(urls[2], Status.error)
+
+        url_records = url_table.check_out_many(Status.error, 10)
+
+        self.assertEqual(urls[1:], [record.url for record in url_records])
+        self.assertRaises(NotFound, url_table.check_out, Status.error)
+        self.assertAlmostEqual(retry_time, url_table.get_retry_time())
+
+        url_table.update_one(urls[0], retry_time=time.time())
+
+        self.assertEqual(urls[0], url_table.check_out(Status.error).url)
+        self.assertEqual(1, url_table.get_one(urls[0]).try_count)
+
+        url_table.check_in(urls[0], Status.done)
+
+        self.assertIsNone(url_table.get_retry_time())
+
+    def test_lease(self):
+        self._lease_tester(SQLiteURLTable(':memory:'))
+
+    def test_sqlite3_lease(self):
+        self._lease_tester(SQLite3URLTable(':memory:'))
+
+    def test_fingerprint_lease(self):
+        self._lease_tester(FingerprintSQLite3URLTable(':memory:'))
+
+    def _lease_tester(self, url_table):
+        urls = ['http://example.com/{}'.format(num) for num in range(4)]
+        url_table.add_many([{'url': url} for url in urls])
+        url_table.check_out_many(Status.todo, 2)
+        checkout_time = time.time()
+        time.sleep(0.01)
+        url_table.check_out_many(Status.todo, 2)
+        url_table.check_in(urls[3], Status.done)
+
+        url_table.release(before=checkout_time)
+
+        self.assertEqual(
+            [Status.todo, Status.todo, Status.in_progress, Status.done],
+            [url_table.get_one(url).status for url in urls]
+        )
+
+        url_table.check_out_many(Status.todo, 2)
+        renew_time = time.time()
+        time.sleep(0.01)
+        url_table.renew_leases(urls[1:])
+        url_table.release(before=renew_time)
+
+        self.assertEqual(
+            [Status.todo, Status.in_progress, Status.in_progress,
+             Status.done],
+            [url_table.get_one(url).status for url in urls]
+        )
+
+        url_table.release()
+
+        self.assertEqual(
+            [Status.todo, Status.todo, Status.todo, Status.done],
+            [url_table.get_one(url).status for url in urls]
+        )
+
+    def test_crawl_order(self):
+        self._crawl_order_tester(SQLiteURLTable)
+
+    def test_sqlite3_crawl_order(self):
+        self._crawl_order_tester(SQLite3URLTable)
+
+    def test_fingerprint_crawl_order(self):
+        self._crawl_order_tester(FingerprintSQLite3URLTable)
+
+    def _crawl_order_tester(self, url_table_class):
+        expected_urls = {
+            CrawlOrder.default: ['/', '/a', '/a.css', '/b', '/a/c'],
+            CrawlOrder.breadth_first: ['/', '/a', '/a.css', '/b', '/a/c'],
+            CrawlOrder.depth_first: ['/a/c', '/b', '/a.css', '/a', '/'],
+            CrawlOrder.inline_first: ['/a.css', '/', '/a', '/b', '/a/c'],
+            CrawlOrder.priority: ['/b', '/', '/a', '/a.css', '/a/c'],
+        }
+
+        for crawl_order, paths in expected_urls.items():
+            url_table = url_table_class(':memory:', crawl_order=crawl_order)
+            url_table.add_one({'url': 'http://example.com/'})
+            url_table.add_one({'url': 'http://example.com/a'}, level=1)
+            url_table.add_one({'url': 'http://example.com/a.css'}, level=1,
+                              inline=1)
+            url_table.add_many([
+                {'url': 'http://example.com/b', 'priority': 1},
+                {'url': 'http://example.com/a/c', 'priority': -1},
+            ], level=2)
+
+            url_records = url_table.check_out_many(Status.todo, 10)
+
+            self.assertEqual(
+                ['http://example.com' + path for path in paths],
+                [url_record.url for url_record in url_records],
+                crawl_order
+            )
+
+            url_table.close()
+
+    def test_count_by_status(self):
+        self._count_by_status_tester(SQLiteURLTable(':memory:'))
+
+    def test_sqlite3_count_by_status(self):
+        self._count_by_status_tester(SQLite3URLTable(
+            ':memory:', write_behind_size=100, write_behind_delay=60))
+
+    def test_fingerprint_count_by_status(self):
+        self._count_by_status_tester(FingerprintSQLite3URLTable(':memory:'))
+
+    def _count_by_status_tester(self, url_table):
+        urls = ['http://example.com/{}'.format(num) for num in range(10)]
+
+        self.assertEqual(0, url_table.count())
+        self.assertEqual(
+            {Status.todo: 0, Status.in_progress: 0, Status.done: 0,
+             Status.error: 0, Status.skipped: 0},
+            url_table.count_by_status()
+        )
+
+        url_table.add_many([{'url': url} for url in urls])
+        url_table.add_many([{'url': url} for url in urls[:5]])
+
+        self.assertEqual(10, url_table.count())
+        self.assertEqual(10, url_table.count_by_status()[Status.todo])
+
+        url_records = url_table.check_out_many(Status.todo, 4)
+        url_table.check_in(url_records[0].url, Status.done)
+        url_table.check_in(url_records[1].url, Status.error)
+        url_table.update_one(url_records[2].url, status=Status.skipped)
+        url_table.update_one(url_records[2].url, status_code=200)
+
+        counts = url_table.count_by_status()
+
+        self.assertEqual(6, counts[Status.todo])
+        self.assertEqual(1, counts[Status.in_progress])
+        self.assertEqual(1, counts[Status.done])
+        self.assertEqual(1, counts[Status.error])
+        self.assertEqual(1, counts[Status.skipped])
+
+        url_table.release()
+        url_table.remove_many([urls[0], urls[9]])
+
+        counts = url_table.count_by_status()
+
+        self.assertEqual(8, url_table.count())
+        self.assertEqual(6, counts[Status.todo])
+        self.assertEqual(0, counts[Status.done])
+        self.assertEqual(0, counts[Status.in_progress])
+        self.assertEqual(8, sum(counts.values()))
+
+    def test_count_by_status_migration(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'wpull.db')
+            url_table = SQLite3URLTable(path)
+
+            url_table.add_many([{'url': 'http://example.com/1'},
+                                {'url': 'http://example.com/2'}])
+            url_table.check_in('http://example.com/1', Status.done)
+
+            # Simulate a database from a version without counters
+            with url_table.connection as connection:
+                connection.execute('DROP TRIGGER url_counts_insert')
+                connection.execute('DELETE FROM url_counts')
+
+            url_table.close()
+
+            url_table = SQLiteURLTable(path)
+            counts = url_table.count_by_status()
+
+            self.assertEqual(1, counts[Status.todo])
+            self.assertEqual(1, counts[Status.done])
+
+            url_table.add_one({'url': 'http://example.com/3'})
+
+            self.assertEqual(2, url_table.count_by_status()[Status.todo])
+            self.assertEqual(3, url_table.count())
+            url_table.close()
+
+    def test_write_behind(self):
+        url_table = SQLiteURLTable(
+            ':memory:', write_behind_size=4, write_behind_delay=60)
+        urls = ['http://example.com/{}'.format(num) for num in range(3)]
+
+        url_table.add_many([{'url': url} for url in urls])
+        url_table.check_out_many(Status.todo, 3)
+
+        url_table.update_one(urls[0], status_code=200)
+        url_table.check_in(urls[0], Status.done, filename='a')
+        url_table.check_in(urls[1], Status.error)
+
+        self.assertEqual(2, len(url_table._pending_updates))
+
+        url_table.check_in(urls[1], Status.done, filename='b')
+
+        self.assertFalse(url_table._pending_updates)
+
+        url_table.check_in(urls[2], Status.done, increment_try_count=False)
+
+        self.assertEqual(1, len(url_table._pending_updates))
+
+        url_record = url_table.get_one(urls[0])
+        self.assertEqual(Status.done, url_record.status)
+        self.assertEqual(200, url_record.status_code)
+        self.assertEqual('a', url_record.filename)
+        self.assertEqual(1, url_record.try_count)
+
+        url_record = url_table.get_one(urls[1])
+        self.assertEqual(Status.done, url_record.status)
+        self.assertEqual('b', url_record.filename)
+        self.assertEqual(2, url_record.try_count)
+
+        url_record = url_table.get_one(urls[2])
+        self.assertEqual(Status.done, url_record.status)
+        self.assertEqual(0, url_record.try_count)
+        self.assertFalse(url_table._pending_updates)
+
+    def test_write_behind_close(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'wpull.db')
+            url_table = SQLiteURLTable(
+                path, write_behind_size=100, write_behind_delay=60)
+
+            url_table.add_one({'url': 'http://example.com/'})
+            url_table.check_out(Status.todo)
+            url_table.check_in('http://example.com/', Status.done)
+            url_table.close()
+
+            url_table = SQLiteURLTable(path)
+            url_record = url_table.get_one('http://example.com/')
+
+            self.assertEqual(Status.done, url_record.status)
+            self.assertEqual(1, url_record.try_count)
+            url_table.close()
+
+    def test_sqlite3_compatible(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'wpull.db')
+            url_table = SQLiteURLTable(path)
+
+            url_table.add_many(
+                [{'url': 'http://example.com/1', 'inline': 1},
+                 {'url': 'http://example.com/2', 'inline': None}],
+                referrer='http://example.com/', level=1)
+            url_table.check_out(Status.todo)
+            url_table.check_in('http://example.com/1', Status.done,
+                               status_code=200)
+            url_table.close()
+
+            url_table = SQLite3URLTable(path)
+
+            self.assertEqual(
+                ['http://example.com/3'],
+                url_table.add_many([{'url': 'http://example.com/2'},
+                                    {'url': 'http://example.com/3'},
+                                    {'url': 'http://example.com/3'}])
+            )
+
+            url_record = url_table.get_one('http://example.com/1')
+
+            self.assertEqual(Status.done, url_record.status)
+            self.assertEqual(200, url_record.status_code)
+            self.assertEqual(1, url_record.inline)
+            self.assertEqual(1, url_record.level)
+            self.assertEqual('http://example.com/', url_record.referrer)
+
+            url_table.remove_one('http://example.com/2')
+            url_table.close()
+
+            url_table = SQLiteURLTable(path)
+
+            self.assertEqual(
+                ['http://example.com/1', 'http://example.com/3'],
+                [url_record.url for url_record in url_table.get_all()]
+            )
+            self.assertEqual(
+                Status.todo, url_table.get_one('http://example.com/3').status)
+            url_table.close()
+
+    def test_index_migration(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for url_table_class in (SQLiteURLTable, SQLite3URLTable):
+                path = os.path.join(
+                    temp_dir, '{}.db'.format(url_table_class.__name__))
+                url_table = SQLite3URLTable(path)
+                url_table.add_one({'url': 'http://example.com/'}, level=3)
+
+                # Simulate a database from a version without the index
+                with url_table.connection as connection:
+                    connection.execute('DROP INDEX ix_urls_status_level')
+
+                url_table.close()
+
+                url_table = url_table_class(path)
+                url_table.close()
+
+                with contextlib.closing(sqlite3.connect(path)) as connection:
+                    rows = connection.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'index'"
+                    ).fetchall()
+
+                self.assertIn('ix_urls_status_level',
+                              [row[0] for row in rows])
+
+                url_table = url_table_class(path)
+                self.assertRaises(NotFound, url_table.check_out,
+                                  Status.todo, 3)
+                self.assertEqual(
+                    'http://example.com/',
+                    url_table.check_out(Status.todo, 4).url
+                )
+                url_table.close()
+
+    @unittest.skipIf(sqlite3.sqlite_version_info < (3, 35),
+                     'SQLite cannot drop columns')
+    def test_column_migration(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for url_table_class in (SQLiteURLTable, SQLite3URLTable):
+                path = os.path.join(
+                    temp_dir, '{}.db'.format(url_table_class.__name__))
+                url_table = SQLite3URLTable(path)
+                url_table.add_one({'url': 'http://example.com/'})
+
+                # Simulate a database from a version without the column
+                with url_table.connection as connection:
+                    connection.execute('DROP INDEX ix_urls_status_retry_time')
+                    connection.execute('DROP INDEX ix_urls_status_priority')
+                    connection.execute(
+                        'ALTER TABLE urls DROP COLUMN retry_time')
+                    connection.execute(
+                        'ALTER TABLE urls DROP COLUMN priority')
+                    connection.execute(
+                        'ALTER TABLE urls DROP COLUMN lease_time')
+
+                url_table.close()
+
+                url_table = url_table_class(
+                    path, crawl_order=CrawlOrder.priority)
+                url_table.add_one({'url': 'http://example.com/2'},
+                                  priority=-1)
+                url_table.add_one({'url': 'http://example.com/1'},
+                                  priority=1)
+
+                self.assertEqual(
+                    ['http://example.com/1', 'http://example.com/',
+                     'http://example.com/2'],
+                    [url_record.url for url_record in
+                     url_table.check_out_many(Status.todo, 3)]
+                )
+
+                url_table.check_in('http://example.com/', Status.error,
+                                   retry_time=1234.5)
+
+                self.assertEqual(1234.5, url_table.get_retry_time())
+                url_table.close()
+
+    def test_fingerprint_collision(self):
+        original_func = wpull.database.sqlite3_.url_fingerprint
+
+        def url_fingerprint(url):
+            return original_func(url) % 4
+
+        wpull.database.sqlite3_.url_fingerprint = url_fingerprint
+
+        try:
+            url_table = FingerprintSQLite3URLTable(':memory:')
+            urls = ['http://example.com/{}'.format(num) for num in range(20)]
+
+            self.assertEqual(
+                urls[:10],
+                url_table.add_many([{'url': url} for url in urls[:10]],
+                                   referrer='http://example.com/')
+            )
+            self.assertEqual(
+                urls[10:],
+                url_table.add_many([{'url': url} for url in urls],
+                                   referrer='http://example.com/')
+            )
+            self.assertEqual(20, url_table.count())
+
+            for url in urls:
+                url_table.check_in(url, Status.done, status_code=200)
+
+            for url in urls:
+                url_record = url_table.get_one(url)
+                self.assertEqual(url, url_record.url)
+                self.assertEqual(Status.done, url_record.status)
+                self.assertEqual('http://example.com/', url_record.referrer)
+
+            self.assertRaises(NotFound, url_table.get_one,
+                              'http://example.com/nope')
+
+            url_table.remove_one(urls[3])
+
+            self.assertFalse(url_table.contains(urls[3]))
+            self.assertTrue(url_table.contains(urls[4]))
+            self.assertEqual(19, url_table.count())
+        finally:
+            wpull.database.sqlite3_.url_fingerprint = original_func
+
+    def test_fingerprint_schema_mismatch(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'wpull.db')
+            FingerprintSQLite3URLTable(path).close()
+
+            self.assertRaises(DatabaseError, SQLite3URLTable, path)
+
+            path = os.path.join(temp_dir, 'wpull2.db')
+            SQLite3URLTable(path).close()
+
+            self.assertRaises(DatabaseError, FingerprintSQLite3URLTable, path)
+
     @unittest.skip('travis ci is slow')
     def test_performance(self):
         url_table = SQLiteURLTable(':memory:')
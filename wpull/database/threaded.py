@@ -0,0 +1,183 @@
+'''URL table running on a dedicated thread.'''
+import concurrent.futures
+import functools
+import itertools
+import logging
+
+from trollius import From, Return
+import trollius
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.database.base import BaseURLTable
+
+
+_logger = logging.getLogger(__name__)
+
+
+class ThreadedURLTable(BaseURLTable):
+    '''URL table that executes database work on a dedicated thread.
+
+    Args:
+        url_table_factory: A callable that returns a
+            :class:`.database.base.BaseURLTable`. It is called on the
+            database thread so the table and its connection are owned by
+            that thread.
+        get_all_batch_size (int): The number of records fetched at a time
+            by :meth:`get_all`.
+
+    Every call is executed in order on the single database thread. The
+    ``_async`` coroutine methods wait for the result without blocking the
+    event loop.
+
+    :meth:`check_in` and :meth:`update_one` do not wait for the database
+    since they do not return a value. Because all work is ordered on one
+    thread, later calls observe their changes. If one of them fails, the
+    error is raised by the next call that waits for the database.
+
+    Attributes:
+        url_table: The wrapped URL table.
+    '''
+    def __init__(self, url_table_factory, get_all_batch_size=1000):
+        super().__init__()
+        self._executor = None
+        self._error = None
+        self._get_all_batch_size = get_all_batch_size
+        self.url_table = self._call(url_table_factory)
+
+    def _get_executor(self):
+        if not self._executor:
+            self._executor = concurrent.futures.ThreadPoolExecutor(1)
+
+        return self._executor
+
+    def _raise_error(self):
+        if self._error:
+            error = self._error
+            self._error = None
+            raise error
+
+    def _call(self, func, *args, **kwargs):
+        '''Run the function on the database thread and wait for it.'''
+        future = self._get_executor().submit(func, *args, **kwargs)
+        result = future.result()
+        self._raise_error()
+        return result
+
+    def _call_nowait(self, func, *args, **kwargs):
+        '''Queue the function on the database thread.'''
+        future = self._get_executor().submit(func, *args, **kwargs)
+        future.add_done_callback(self._nowait_done_callback)
+
+    def _nowait_done_callback(self, future):
+        error = future.exception()
+
+        if error:
+            _logger.debug(__('Database call failed: {0}', error))
+
+            if not self._error:
+                self._error = error
+
+    @trollius.coroutine
+    def _call_async(self, func, *args, **kwargs):
+        '''Run the function on the database thread.
+
+        Coroutine.
+        '''
+        event_loop = trollius.get_event_loop()
+        result = yield From(event_loop.run_in_executor(
+            self._get_executor(), functools.partial(func, *args, **kwargs)
+        ))
+        self._raise_error()
+        raise Return(result)
+
+    def count(self):
+        return self._call(self.url_table.count)
+
+    def count_by_status(self):
+        return self._call(self.url_table.count_by_status)
+
+    def get_one(self, url):
+        return self._call(self.url_table.get_one, url)
+
+    def get_all(self):
+        iterator = self._call(iter, self.url_table.get_all())
+
+        while True:
+            url_records = self._call(
+                lambda: tuple(
+                    itertools.islice(iterator, self._get_all_batch_size))
+            )
+
+            if not url_records:
+                break
+
+            for url_record in url_records:
+                yield url_record
+
+    def add_many(self, urls, **kwargs):
+        return self._call(self.url_table.add_many, tuple(urls), **kwargs)
+
+    @trollius.coroutine
+    def add_many_async(self, urls, **kwargs):
+        added_urls = yield From(
+            self._call_async(self.url_table.add_many, tuple(urls), **kwargs))
+        raise Return(added_urls)
+
+    def check_out(self, filter_status, filter_level=None):
+        return self._call(self.url_table.check_out, filter_status,
+                          filter_level)
+
+    def check_out_many(self, filter_status, amount, filter_level=None):
+        return self._call(self.url_table.check_out_many, filter_status,
+                          amount, filter_level)
+
+    @trollius.coroutine
+    def check_out_many_async(self, filter_status, amount, filter_level=None):
+        url_records = yield From(self._call_async(
+            self.url_table.check_out_many, filter_status, amount,
+            filter_level))
+        raise Return(url_records)
+
+    def check_in(self, url, new_status, increment_try_count=True, **kwargs):
+        self._call_nowait(
+            self.url_table.check_in, url, new_status,
+            increment_try_count=increment_try_count, **kwargs)
+
+    def get_retry_time(self):
+        return self._call(self.url_table.get_retry_time)
+
+    @trollius.coroutine
+    def get_retry_time_async(self):
+        retry_time = yield From(
+            self._call_async(self.url_table.get_retry_time))
+        raise Return(retry_time)
+
+    def update_one(self, url, **kwargs):
+        self._call_nowait(self.url_table.update_one, url, **kwargs)
+
+    def release(self, before=None):
+        return self._call(self.url_table.release, before=before)
+
+    def renew_leases(self, urls):
+        self._call_nowait(self.url_table.renew_leases, tuple(urls))
+
+    def remove_many(self, urls):
+        return self._call(self.url_table.remove_many, tuple(urls))
+
+    def flush(self):
+        return self._call(self.url_table.flush)
+
+    def close(self):
+        '''Close the table and stop the database thread.'''
+        try:
+            self._call(self.url_table.close)
+        finally:
+            if self._executor:
+                self._executor.shutdown()
+                self._executor = None
+
+    def add_visits(self, visits):
+        return self._call(self.url_table.add_visits, visits)
+
+    def get_revisit_id(self, url, payload_digest):
+        return self._call(self.url_table.get_revisit_id, url, payload_digest)
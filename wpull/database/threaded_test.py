@@ -0,0 +1,95 @@
+# encoding=utf-8
+import threading
+
+from trollius import From
+
+from wpull.database.base import NotFound
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.database.threaded import ThreadedURLTable
+from wpull.item import Status
+from wpull.testing.async import AsyncTestCase
+import wpull.testing.async
+
+
+class TestThreaded(AsyncTestCase):
+    @wpull.testing.async.async_test()
+    def test_threaded_url_table(self):
+        url_table = ThreadedURLTable(
+            lambda: SQLiteURLTable(':memory:', write_behind_size=10))
+        urls = ['http://example.com/{}'.format(num) for num in range(5)]
+
+        added_urls = yield From(
+            url_table.add_many_async([{'url': url} for url in urls], level=0))
+
+        self.assertEqual(urls, list(added_urls))
+        self.assertEqual(5, url_table.count())
+
+        url_record = url_table.check_out(Status.todo)
+
+        self.assertEqual(urls[0], url_record.url)
+
+        url_table.update_one(url_record.url, status_code=200)
+        url_table.check_in(url_record.url, Status.done)
+
+        url_records = yield From(
+            url_table.check_out_many_async(Status.todo, 10))
+
+        self.assertEqual(urls[1:], [record.url for record in url_records])
+
+        url_table.check_in(urls[1], Status.error)
+
+        url_record = url_table.get_one(urls[0])
+        self.assertEqual(Status.done, url_record.status)
+        self.assertEqual(200, url_record.status_code)
+        self.assertEqual(1, url_record.try_count)
+        self.assertEqual(Status.error, url_table.get_one(urls[1]).status)
+
+        self.assertEqual(urls, [record.url for record in url_table.get_all()])
+
+        url_table.add_visits([('http://example.com/1', 'id123', 'digest123')])
+
+        warc_id = url_table.get_revisit_id(
+            'http://example.com/1', 'digest123')
+
+        self.assertEqual('id123', warc_id)
+
+        url_table.close()
+
+    def test_single_thread(self):
+        thread_idents = set()
+        test_case = self
+
+        class MockURLTable(SQLiteURLTable):
+            def __init__(self):
+                super().__init__(':memory:')
+                thread_idents.add(threading.get_ident())
+
+            def check_in(self, *args, **kwargs):
+                thread_idents.add(threading.get_ident())
+                super().check_in(*args, **kwargs)
+
+            def check_out(self, *args, **kwargs):
+                thread_idents.add(threading.get_ident())
+                return super().check_out(*args, **kwargs)
+
+        url_table = ThreadedURLTable(MockURLTable)
+        url_table.add_one({'url': 'http://example.com/'})
+
+        url_record = url_table.check_out(Status.todo)
+        url_table.check_in(url_record.url, Status.done)
+
+        test_case.assertRaises(NotFound, url_table.check_out, Status.todo)
+        test_case.assertEqual(1, len(thread_idents))
+        test_case.assertNotIn(threading.get_ident(), thread_idents)
+
+        url_table.close()
+
+    def test_nowait_error(self):
+        url_table = ThreadedURLTable(lambda: SQLiteURLTable(':memory:'))
+
+        url_table.update_one('http://example.com/', bad_column=1)
+
+        self.assertRaises(AttributeError, url_table.count)
+        self.assertEqual(0, url_table.count())
+
+        url_table.close()
@@ -1,6 +1,9 @@
 '''URL table wrappers.'''
+from trollius import From, Return
+import trollius
+
 from wpull.database.base import BaseURLTable
-from wpull.hook import HookableMixin, HookDisconnected
+from wpull.hook import HookableMixin
 from wpull.url import parse_url_or_log
 from wpull.item import Status
 
@@ -10,15 +13,21 @@ class URLTableHookWrapper(BaseURLTable, HookableMixin):
 
     Args:
         url_table: URL table.
+        seen_filter: A :class:`.collections.BloomFilter` containing the
+            URLs in the table. URLs it reports as absent are passed to
+            :meth:`add_many` as ``absent_urls`` so the table can skip
+            looking them up. All URLs still reach the table.
 
     Attributes:
         url_table: URL table.
     '''
 
-    def __init__(self, url_table):
+    def __init__(self, url_table, seen_filter=None):
         super().__init__()
         self.url_table = url_table
         self._queue_counter = 0
+        self._seen_filter = seen_filter
+        self._seen_filter_absent_count = 0
 
         self.register_hook('queued_url', 'dequeued_url')
 
@@ -26,9 +35,17 @@ class URLTableHookWrapper(BaseURLTable, HookableMixin):
         '''Return the number of URLs queued in this session.'''
         return self._queue_counter
 
+    @property
+    def seen_filter_absent_count(self):
+        '''Return the number of URLs the seen URL filter reported absent.'''
+        return self._seen_filter_absent_count
+
     def count(self):
         return self.url_table.count()
 
+    def count_by_status(self):
+        return self.url_table.count_by_status()
+
     def get_one(self, url):
         return self.url_table.get_one(url)
 
@@ -36,8 +53,51 @@ class URLTableHookWrapper(BaseURLTable, HookableMixin):
         return self.url_table.get_all()
 
     def add_many(self, urls, **kwargs):
+        urls = list(urls)
+
+        if not urls:
+            return ()
+
+        self._check_seen_urls(urls, kwargs)
         added_urls = tuple(self.url_table.add_many(urls, **kwargs))
+        self._call_queued_url_hooks(added_urls)
+        return added_urls
+
+    @trollius.coroutine
+    def add_many_async(self, urls, **kwargs):
+        urls = list(urls)
+
+        if not urls:
+            raise Return(())
+
+        self._check_seen_urls(urls, kwargs)
+        added_urls = tuple((yield From(
+            self.url_table.add_many_async(urls, **kwargs))))
+        self._call_queued_url_hooks(added_urls)
+        raise Return(added_urls)
+
+    def _check_seen_urls(self, urls, kwargs):
+        '''Add the URLs to the filter and pass those that were absent.
+
+        Only negative answers are used. A URL reported as present may be a
+        false positive so the table decides whether it is new.
+        '''
+        if self._seen_filter is None or self._seen_filter.is_full():
+            return
+
+        seen_filter = self._seen_filter
+        absent_urls = set()
+
+        for item in urls:
+            url = item['url']
+
+            if seen_filter.add(url):
+                absent_urls.add(url)
 
+        self._seen_filter_absent_count += len(absent_urls)
+        kwargs['absent_urls'] = absent_urls
+
+    def _call_queued_url_hooks(self, added_urls):
         if self.is_hook_connected('queued_url'):
             for url in added_urls:
                 url_info = parse_url_or_log(url)
@@ -45,38 +105,68 @@ class URLTableHookWrapper(BaseURLTable, HookableMixin):
                     self._queue_counter += 1
                     self.call_hook('queued_url', url_info)
 
-        return added_urls
-
     def check_out(self, *args, **kwargs):
         url_record = self.url_table.check_out(*args, **kwargs)
-        self._queue_counter -= 1
+        self._call_dequeued_url_hooks([url_record])
+        return url_record
 
-        try:
-            self.call_hook('dequeued_url', url_record.url_info, url_record)
-        except HookDisconnected:
-            pass
+    def check_out_many(self, *args, **kwargs):
+        url_records = self.url_table.check_out_many(*args, **kwargs)
+        self._call_dequeued_url_hooks(url_records)
+        return url_records
 
-        return url_record
+    @trollius.coroutine
+    def check_out_many_async(self, *args, **kwargs):
+        url_records = yield From(
+            self.url_table.check_out_many_async(*args, **kwargs))
+        self._call_dequeued_url_hooks(url_records)
+        raise Return(url_records)
+
+    def _call_dequeued_url_hooks(self, url_records):
+        self._queue_counter -= len(url_records)
+
+        if self.is_hook_connected('dequeued_url'):
+            for url_record in url_records:
+                self.call_hook(
+                    'dequeued_url', url_record.url_info, url_record)
 
     def check_in(self, url, new_status, *args, **kwargs):
-        if new_status == Status.error and self.is_hook_connected('queued_url'):
+        self._call_requeued_url_hook(url, new_status)
+        return self.url_table.check_in(url, new_status, *args, **kwargs)
+
+    def _call_requeued_url_hook(self, url, new_status):
+        # Items put back as todo were checked out but not processed, such
+        # as those released from the engine's prefetch buffer
+        if new_status in (Status.error, Status.todo) and \
+                self.is_hook_connected('queued_url'):
             self._queue_counter += 1
             url_info = parse_url_or_log(url)
 
             if url_info:
                 self.call_hook('queued_url', url_info)
 
-        return self.url_table.check_in(url, new_status, *args, **kwargs)
+    def get_retry_time(self):
+        return self.url_table.get_retry_time()
+
+    @trollius.coroutine
+    def get_retry_time_async(self):
+        raise Return((yield From(self.url_table.get_retry_time_async())))
 
     def update_one(self, *args, **kwargs):
         return self.url_table.update_one(*args, **kwargs)
 
-    def release(self):
-        return self.url_table.release()
+    def release(self, before=None):
+        return self.url_table.release(before=before)
+
+    def renew_leases(self, urls):
+        return self.url_table.renew_leases(urls)
 
     def remove_many(self, urls):
         return self.url_table.remove_many(urls)
 
+    def flush(self):
+        return self.url_table.flush()
+
     def close(self):
         return self.url_table.close()
 
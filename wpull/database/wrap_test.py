@@ -0,0 +1,112 @@
+# encoding=utf-8
+import unittest
+
+from wpull.collections import BloomFilter
+from wpull.database.sqlite3_ import SQLite3URLTable
+from wpull.database.wrap import URLTableHookWrapper
+from wpull.item import Status
+
+
+class MockURLTable(SQLite3URLTable):
+    def __init__(self):
+        super().__init__(':memory:')
+        self.added_urls = []
+        self.absent_urls = []
+
+    def add_many(self, new_urls, **kwargs):
+        new_urls = tuple(new_urls)
+        self.added_urls.extend(item['url'] for item in new_urls)
+        self.absent_urls.append(kwargs.get('absent_urls'))
+        return super().add_many(new_urls, **kwargs)
+
+
+class TestWrap(unittest.TestCase):
+    def test_check_in_todo(self):
+        wrapper = URLTableHookWrapper(MockURLTable())
+        queued_urls = []
+        dequeued_urls = []
+
+        wrapper.connect_hook(
+            'queued_url', lambda url_info: queued_urls.append(url_info.url))
+        wrapper.connect_hook(
+            'dequeued_url',
+            lambda url_info, url_record: dequeued_urls.append(url_info.url))
+
+        wrapper.add_many([
+            {'url': 'http://example.com/1'},
+            {'url': 'http://example.com/2'},
+        ])
+        url_records = wrapper.check_out_many(Status.todo, 2)
+
+        self.assertEqual(0, wrapper.queue_count())
+        self.assertEqual(2, len(dequeued_urls))
+
+        for url_record in url_records:
+            wrapper.check_in(
+                url_record.url, Status.todo, increment_try_count=False)
+
+        self.assertEqual(2, wrapper.queue_count())
+        self.assertEqual(
+            ['http://example.com/1', 'http://example.com/2'] * 2,
+            queued_urls)
+
+    def test_seen_filter(self):
+        url_table = MockURLTable()
+        seen_filter = BloomFilter(1000)
+        wrapper = URLTableHookWrapper(url_table, seen_filter=seen_filter)
+
+        added_urls = wrapper.add_many([
+            {'url': 'http://example.com/1'},
+            {'url': 'http://example.com/2'},
+        ])
+
+        self.assertEqual(
+            ('http://example.com/1', 'http://example.com/2'), added_urls)
+        self.assertEqual(
+            {'http://example.com/1', 'http://example.com/2'},
+            url_table.absent_urls[-1])
+        self.assertIn('http://example.com/2', seen_filter)
+
+        self.assertFalse(wrapper.add_many([{'url': 'http://example.com/2'}]))
+        self.assertEqual(
+            ['http://example.com/1', 'http://example.com/2',
+             'http://example.com/2'],
+            url_table.added_urls)
+        self.assertFalse(url_table.absent_urls[-1])
+        self.assertEqual(2, wrapper.seen_filter_absent_count)
+
+        wrapper.remove_one('http://example.com/2')
+
+        self.assertEqual(
+            ('http://example.com/2',),
+            wrapper.add_many([{'url': 'http://example.com/2'}])
+        )
+        self.assertEqual(Status.todo,
+                         wrapper.get_one('http://example.com/2').status)
+
+    def test_seen_filter_false_positive(self):
+        url_table = MockURLTable()
+        seen_filter = BloomFilter(1000)
+        seen_filter.add('http://example.com/1')
+        wrapper = URLTableHookWrapper(url_table, seen_filter=seen_filter)
+
+        added_urls = wrapper.add_many([{'url': 'http://example.com/1'}])
+
+        self.assertEqual(('http://example.com/1',), added_urls)
+        self.assertFalse(url_table.absent_urls[-1])
+        self.assertEqual(Status.todo,
+                         wrapper.get_one('http://example.com/1').status)
+
+    def test_seen_filter_full(self):
+        url_table = MockURLTable()
+        seen_filter = BloomFilter(10, 0.01)
+        wrapper = URLTableHookWrapper(url_table, seen_filter=seen_filter)
+
+        for num in range(100):
+            seen_filter.add('http://example.com/{}'.format(num))
+
+        self.assertTrue(seen_filter.is_full())
+
+        wrapper.add_many([{'url': 'http://example.com/1'}])
+
+        self.assertEqual(['http://example.com/1'], url_table.added_urls)
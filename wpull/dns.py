@@ -1,16 +1,18 @@
 # encoding=utf-8
 '''DNS resolution.'''
+import functools
 import itertools
 import logging
 import random
 import socket
+import time
 
 from trollius import From, Return
 import trollius
 import dns.resolver
 
 from wpull.backport.logging import BraceMessage as __
-from wpull.cache import FIFOCache
+from wpull.cache import LRUCache
 from wpull.errors import DNSNotFound, NetworkError
 from wpull.hook import HookableMixin, HookDisconnected
 import wpull.util
@@ -36,8 +38,19 @@ class Resolver(HookableMixin):
             specified, this class relies on the underlying libraries.
         rotate (bool): If True and multiple addresses are resolved, randomly
             pick one.
-
-    The cache holds 100 items and items expire after 1 hour.
+        cache_size (int): The number of hosts to cache. The least recently
+            used hosts are discarded first.
+        time_to_live (float): The time in seconds results are cached. If the
+            DNS records have a shorter TTL, it is used instead.
+        negative_time_to_live (float): The time in seconds hosts that do
+            not exist are cached.
+
+    Concurrent lookups of the same host share a single lookup.
+
+    Attributes:
+        cache_hit_count (int): Number of lookups answered by the cache or
+            by a lookup in progress.
+        cache_miss_count (int): Number of lookups sent to the network.
     '''
     PREFER_IPv4 = 'prefer_ipv4'
     '''Prefer IPv4 addresses.'''
@@ -45,20 +58,26 @@ class Resolver(HookableMixin):
     '''Prefer IPv6 addresses.'''
 
     def __init__(self, cache_enabled=True, family=PREFER_IPv4,
-                 timeout=None, rotate=False):
+                 timeout=None, rotate=False, cache_size=1000,
+                 time_to_live=3600, negative_time_to_live=60):
         super().__init__()
         assert family in (socket.AF_INET, socket.AF_INET6, self.PREFER_IPv4,
                           self.PREFER_IPv6, None), \
             'Unknown family {}.'.format(family)
 
         if cache_enabled:
-            self._cache = FIFOCache(max_items=100, time_to_live=3600)
+            self._cache = LRUCache(max_items=cache_size)
         else:
             self._cache = None
 
         self._family = family
         self._timeout = timeout
         self._rotate = rotate
+        self._time_to_live = time_to_live
+        self._negative_time_to_live = negative_time_to_live
+        self._lookup_tasks = {}
+        self.cache_hit_count = 0
+        self.cache_miss_count = 0
 
         self.register_hook('resolve_dns')
 
@@ -78,16 +97,11 @@ class Resolver(HookableMixin):
         _logger.debug(__('Lookup address {0} {1}.', host, port))
 
         host = self._lookup_hook(host, port)
-        results = None
-
-        if self._cache:
-            results = self._get_cache(host, port, self._family)
 
-        if results is None:
-            results = yield From(self._resolve_from_network(host, port))
-
-        if self._cache:
-            self._put_cache(host, port, results)
+        if self._cache is None:
+            results, dummy = yield From(self._resolve_from_network(host, port))
+        else:
+            results = yield From(self._resolve_from_cache(host, port))
 
         if not results:
             raise DNSNotFound(
@@ -181,12 +195,84 @@ class Resolver(HookableMixin):
 
         return host
 
+    @property
+    def cache_hit_rate(self):
+        '''Return the fraction of lookups answered without the network.'''
+        count = self.cache_hit_count + self.cache_miss_count
+
+        if count:
+            return self.cache_hit_count / count
+        else:
+            return 0.0
+
+    @trollius.coroutine
+    def _resolve_from_cache(self, host, port):
+        '''Resolve the address using the cache or else the network.
+
+        A lookup in progress for the same address is shared.
+
+        Returns:
+            list: A list of tuples. The list is empty if the host does not
+            exist.
+        '''
+        key = (host, port, self._family)
+        results = self._get_cache(host, port, self._family)
+
+        if results is not None:
+            self.cache_hit_count += 1
+            raise Return(results)
+
+        task = self._lookup_tasks.get(key)
+
+        if task:
+            self.cache_hit_count += 1
+        else:
+            self.cache_miss_count += 1
+            task = trollius.async(self._resolve_and_cache(host, port))
+            self._lookup_tasks[key] = task
+            task.add_done_callback(
+                functools.partial(self._lookup_task_done, key))
+
+        # Shielded so a cancelled caller does not cancel the others.
+        results = yield From(trollius.shield(task))
+
+        raise Return(results)
+
+    def _lookup_task_done(self, key, task):
+        del self._lookup_tasks[key]
+
+        if not task.cancelled():
+            # Mark the exception as retrieved if every caller went away.
+            task.exception()
+
+    @trollius.coroutine
+    def _resolve_and_cache(self, host, port):
+        '''Resolve the address using network and cache the results.'''
+        try:
+            results, time_to_live = \
+                yield From(self._resolve_from_network(host, port))
+        except DNSNotFound:
+            self._put_cache(host, port, [], self._negative_time_to_live)
+            raise
+
+        if not results:
+            time_to_live = self._negative_time_to_live
+        elif time_to_live is None:
+            time_to_live = self._time_to_live
+        else:
+            time_to_live = min(time_to_live, self._time_to_live)
+
+        self._put_cache(host, port, results, time_to_live)
+
+        raise Return(results)
+
     @trollius.coroutine
     def _resolve_from_network(self, host, port):
         '''Resolve the address using network.
 
         Returns:
-            list: A list of tuples.
+            tuple: A list of tuples and the TTL in seconds of the results
+            or None if unknown.
         '''
         _logger.debug(
             'Resolving {0} {1} {2}.'.format(host, port, self._family)
@@ -205,9 +291,10 @@ class Resolver(HookableMixin):
         '''The resolver implementation.
 
         Returns:
-            list: A list of tuples.
+            tuple: A list of tuples and the TTL in seconds of the results
+            or None if unknown.
 
-            Each tuple contains:
+            Each tuple in the list contains:
 
             1. Family (``AF_INET`` or ``AF_INET6``).
             2. Address (tuple): At least two values which are
@@ -248,7 +335,7 @@ class Resolver(HookableMixin):
         if self._family in (self.PREFER_IPv4, self.PREFER_IPv6):
             results = self.sort_results(results, self._family)
 
-        raise Return(results)
+        raise Return((results, None))
 
     def _get_cache(self, host, port, family):
         '''Return the address from cache.
@@ -263,12 +350,58 @@ class Resolver(HookableMixin):
         key = (host, port, family)
 
         if key in self._cache:
-            return self._cache[key]
+            results, expire_time = self._cache[key]
+
+            if expire_time > time.time():
+                return results
 
-    def _put_cache(self, host, port, results):
+    def _put_cache(self, host, port, results, time_to_live):
         '''Put the address in the cache.'''
         key = (host, port, self._family)
-        self._cache[key] = results
+        self._cache[key] = (results, time.time() + time_to_live)
+
+    def get_cache_entries(self):
+        '''Return the cached results.
+
+        Returns:
+            list: A list of tuples containing the host, the port, the
+            family, the results, and the expire time.
+        '''
+        if not self._cache:
+            return []
+
+        time_now = time.time()
+        entries = []
+
+        for key in self._cache:
+            results, expire_time = self._cache.peek(key)
+
+            if results and expire_time > time_now:
+                entries.append(key + (results, expire_time))
+
+        return entries
+
+    def load_cache_entries(self, entries):
+        '''Put the results returned by :meth:`get_cache_entries` in the
+        cache.
+
+        Expired results are ignored.
+        '''
+        if self._cache is None:
+            return
+
+        time_now = time.time()
+
+        for host, port, family, results, expire_time in \
+                sorted(entries, key=lambda entry: entry[4]):
+            if expire_time <= time_now:
+                continue
+
+            key = (host, port, family)
+            self._cache[key] = ([
+                (result_family, tuple(address))
+                for result_family, address in results
+            ], expire_time)
 
     @classmethod
     def sort_results(cls, results, preference):
@@ -300,6 +433,7 @@ class PythonResolver(Resolver):
         event_loop = trollius.get_event_loop()
 
         results = []
+        time_to_lives = []
 
         def query_ipv4():
             answers = yield From(event_loop.run_in_executor(
@@ -309,6 +443,9 @@ class PythonResolver(Resolver):
                 (socket.AF_INET, (answer.address, port)) for answer in answers
             )
 
+            if answers:
+                time_to_lives.append(answers.ttl)
+
         def query_ipv6():
             answers = yield From(event_loop.run_in_executor(
                 None, self._query, host, 'AAAA'
@@ -317,6 +454,9 @@ class PythonResolver(Resolver):
                 (socket.AF_INET6, (answer.address, port)) for answer in answers
             )
 
+            if answers:
+                time_to_lives.append(answers.ttl)
+
         if self._family == socket.AF_INET:
             try:
                 yield From(query_ipv4())
@@ -342,9 +482,11 @@ class PythonResolver(Resolver):
 
         if not results:
             # Maybe defined in hosts file or mDNS
-            results = yield From(super()._getaddrinfo_implementation(host, port))
+            result = yield From(
+                super()._getaddrinfo_implementation(host, port))
+            raise Return(result)
 
-        raise Return(results)
+        raise Return((results, min(time_to_lives)))
 
     def _query(self, host, query_type):
         try:
@@ -1,7 +1,8 @@
 # encoding=utf-8
 import socket
+import time
 
-from trollius import From
+from trollius import From, Return
 import trollius
 
 from wpull.dns import Resolver, PythonResolver
@@ -16,7 +17,28 @@ class MockFaultyResolver(Resolver):
     @trollius.coroutine
     def _resolve_from_network(self, host, port):
         yield From(trollius.sleep(2))
-        yield From(Resolver._resolve_from_network(self, host, port))
+        result = yield From(Resolver._resolve_from_network(self, host, port))
+        raise Return(result)
+
+
+class MockNetworkResolver(Resolver):
+    def __init__(self, *args, **kwargs):
+        Resolver.__init__(self, *args, **kwargs)
+        self.hosts = []
+        self.record_time_to_live = None
+
+    @trollius.coroutine
+    def _getaddrinfo_implementation(self, host, port):
+        self.hosts.append(host)
+        yield From(trollius.sleep(0.01))
+
+        if host == 'bad.example':
+            raise DNSNotFound('Not found.')
+
+        raise Return(
+            ([(socket.AF_INET, ('127.0.0.1', port))],
+             self.record_time_to_live)
+        )
 
 
 class DNSMixin:
@@ -146,3 +168,73 @@ class TestDNSPython(DNSMixin, wpull.testing.async.AsyncTestCase):
     def test_resolver_hyphen(self):
         resolver = self.get_resolver_class()()
         yield From(resolver.resolve('-kol.deviantart.com', 80))
+
+
+class TestDNSCache(wpull.testing.async.AsyncTestCase):
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_single_flight(self):
+        resolver = MockNetworkResolver()
+
+        results = yield From(trollius.gather(
+            resolver.resolve('a.example', 80),
+            resolver.resolve('a.example', 80),
+        ))
+        result = yield From(resolver.resolve('a.example', 80))
+
+        self.assertEqual(['a.example'], resolver.hosts)
+        self.assertEqual(results[0], result)
+        self.assertEqual(results[1], result)
+        self.assertEqual(2, resolver.cache_hit_count)
+        self.assertEqual(1, resolver.cache_miss_count)
+        self.assertAlmostEqual(2 / 3, resolver.cache_hit_rate)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_negative_cache(self):
+        resolver = MockNetworkResolver(negative_time_to_live=0.1)
+
+        for dummy in range(2):
+            with self.assertRaises(DNSNotFound):
+                yield From(resolver.resolve('bad.example', 80))
+
+        self.assertEqual(['bad.example'], resolver.hosts)
+        self.assertEqual([], resolver.get_cache_entries())
+
+        yield From(trollius.sleep(0.2))
+
+        with self.assertRaises(DNSNotFound):
+            yield From(resolver.resolve('bad.example', 80))
+
+        self.assertEqual(['bad.example', 'bad.example'], resolver.hosts)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_record_time_to_live(self):
+        resolver = MockNetworkResolver()
+        resolver.record_time_to_live = 0.1
+
+        yield From(resolver.resolve('a.example', 80))
+        yield From(resolver.resolve('a.example', 80))
+
+        self.assertEqual(['a.example'], resolver.hosts)
+
+        entries = resolver.get_cache_entries()
+
+        self.assertEqual(1, len(entries))
+        self.assertLess(entries[0][4], time.time() + 1)
+
+        yield From(trollius.sleep(0.2))
+        yield From(resolver.resolve('a.example', 80))
+
+        self.assertEqual(['a.example', 'a.example'], resolver.hosts)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_cache_size(self):
+        resolver = MockNetworkResolver(cache_size=2)
+
+        for host in ('a.example', 'b.example', 'a.example', 'c.example',
+                     'a.example', 'b.example'):
+            yield From(resolver.resolve(host, 80))
+
+        self.assertEqual(
+            ['a.example', 'b.example', 'c.example', 'b.example'],
+            resolver.hosts
+        )
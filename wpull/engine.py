@@ -1,21 +1,20 @@
 # encoding=utf-8
 '''Item queue management and processing.'''
 import abc
+import collections
 import contextlib
 import gettext
 import logging
 import os
-import itertools
+import time
 
 from trollius import From, Return
 import trollius
 
 from wpull.backport.logging import BraceMessage as __
-from wpull.database.base import NotFound
 from wpull.hook import HookableMixin, HookDisconnected
 from wpull.item import Status, URLItem
 from wpull.url import parse_url_or_log
-import wpull.string
 
 
 _logger = logging.getLogger(__name__)
@@ -218,8 +217,38 @@ class Engine(BaseEngine, HookableMixin):
             compute the exit status.
         concurrent (int): The number of items to process at once.
         ignore_exceptions(bool): Whether to ignore exceptions.
-        resource_monitor (:class:`.app.resource_monitor`): Use resource
-            monitor to pause processing items if resources exceeded.
+        resource_monitor (:class:`.resmon.ResourceMonitor`): Use resource
+            monitor to pause handing out items while resources are
+            exceeded. The monitor samples in the background while the
+            engine runs.
+        frontier (:class:`.frontier.HostFrontier`): If provided, items are
+            buffered in the frontier and scheduled per host.
+        prefetch_size (int): The number of items to check out from the
+            URL table at once. Items checked out but not yet processed are
+            put back when the engine stops.
+        seed_loader (:class:`.seed.SeedLoader`): If provided, the input URLs
+            are loaded while the engine runs. The engine does not stop
+            while URLs are still being loaded.
+        delayed_retries (bool): If True, items with errors are checked out
+            as soon as their retry time passes instead of after all the
+            "todo" items.
+        concurrency_controller (:class:`.concurrency.ConcurrencyController`):
+            If provided, the duration and status of each item is reported
+            to the controller which adjusts the concurrency and the
+            per-host limits of the frontier.
+        circuit_breaker (:class:`.circuit.CircuitBreaker`): If provided,
+            items of hosts whose circuits are open are not processed but
+            checked in as errors to be tried after the cool-down.
+        lease_timeout (float): If provided, only items checked out longer
+            than this many seconds ago are put back on start so other
+            processes sharing the URL table keep theirs. The leases of
+            items checked out by the engine are renewed while it runs and
+            expired leases of other processes are put back.
+        checkpoint (:class:`.checkpoint.Checkpoint`): If provided, the
+            checkpoint is loaded on start and saved while the engine runs.
+        prefetcher (:class:`.prefetch.HostPrefetcher`): If provided, the
+            hosts of checked out items are resolved and connected to
+            before the items are processed.
 
     The engine is described like the following:
 
@@ -235,7 +264,11 @@ class Engine(BaseEngine, HookableMixin):
     '''
 
     def __init__(self, url_table, processor, statistics,
-                 concurrent=1, ignore_exceptions=False, resource_monitor=None):
+                 concurrent=1, ignore_exceptions=False, resource_monitor=None,
+                 frontier=None, prefetch_size=50, seed_loader=None,
+                 delayed_retries=False, concurrency_controller=None,
+                 circuit_breaker=None, lease_timeout=None,
+                 checkpoint=None, prefetcher=None):
         super().__init__()
 
         self._url_table = url_table
@@ -243,9 +276,28 @@ class Engine(BaseEngine, HookableMixin):
         self._statistics = statistics
         self._ignore_exceptions = ignore_exceptions
         self._resource_monitor = resource_monitor
+        self._frontier = frontier
+        self._prefetch_size = prefetch_size
+        self._prefetch_buffer = collections.deque()
+        self._finished_count = 0
         self._num_worker_busy = 0
+        self._seed_loader = seed_loader
+        self._seed_task = None
+        self._delayed_retries = delayed_retries
+        self._concurrency_controller = concurrency_controller
+        self._circuit_breaker = circuit_breaker
+        self._retry_wait_event = trollius.Event()
+        self._lease_timeout = lease_timeout
+        self._leased_urls = set()
+        self._lease_task = None
+        self._checkpoint = checkpoint
+        self._prefetcher = prefetcher
 
         self._set_concurrent(concurrent)
+
+        if concurrency_controller:
+            concurrency_controller.change_observer.add(
+                self._apply_concurrency_change)
         self.register_hook('engine_run')
 
     @property
@@ -257,6 +309,13 @@ class Engine(BaseEngine, HookableMixin):
         '''Set concurrency value.'''
         self._set_concurrent(value)
 
+    def _apply_concurrency_change(self, hostname, value):
+        '''Apply a decision of the concurrency controller.'''
+        if hostname is None:
+            self.set_concurrent(value)
+        elif self._frontier is not None:
+            self._frontier.set_host_concurrent(hostname, value)
+
     @trollius.coroutine
     def __call__(self):
         '''Run the engine.
@@ -275,86 +334,328 @@ class Engine(BaseEngine, HookableMixin):
             pass
 
         self._release_in_progress()
-        yield From(self._run_workers())
+
+        if self._resource_monitor:
+            self._resource_monitor.start()
+
+        if self._lease_timeout:
+            self._lease_task = trollius.async(self._run_lease_renewal())
+
+        if self._checkpoint:
+            self._checkpoint.start()
+
+        try:
+            yield From(self._start_seed_loader())
+            yield From(self._run_workers())
+        finally:
+            yield From(self._stop_seed_loader())
+
+            if self._resource_monitor:
+                self._resource_monitor.stop()
+
+            if self._lease_task:
+                self._lease_task.cancel()
+                self._lease_task = None
+
+            if self._checkpoint:
+                self._checkpoint.stop()
+
+            if self._prefetcher:
+                self._prefetcher.close()
+
+            self._release_prefetched()
 
     def _release_in_progress(self):
-        '''Release any items in progress.'''
+        '''Release any items in progress.
+
+        With a lease timeout, only the items whose leases expired are
+        released.
+        '''
         _logger.debug('Release in-progress.')
-        self._url_table.release()
+
+        if self._lease_timeout:
+            self._url_table.release(before=time.time() - self._lease_timeout)
+        else:
+            self._url_table.release()
+
+    @trollius.coroutine
+    def _run_lease_renewal(self):
+        '''Renew the leases of the items checked out by the engine.
+
+        Expired leases of other processes are released at the same time.
+
+        Coroutine.
+        '''
+        while True:
+            yield From(trollius.sleep(self._lease_timeout / 3))
+
+            _logger.debug(__('Renew {0} leases.', len(self._leased_urls)))
+
+            if self._leased_urls:
+                self._url_table.renew_leases(tuple(self._leased_urls))
+
+            self._release_in_progress()
+
+    @trollius.coroutine
+    def _start_seed_loader(self):
+        '''Start loading the input URLs.
+
+        If the loader does not allow an early start, wait until loading is
+        finished.
+
+        Coroutine.
+        '''
+        if self._seed_loader is None:
+            return
+
+        self._seed_task = trollius.async(self._seed_loader.load())
+
+        if not self._seed_loader.early_start:
+            yield From(trollius.wait([self._seed_task]))
+            self._seed_task.result()
+
+    @trollius.coroutine
+    def _stop_seed_loader(self):
+        '''Cancel loading the input URLs if it is not finished.
+
+        Coroutine.
+        '''
+        if self._seed_task and not self._seed_task.done():
+            _logger.debug('Cancel loading input URLs.')
+            self._seed_task.cancel()
+            yield From(trollius.wait([self._seed_task]))
+
+    def _is_seed_loading(self):
+        '''Return whether input URLs are still being loaded.'''
+        return self._seed_task is not None and not self._seed_task.done()
+
+    def _check_seed_task(self):
+        '''Raise the error from loading the input URLs, if any.'''
+        task = self._seed_task
+
+        if task and task.done() and not task.cancelled() and \
+                task.exception():
+            self._seed_task = None
+            task.result()
+
+    def _release_prefetched(self):
+        '''Put back items checked out but not processed.'''
+        url_records = list(self._prefetch_buffer)
+        self._prefetch_buffer.clear()
+        self._leased_urls.clear()
+
+        while not self._item_queue.empty():
+            item = self._item_queue.get_nowait()[1]
+
+            if item != self.POISON_PILL:
+                url_records.append(item)
+
+        if self._frontier is not None:
+            url_records.extend(self._frontier.clear())
+
+        _logger.debug(__('Release {0} prefetched items.', len(url_records)))
+
+        for url_record in url_records:
+            self._url_table.check_in(
+                url_record.url, Status.todo, increment_try_count=False)
 
     @trollius.coroutine
     def _get_item(self):
         with self._maybe_ignore_exceptions():
-            return self._get_next_url_record()
+            while True:
+                yield From(self._wait_for_resources())
+
+                if self._seed_loader is not None:
+                    seed_loaded_count = self._seed_loader.loaded_count
+
+                if self._frontier is not None:
+                    url_record = yield From(self._get_next_frontier_record())
+                else:
+                    url_record = yield From(self._get_next_url_record())
+
+                if not url_record and self._running and \
+                        not self._is_seed_loading():
+                    waited = yield From(self._wait_for_retry())
+
+                    if waited:
+                        continue
+
+                if url_record or not self._running or \
+                        not self._is_seed_loading():
+                    self._check_seed_task()
+                    raise Return(url_record)
+
+                # Input URLs inserted during the check out are not missed
+                if seed_loaded_count == self._seed_loader.loaded_count:
+                    _logger.debug('Waiting for input URLs.')
+                    yield From(self._seed_loader.wait())
+
+    @trollius.coroutine
+    def _wait_for_retry(self):
+        '''Wait for items with errors whose retry time has not passed.
+
+        Items being processed may add more items so this function does not
+        wait while any are busy.
+
+        Coroutine.
+
+        Returns:
+            bool: Whether it waited.
+        '''
+        # FIXME: accessing protected unfinished_tasks
+        if self._token_queue._unfinished_tasks:
+            raise Return(False)
+
+        retry_time = yield From(self._url_table.get_retry_time_async())
+
+        if retry_time is None:
+            raise Return(False)
+
+        wait_time = max(0, retry_time - time.time())
 
+        _logger.info(__(
+            _('Waiting {time:.1f} seconds to retry failed items.'),
+            time=wait_time
+        ))
+
+        self._retry_wait_event.clear()
+
+        try:
+            yield From(trollius.wait_for(
+                self._retry_wait_event.wait(), wait_time))
+        except trollius.TimeoutError:
+            pass
+
+        raise Return(True)
+
+    @trollius.coroutine
     def _get_next_url_record(self):
         '''Return the next available URL from the URL table.
 
         This function will return items marked as "todo" and then items
         marked as "error". As a consequence, items experiencing errors will
-        be done last.
+        be done last unless retries are delayed.
+
+        Items are checked out in batches and kept in the prefetch buffer.
+
+        Coroutine.
 
         Returns:
             :class:`.item.URLRecord`.
         '''
-        _logger.debug('Get next URL todo.')
+        if not self._prefetch_buffer:
+            url_records = yield From(
+                self._check_out_url_records(self._prefetch_size))
+            self._prefetch_buffer.extend(url_records)
 
-        try:
-            url_record = self._url_table.check_out(Status.todo)
-        except NotFound:
+        if self._prefetch_buffer:
+            url_record = self._prefetch_buffer.popleft()
+        else:
             url_record = None
 
-        if not url_record:
-            try:
-                _logger.debug('Get next URL error.')
-                url_record = self._url_table.check_out(Status.error)
-            except NotFound:
-                url_record = None
-
         _logger.debug(__('Return record {0}.', url_record))
 
-        return url_record
+        raise Return(url_record)
 
     @trollius.coroutine
-    def _process_item(self, url_record):
-        '''Process given item.
+    def _check_out_url_records(self, amount):
+        '''Check out "todo" items or else "error" items from the URL table.
+
+        With delayed retries, "error" items are checked out first.
 
         Coroutine.
+
+        Returns:
+            list: A list of :class:`.item.URLRecord`.
         '''
+        if self._delayed_retries:
+            statuses = (Status.error, Status.todo)
+        else:
+            statuses = (Status.todo, Status.error)
 
-        with self._maybe_ignore_exceptions():
-            yield From(self._check_resource_monitor())
-            yield From(self._process_url_item(url_record))
+        while True:
+            finished_count = self._finished_count
+
+            for status in statuses:
+                _logger.debug(__('Get next URLs {0}.', status))
+
+                url_records = yield From(
+                    self._url_table.check_out_many_async(status, amount))
+
+                if url_records:
+                    break
+
+            # Items that finished while waiting may have added URLs after
+            # the check out was queued.
+            if url_records or finished_count == self._finished_count:
+                if self._lease_timeout:
+                    self._leased_urls.update(
+                        url_record.url for url_record in url_records)
+
+                if self._prefetcher:
+                    self._prefetcher.feed(url_records)
+
+                raise Return(url_records)
 
     @trollius.coroutine
-    def _check_resource_monitor(self):
-        if not self._resource_monitor:
-            return
+    def _get_next_frontier_record(self):
+        '''Return the next available URL from the frontier.
 
-        for counter in itertools.count():
-            resource_info = self._resource_monitor.check()
-
-            if not resource_info:
-                if counter:
-                    _logger.info(_('Situation cleared.'))
-                break
-
-            if counter % 15 == 0:
-                if resource_info.path:
-                    _logger.warning(__(
-                        _('Low disk space on {path} ({size} free).'),
-                        path=resource_info.path,
-                        size=wpull.string.format_size(resource_info.free)
-                    ))
-                else:
-                    _logger.warning(__(
-                        _('Low memory ({size} free).'),
-                        size=wpull.string.format_size(resource_info.free)
-                    ))
+        The frontier is filled from the URL table. If the frontier contains
+        items but none of their hosts are ready, more items are checked out
+        until the frontier overflows. Then, this function waits.
+
+        Coroutine.
+        '''
+        while self._running:
+            free_size = self._frontier.free_size
+            url_records = ()
 
-                _logger.warning(_('Waiting for operator to clear situation.'))
+            if free_size:
+                url_records = yield From(
+                    self._check_out_url_records(free_size))
 
-            yield From(trollius.sleep(60))
+                for url_record in url_records:
+                    self._frontier.put(url_record)
+
+            url_record = self._frontier.get()
+
+            if url_record or not len(self._frontier):
+                raise Return(url_record)
+
+            if url_records:
+                # The buffered hosts are busy so look for other hosts
+                continue
+
+            _logger.debug('Waiting for frontier hosts.')
+            yield From(self._frontier.wait())
+
+    @trollius.coroutine
+    def _process_item(self, url_record):
+        '''Process given item.
+
+        Coroutine.
+        '''
+
+        try:
+            with self._maybe_ignore_exceptions():
+                yield From(self._process_url_item(url_record))
+        finally:
+            self._finished_count += 1
+            self._leased_urls.discard(url_record.url)
+
+            if self._frontier is not None:
+                self._frontier.release(url_record)
+
+    @trollius.coroutine
+    def _wait_for_resources(self):
+        '''Wait while the resource monitor reports exceeded levels.
+
+        Coroutine.
+        '''
+        if self._resource_monitor and not self._resource_monitor.is_ready:
+            _logger.debug('Waiting for resources.')
+            yield From(self._resource_monitor.wait_ready())
 
     @trollius.coroutine
     def _process_url_item(self, url_record):
@@ -378,13 +679,32 @@ class Engine(BaseEngine, HookableMixin):
 
         url_item = URLItem(self._url_table, url_info, url_record)
 
+        if self._circuit_breaker:
+            if not self._circuit_breaker.acquire(
+                    url_info.hostname, url_record.url):
+                self._defer_url_item(url_item)
+                return
+
         _logger.debug(__('Begin session for {0} {1}.',
                          url_record, url_item.url_info))
 
-        yield From(self._processor.process(url_item))
+        start_time = time.time()
+
+        try:
+            yield From(self._processor.process(url_item))
+        finally:
+            if self._circuit_breaker:
+                self._circuit_breaker.release(
+                    url_info.hostname, url_record.url)
 
         assert url_item.is_processed
 
+        if self._concurrency_controller:
+            self._concurrency_controller.add_result(
+                url_info.hostname, time.time() - start_time,
+                failed=url_item.status == Status.error
+            )
+
         self._statistics.mark_done(url_info)
 
         if self._statistics.is_quota_exceeded:
@@ -394,11 +714,36 @@ class Engine(BaseEngine, HookableMixin):
         _logger.debug(__('End session for {0} {1}.',
                          url_item.url_record, url_item.url_info))
 
+    def _defer_url_item(self, url_item):
+        '''Check in the item of an unhealthy host to be tried later.'''
+        retry_time = self._circuit_breaker.get_retry_time(
+            url_item.url_info.hostname)
+
+        _logger.debug(__('Deferring {0} until {1}.',
+                         url_item.url_record.url, retry_time))
+
+        url_item.set_status(
+            Status.error, increment_try_count=False, retry_time=retry_time)
+
     def stop(self):
         '''Stop the engine.'''
         _logger.debug(__('Stopping'))
         self._stop()
 
+    def _stop(self):
+        super()._stop()
+
+        self._retry_wait_event.set()
+
+        if self._resource_monitor:
+            self._resource_monitor.stop()
+
+        if self._frontier is not None:
+            self._frontier.wake()
+
+        if self._is_seed_loading():
+            self._seed_task.cancel()
+
     @contextlib.contextmanager
     def _maybe_ignore_exceptions(self):
         '''Catch all exceptions and maybe ignore them.'''
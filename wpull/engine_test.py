@@ -1,13 +1,24 @@
 # encoding=utf-8
 import random
+import time
+import unittest
 
 from trollius import From
 import trollius
 
+from wpull.circuit import CircuitBreaker
+from wpull.concurrency import ConcurrencyController
+from wpull.database.base import CrawlOrder
 from wpull.database.sqltable import SQLiteURLTable
 from wpull.engine import BaseEngine, Engine
+from wpull.frontier import HostFrontier
+from wpull.item import Status
+from wpull.resmon_test import MockResourceMonitor
+from wpull.seed import SeedLoader
 from wpull.stats import Statistics
 from wpull.testing.async import AsyncTestCase
+from wpull.url import URLInfo
+import wpull.resmon
 import wpull.testing.async
 
 
@@ -60,14 +71,61 @@ class MockEngine(BaseEngine):
 
 
 class MockProcessor(object):
+    def __init__(self):
+        self.processed_urls = []
+
     @trollius.coroutine
     def process(self, url_item):
+        self.processed_urls.append(url_item.url_record.url)
         url_item.skip()
 
     def close(self):
         pass
 
 
+class MockSlowProcessor(MockProcessor):
+    def __init__(self):
+        super().__init__()
+        self.active_count = 0
+        self.max_active_count = 0
+
+    @trollius.coroutine
+    def process(self, url_item):
+        self.active_count += 1
+        self.max_active_count = max(self.max_active_count, self.active_count)
+
+        yield From(MockProcessor.process(self, url_item))
+        yield From(trollius.sleep(0.1))
+
+        self.active_count -= 1
+
+
+class MockRetryProcessor(MockProcessor):
+    @trollius.coroutine
+    def process(self, url_item):
+        self.processed_urls.append(url_item.url_record.url)
+
+        if url_item.url_record.url.endswith('fail') and \
+                not url_item.url_record.try_count:
+            url_item.set_status(Status.error, retry_time=time.time() + 0.2)
+        else:
+            url_item.set_status(Status.done)
+
+
+class MockTreeProcessor(MockProcessor):
+    @trollius.coroutine
+    def process(self, url_item):
+        self.processed_urls.append(url_item.url_record.url)
+
+        if url_item.url_record.level < 2:
+            url_item.add_child_urls([
+                url_item.url_record.url + '{}/'.format(num)
+                for num in range(2)
+            ])
+
+        url_item.set_status(Status.done)
+
+
 class TestEngine(AsyncTestCase):
     @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
     def test_base_engine(self):
@@ -137,3 +195,359 @@ class TestEngine(AsyncTestCase):
 
         # It shouldn't crash with ValueError during URL parse
         yield From(engine())
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_frontier(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        frontier = HostFrontier(max_host_concurrent=1, host_wait=0.01)
+
+        url_table.add_many([
+            {'url': 'http://a.example/1'},
+            {'url': 'http://a.example/2'},
+            {'url': 'http://a.example/3'},
+            {'url': 'http://b.example/1'},
+            {'url': 'http://c.example/1'},
+        ])
+
+        engine = Engine(url_table, processor, statistics, concurrent=3,
+                        frontier=frontier)
+
+        yield From(engine())
+
+        self.assertEqual(
+            ['http://a.example/1', 'http://b.example/1',
+             'http://c.example/1', 'http://a.example/2',
+             'http://a.example/3'],
+            processor.processed_urls
+        )
+        self.assertEqual(0, len(frontier))
+        self.assertEqual(0, frontier.active_count)
+
+        for url_record in url_table.get_all():
+            self.assertEqual(Status.skipped, url_record.status)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_frontier_overflow(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockSlowProcessor()
+        statistics = Statistics()
+        frontier = HostFrontier(max_host_concurrent=1, max_size=5)
+
+        url_table.add_many(
+            [{'url': 'http://a.example/{0}'.format(num)} for num in range(8)]
+            + [{'url': 'http://b.example/1'}]
+        )
+
+        engine = Engine(url_table, processor, statistics, concurrent=2,
+                        frontier=frontier)
+
+        yield From(engine())
+
+        self.assertEqual(9, len(processor.processed_urls))
+        self.assertEqual('http://b.example/1', processor.processed_urls[1])
+        self.assertEqual(2, processor.max_active_count)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_concurrency_controller(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        frontier = HostFrontier(max_host_concurrent=2)
+        controller = ConcurrencyController(
+            1, max_concurrent=3, host_concurrent=2, interval=0,
+            min_samples=2)
+
+        url_table.add_many([
+            {'url': 'http://example.com/{}'.format(num)} for num in range(6)
+        ])
+
+        engine = Engine(url_table, processor, statistics, concurrent=1,
+                        frontier=frontier, concurrency_controller=controller)
+
+        yield From(engine())
+
+        self.assertEqual(6, len(processor.processed_urls))
+        self.assertEqual(3, engine.concurrent)
+
+        controller.change_observer.notify('example.com', 1)
+        frontier.put(url_table.get_one('http://example.com/0'))
+        frontier.put(url_table.get_one('http://example.com/1'))
+
+        self.assertTrue(frontier.get())
+        self.assertFalse(frontier.get())
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_delayed_retries(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockRetryProcessor()
+        statistics = Statistics()
+
+        url_table.add_many([
+            {'url': 'http://example.com/fail'},
+            {'url': 'http://example.com/1'},
+        ])
+
+        engine = Engine(url_table, processor, statistics, prefetch_size=1,
+                        delayed_retries=True)
+
+        start_time = time.time()
+        yield From(engine())
+
+        self.assertEqual(
+            ['http://example.com/fail', 'http://example.com/1',
+             'http://example.com/fail'],
+            processor.processed_urls
+        )
+        self.assertGreaterEqual(time.time() - start_time, 0.2)
+
+        for url_record in url_table.get_all():
+            self.assertEqual(Status.done, url_record.status)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_circuit_breaker(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        circuit_breaker = CircuitBreaker(
+            failure_threshold=1, cool_down=0.2, probe_wait=0.1)
+
+        url_table.add_many([
+            {'url': 'http://example.com/1'},
+            {'url': 'http://example.net/1'},
+            {'url': 'http://example.com/2'},
+        ])
+
+        circuit_breaker.add_failure('example.com')
+
+        engine = Engine(url_table, processor, statistics,
+                        circuit_breaker=circuit_breaker)
+
+        start_time = time.time()
+        yield From(engine())
+
+        self.assertEqual('http://example.net/1', processor.processed_urls[0])
+        self.assertEqual(3, len(processor.processed_urls))
+        self.assertGreaterEqual(time.time() - start_time, 0.2)
+        self.assertEqual(2, circuit_breaker.deferred_count)
+
+        for url_record in url_table.get_all():
+            self.assertEqual(Status.skipped, url_record.status)
+            self.assertEqual(1, url_record.try_count)
+
+    @unittest.skipIf(not wpull.resmon.psutil, 'psutil not available')
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_resource_monitor(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        resource_monitor = MockResourceMonitor(
+            interval=0.01, exceeded_interval=0.01)
+        resource_monitor.free = 10
+
+        url_table.add_many([
+            {'url': 'http://example.com/{}'.format(num)} for num in range(3)
+        ])
+
+        engine = Engine(url_table, processor, statistics,
+                        resource_monitor=resource_monitor)
+
+        def clear_situation():
+            self.assertFalse(processor.processed_urls)
+            resource_monitor.free = 100
+
+        trollius.get_event_loop().call_later(0.1, clear_situation)
+
+        yield From(resource_monitor.sample())
+        yield From(engine())
+
+        self.assertEqual(3, len(processor.processed_urls))
+        self.assertTrue(resource_monitor.is_ready)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_crawl_order(self):
+        expected_paths = {
+            CrawlOrder.breadth_first: [
+                '/', '/0/', '/1/', '/0/0/', '/0/1/', '/1/0/', '/1/1/'],
+            CrawlOrder.depth_first: [
+                '/', '/1/', '/1/1/', '/1/0/', '/0/', '/0/1/', '/0/0/'],
+        }
+
+        for crawl_order, paths in expected_paths.items():
+            url_table = SQLiteURLTable(':memory:', crawl_order=crawl_order)
+            processor = MockTreeProcessor()
+            statistics = Statistics()
+
+            url_table.add_one({'url': 'http://example.com/'})
+
+            engine = Engine(url_table, processor, statistics,
+                            prefetch_size=1)
+
+            yield From(engine())
+
+            self.assertEqual(
+                ['http://example.com' + path for path in paths],
+                processor.processed_urls
+            )
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_prefetch_release(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+
+        url_table.add_many([
+            {'url': 'http://example.com/{}'.format(num)} for num in range(10)
+        ])
+
+        engine = Engine(url_table, processor, statistics, prefetch_size=5)
+
+        def process_callback(url_item):
+            engine.stop()
+            url_item.skip()
+
+        processor.process = trollius.coroutine(process_callback)
+
+        yield From(engine())
+
+        statuses = [url_record.status for url_record in url_table.get_all()]
+
+        self.assertEqual(1, statuses.count(Status.skipped))
+        self.assertEqual(9, statuses.count(Status.todo))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_error_teardown(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+
+        url_table.add_many([
+            {'url': 'http://example.com/{}'.format(num)} for num in range(10)
+        ])
+
+        engine = Engine(url_table, processor, statistics, prefetch_size=5,
+                        lease_timeout=10)
+
+        @trollius.coroutine
+        def process_callback(url_item):
+            raise MockEngineError()
+
+        processor.process = process_callback
+
+        with self.assertRaises(MockEngineError):
+            yield From(engine())
+
+        statuses = [url_record.status for url_record in url_table.get_all()]
+
+        self.assertIsNone(engine._lease_task)
+        self.assertEqual(1, statuses.count(Status.in_progress))
+        self.assertEqual(9, statuses.count(Status.todo))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_lease_timeout(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        urls = ['http://example.com/{}'.format(num) for num in range(3)]
+
+        url_table.add_many([{'url': url} for url in urls])
+
+        # Checked out by another process that is still running and one
+        # that crashed
+        url_table.check_out_many(Status.todo, 2)
+        url_table.update_one(urls[0], lease_time=time.time() + 10)
+        url_table.update_one(urls[1], lease_time=time.time() - 10)
+
+        engine = Engine(url_table, processor, statistics, lease_timeout=0.3)
+        statuses = []
+
+        @trollius.coroutine
+        def process_callback(url_item):
+            processor.processed_urls.append(url_item.url_record.url)
+            yield From(trollius.sleep(0.2))
+
+            # The lease is renewed while the item is processed
+            url_table.release(before=time.time() - 0.15)
+            statuses.append(url_table.get_one(url_item.url_record.url).status)
+
+            url_item.skip()
+
+        processor.process = process_callback
+
+        yield From(engine())
+
+        self.assertEqual(urls[1:], processor.processed_urls)
+        self.assertEqual([Status.in_progress] * 2, statuses)
+        self.assertEqual(Status.in_progress, url_table.get_one(urls[0]).status)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_seed_loader(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        urls = ['http://example.com/{}'.format(num) for num in range(200)]
+        seed_loader = SeedLoader(
+            url_table, (URLInfo.parse(url) for url in urls), batch_size=10)
+        loaded_counts = []
+
+        def process_callback(url_item):
+            loaded_counts.append(seed_loader.loaded_count)
+            processor.processed_urls.append(url_item.url_record.url)
+            url_item.skip()
+
+        processor.process = trollius.coroutine(process_callback)
+
+        engine = Engine(url_table, processor, statistics,
+                        seed_loader=seed_loader)
+
+        yield From(engine())
+
+        self.assertEqual(urls, processor.processed_urls)
+        self.assertLess(loaded_counts[0], 200)
+        self.assertEqual(200, seed_loader.loaded_count)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_seed_loader_error(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+
+        def url_infos():
+            yield URLInfo.parse('http://example.com/')
+            raise ValueError('bad URL')
+
+        seed_loader = SeedLoader(url_table, url_infos())
+        engine = Engine(url_table, processor, statistics,
+                        seed_loader=seed_loader)
+
+        try:
+            yield From(engine())
+        except ValueError:
+            pass
+        else:
+            self.fail()  # pragma: no cover
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_engine_seed_loader_stop(self):
+        url_table = SQLiteURLTable(':memory:')
+        processor = MockProcessor()
+        statistics = Statistics()
+        url_infos = (
+            URLInfo.parse('http://example.com/{}'.format(num))
+            for num in range(1000)
+        )
+        seed_loader = SeedLoader(url_table, url_infos, batch_size=10)
+        engine = Engine(url_table, processor, statistics,
+                        seed_loader=seed_loader)
+
+        def process_callback(url_item):
+            engine.stop()
+            url_item.skip()
+
+        processor.process = trollius.coroutine(process_callback)
+
+        yield From(engine())
+
+        self.assertFalse(seed_loader.loading)
+        self.assertLess(seed_loader.loaded_count, 1000)
@@ -0,0 +1,249 @@
+# encoding=utf-8
+'''Host-aware crawl frontier.'''
+import collections
+import logging
+import time
+
+from trollius import From
+import trollius
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.url import URLInfo
+
+
+_logger = logging.getLogger(__name__)
+
+
+def hostname_key(url_record):
+    '''Return the hostname of the record's URL.
+
+    Returns:
+        str, None: The hostname or None if the URL cannot be parsed.
+    '''
+    try:
+        return URLInfo.parse(url_record.url).hostname
+    except ValueError:
+        return None
+
+
+class HostFrontier(object):
+    '''Buffer of checked out URL records grouped by host.
+
+    Args:
+        max_host_concurrent (int): The maximum number of items of a single
+            host that can be processed at the same time. Use ``0`` for
+            unlimited.
+        host_wait (float): The time in seconds to wait after an item of a
+            host is finished before the next item of the same host may
+            be started.
+        max_size (int): The number of records to keep in the buffer.
+        max_overflow_size (int): The number of records the buffer may grow
+            to while none of the buffered hosts are ready. The default is 10
+            times `max_size`.
+        key_func: A function that accepts a :class:`.item.URLRecord` and
+            returns a hashable key used to group the records. The default
+            groups by hostname.
+
+    Records are handed out round-robin across the hosts that are ready. A
+    host is ready when it has fewer active items than `max_host_concurrent`
+    and its wait time since the last finished item has passed.
+
+    When a few hosts fill the buffer and none of them is ready, more
+    records may be added so other hosts are not blocked behind them.
+    '''
+    def __init__(self, max_host_concurrent=0, host_wait=0.0, max_size=1000,
+                 key_func=hostname_key, max_overflow_size=None):
+        assert max_size > 0, 'Expect positive size. Got {}.'.format(max_size)
+
+        self._max_host_concurrent = max_host_concurrent
+        self._host_wait = host_wait
+        self._max_size = max_size
+        self._max_overflow_size = max(
+            max_size, max_overflow_size or max_size * 10)
+        self._key_func = key_func
+        self._host_queues = collections.OrderedDict()
+        self._active_counter = collections.Counter()
+        self._host_limits = {}
+        self._ready_time = {}
+        self._size = 0
+        self._event = trollius.Event()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def active_count(self):
+        '''Return the number of records handed out but not released.'''
+        return sum(self._active_counter.values())
+
+    @property
+    def free_size(self):
+        '''Return the number of records that can be added.
+
+        Once `max_size` is reached, records can be added only while none
+        of the buffered hosts are ready, up to `max_overflow_size`.
+        '''
+        if self._size < self._max_size:
+            return self._max_size - self._size
+        elif self._size < self._max_overflow_size and \
+                not self.has_ready_host():
+            return min(self._max_size, self._max_overflow_size - self._size)
+        else:
+            return 0
+
+    def is_full(self):
+        '''Return whether no more records should be added.'''
+        return not self.free_size
+
+    def has_ready_host(self):
+        '''Return whether a buffered host is ready.'''
+        time_now = time.time()
+
+        return any(self._is_host_ready(key, time_now)
+                   for key in self._host_queues)
+
+    def put(self, url_record):
+        '''Add a checked out record.'''
+        key = self._key_func(url_record)
+
+        if key not in self._host_queues:
+            self._host_queues[key] = collections.deque()
+
+        self._host_queues[key].append(url_record)
+        self._size += 1
+
+    def get(self):
+        '''Return the next record of a ready host.
+
+        Returns:
+            :class:`.item.URLRecord`, None: A record or None if no host is
+            ready.
+        '''
+        time_now = time.time()
+
+        for key in tuple(self._host_queues.keys()):
+            if not self._is_host_ready(key, time_now):
+                continue
+
+            queue = self._host_queues.pop(key)
+            url_record = queue.popleft()
+            self._size -= 1
+
+            if queue:
+                # Moving the host to the end makes the iteration round-robin
+                self._host_queues[key] = queue
+
+            self._active_counter[key] += 1
+
+            _logger.debug(__('Frontier host {0} active {1}.',
+                             key, self._active_counter[key]))
+
+            return url_record
+
+    def set_host_concurrent(self, key, value):
+        '''Set the maximum number of active items of a single host.
+
+        Args:
+            key: A key returned by the key function.
+            value (int): The maximum number. If it is the same as
+                `max_host_concurrent`, the host uses the default again.
+        '''
+        if value == self._max_host_concurrent:
+            self._host_limits.pop(key, None)
+        else:
+            self._host_limits[key] = value
+
+        self._event.set()
+
+    def _is_host_ready(self, key, time_now):
+        '''Return whether an item of the host can be started.'''
+        max_host_concurrent = self._host_limits.get(
+            key, self._max_host_concurrent)
+
+        if max_host_concurrent and \
+                self._active_counter[key] >= max_host_concurrent:
+            return False
+
+        ready_time = self._ready_time.get(key)
+
+        if ready_time is not None:
+            if ready_time > time_now:
+                return False
+
+            del self._ready_time[key]
+
+        return True
+
+    def release(self, url_record):
+        '''Mark the record handed out by :meth:`get` as finished.'''
+        key = self._key_func(url_record)
+
+        assert self._active_counter[key] > 0, \
+            'Expect active host. Got {}.'.format(key)
+
+        self._active_counter[key] -= 1
+
+        if not self._active_counter[key]:
+            del self._active_counter[key]
+
+        if self._host_wait:
+            self._ready_time[key] = time.time() + self._host_wait
+        else:
+            self._ready_time.pop(key, None)
+
+        self._event.set()
+
+    def wake(self):
+        '''Interrupt anything blocked on :meth:`wait`.'''
+        self._event.set()
+
+    def get_wait_time(self):
+        '''Return the time until a waiting host becomes ready.
+
+        Returns:
+            float, None: The time in seconds or None if the buffered hosts
+            are only waiting for active items to be released.
+        '''
+        time_now = time.time()
+        wait_times = []
+
+        for key in self._host_queues:
+            ready_time = self._ready_time.get(key)
+
+            if ready_time is not None:
+                wait_times.append(max(0, ready_time - time_now))
+
+        if wait_times:
+            return min(wait_times)
+
+    @trollius.coroutine
+    def wait(self):
+        '''Wait until a host may become ready.
+
+        Coroutine.
+        '''
+        self._event.clear()
+
+        try:
+            yield From(trollius.wait_for(
+                self._event.wait(), self.get_wait_time()))
+        except trollius.TimeoutError:
+            pass
+
+    def clear(self):
+        '''Remove and return all buffered records.
+
+        Records that are handed out are not included.
+
+        Returns:
+            list
+        '''
+        url_records = []
+
+        for queue in self._host_queues.values():
+            url_records.extend(queue)
+
+        self._host_queues.clear()
+        self._size = 0
+
+        return url_records
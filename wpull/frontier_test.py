@@ -0,0 +1,140 @@
+# encoding=utf-8
+import time
+
+from trollius import From
+
+from wpull.frontier import HostFrontier
+from wpull.testing.async import AsyncTestCase
+import wpull.testing.async
+from wpull.testing.util import new_url_record
+
+
+class TestFrontier(AsyncTestCase):
+    def test_round_robin(self):
+        frontier = HostFrontier()
+
+        for url in ('http://a.example/1', 'http://a.example/2',
+                    'http://a.example/3', 'http://b.example/1',
+                    'http://c.example/1'):
+            frontier.put(new_url_record(url))
+
+        self.assertEqual(5, len(frontier))
+
+        urls = [frontier.get().url for dummy in range(5)]
+
+        self.assertEqual(
+            ['http://a.example/1', 'http://b.example/1',
+             'http://c.example/1', 'http://a.example/2',
+             'http://a.example/3'],
+            urls
+        )
+        self.assertEqual(0, len(frontier))
+        self.assertEqual(5, frontier.active_count)
+        self.assertFalse(frontier.get())
+
+    def test_host_concurrent(self):
+        frontier = HostFrontier(max_host_concurrent=1)
+
+        frontier.put(new_url_record('http://a.example/1'))
+        frontier.put(new_url_record('http://a.example/2'))
+        frontier.put(new_url_record('http://b.example/1'))
+
+        url_record_1 = frontier.get()
+        url_record_2 = frontier.get()
+
+        self.assertEqual('http://a.example/1', url_record_1.url)
+        self.assertEqual('http://b.example/1', url_record_2.url)
+        self.assertFalse(frontier.get())
+        self.assertIsNone(frontier.get_wait_time())
+
+        frontier.release(url_record_2)
+        self.assertFalse(frontier.get())
+
+        frontier.release(url_record_1)
+        self.assertEqual('http://a.example/2', frontier.get().url)
+
+    def test_set_host_concurrent(self):
+        frontier = HostFrontier(max_host_concurrent=2)
+
+        for url in ('http://a.example/1', 'http://a.example/2',
+                    'http://a.example/3'):
+            frontier.put(new_url_record(url))
+
+        frontier.set_host_concurrent('a.example', 1)
+
+        url_record = frontier.get()
+        self.assertFalse(frontier.get())
+
+        frontier.set_host_concurrent('a.example', 2)
+
+        self.assertFalse(frontier._host_limits)
+        self.assertEqual('http://a.example/2', frontier.get().url)
+        self.assertFalse(frontier.get())
+
+        frontier.release(url_record)
+        self.assertEqual('http://a.example/3', frontier.get().url)
+
+    def test_host_wait(self):
+        frontier = HostFrontier(host_wait=0.2)
+
+        frontier.put(new_url_record('http://a.example/1'))
+        frontier.put(new_url_record('http://a.example/2'))
+
+        url_record = frontier.get()
+        frontier.release(url_record)
+
+        self.assertFalse(frontier.get())
+        self.assertTrue(0 < frontier.get_wait_time() <= 0.2)
+
+        time.sleep(0.2)
+
+        self.assertEqual('http://a.example/2', frontier.get().url)
+
+    def test_full_and_clear(self):
+        frontier = HostFrontier(max_size=2)
+
+        frontier.put(new_url_record('http://a.example/1'))
+        self.assertFalse(frontier.is_full())
+
+        frontier.put(new_url_record('http://b.example/1'))
+        self.assertTrue(frontier.is_full())
+
+        url_records = frontier.clear()
+
+        self.assertEqual(2, len(url_records))
+        self.assertEqual(0, len(frontier))
+
+    def test_overflow(self):
+        frontier = HostFrontier(max_host_concurrent=1, max_size=2,
+                                max_overflow_size=4)
+
+        for url in ('http://a.example/1', 'http://a.example/2',
+                    'http://a.example/3'):
+            frontier.put(new_url_record(url))
+
+        self.assertTrue(frontier.is_full())
+
+        frontier.get()
+
+        self.assertFalse(frontier.has_ready_host())
+        self.assertEqual(2, frontier.free_size)
+
+        frontier.put(new_url_record('http://a.example/4'))
+        frontier.put(new_url_record('http://b.example/1'))
+
+        self.assertEqual(0, frontier.free_size)
+        self.assertEqual('http://b.example/1', frontier.get().url)
+
+    @wpull.testing.async.async_test()
+    def test_wait(self):
+        frontier = HostFrontier(host_wait=0.2)
+
+        frontier.put(new_url_record('http://a.example/1'))
+        frontier.put(new_url_record('http://a.example/2'))
+        frontier.release(frontier.get())
+
+        time_start = time.time()
+        yield From(frontier.wait())
+
+        self.assertGreaterEqual(time.time() - time_start, 0.15)
+        self.assertEqual('http://a.example/2', frontier.get().url)
@@ -187,6 +187,11 @@ class Callbacks(object):
         func = getattr(self, 'finishing_statistics', CallbacksV2.finishing_statistics)
         return func(start_time, end_time, num_urls, bytes_downloaded)
 
+    def dispatch_circuit_state(self, hostname, state):
+        '''Call appropriate ``circuit_state``.'''
+        func = getattr(self, 'circuit_state', CallbacksV2.circuit_state)
+        return func(hostname, state)
+
     def dispatch_exit_status(self, exit_code):
         '''Call appropriate ``exit_status``.'''
         func = getattr(self, 'exit_status', CallbacksV2.exit_status)
@@ -357,6 +362,9 @@ class CallbacksV2(Callbacks):
                 * ``replace`` (bool, optional): If True and if the URL already
                   exists in the URL Table, the entry is deleted and replaced
                   with a new one.
+                * ``priority`` (int, optional): URLs with higher values are
+                  downloaded first when using ``--crawl-order priority``.
+                  The default is 0.
         '''
         return None
 
@@ -383,6 +391,20 @@ class CallbacksV2(Callbacks):
             bytes_downloaded (int): size of files downloaded in bytes
         '''
 
+    @staticmethod
+    def circuit_state(hostname, state):
+        '''Callback when the circuit of a host changes.
+
+        This callback is only called with ``--circuit-breaker``.
+
+        Args:
+            hostname (str): The hostname.
+            state (str): A value from :class:`.circuit.CircuitState`:
+                ``open`` when the URLs of the host are deferred,
+                ``half_open`` when a single URL is tried, and ``closed``
+                when the host recovered.
+        '''
+
     @staticmethod
     def exit_status(exit_code):
         '''Return the program exit status code.
@@ -477,6 +499,11 @@ class HookEnvironment(object):
             'scrape_document',
             self._scrape_document)
 
+        if 'CircuitBreaker' in self.factory:
+            self.factory['CircuitBreaker'].connect_hook(
+                'circuit_state',
+                self._circuit_state)
+
     def _resolve_dns(self, host, port):
         '''Process resolving DNS callback.'''
         answer = self.callbacks.dispatch_resolve_dns(host)
@@ -527,6 +554,10 @@ class HookEnvironment(object):
             error_info_dict
         )
 
+    def _circuit_state(self, hostname, state):
+        '''Process circuit state callback.'''
+        self.callbacks.dispatch_circuit_state(hostname, state)
+
     def _queued_url(self, url_info):
         '''Process queued URL callback.'''
         url_info_dict = url_info.to_dict()
@@ -626,6 +657,7 @@ class HookEnvironment(object):
         inline = new_url_dict.get('inline')
         post_data = new_url_dict.get('post_data')
         replace = new_url_dict.get('replace')
+        priority = new_url_dict.get('priority')
 
         assert url
 
@@ -636,6 +668,9 @@ class HookEnvironment(object):
 
         kwargs = dict(link_type=link_type, post_data=post_data)
 
+        if priority is not None:
+            kwargs['priority'] = int(priority)
+
         if replace:
             url_item.url_table.remove_one(url)
 
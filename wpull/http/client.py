@@ -11,7 +11,9 @@ import trollius
 from wpull.abstract.client import BaseClient, BaseSession, DurationTimeout
 from wpull.backport.logging import BraceMessage as __
 from wpull.body import Body
+from wpull.errors import NetworkError, ProtocolError
 from wpull.http.stream import Stream
+import wpull.http.util
 
 
 _ = gettext.gettext
@@ -22,26 +24,173 @@ class Client(BaseClient):
     '''Stateless HTTP/1.1 client.
 
     The session object is :class:`Session`.
+
+    Args:
+        stream_factory: A function that returns a new
+            :class:`.http.stream.Stream`.
+        pipeline_depth (int): If greater than 1, sessions send GET and HEAD
+            requests on a connection of another session to the same host
+            before its response is read. This is the maximum number of
+            requests on a connection at once.
+
+    Attributes:
+        pipeline_table (:class:`PipelineTable`): The pipelined connections
+            if pipelining is enabled.
     '''
-    def __init__(self, stream_factory=Stream, **kwargs):
+    def __init__(self, stream_factory=Stream, pipeline_depth=None, **kwargs):
         super().__init__(**kwargs)
         self._stream_factory = stream_factory
 
+        if pipeline_depth and pipeline_depth > 1:
+            self.pipeline_table = PipelineTable(pipeline_depth)
+        else:
+            self.pipeline_table = None
+
     def _session_class(self):
-        return functools.partial(Session, stream_factory=self._stream_factory)
+        return functools.partial(Session, stream_factory=self._stream_factory,
+                                 pipeline_table=self.pipeline_table)
+
+
+class Pipeline(object):
+    '''Requests queued on a connection.
+
+    Responses are read in the same order as the requests are queued.
+
+    Args:
+        connection: The connection.
+        max_depth (int): The maximum number of requests queued.
+
+    Attributes:
+        connection: The connection.
+        broken (bool): If True, no more requests are queued and requests
+            waiting for their response are sent again on another connection.
+    '''
+    def __init__(self, connection, max_depth):
+        self.connection = connection
+        self._max_depth = max_depth
+        self._last_done_future = None
+        self._count = 0
+        self.broken = False
+
+    def count(self):
+        '''Return the number of requests not finished.'''
+        return self._count
+
+    def can_queue(self):
+        '''Return whether another request can be queued.'''
+        return not self.broken and self._count < self._max_depth \
+            and not self.connection.closed()
+
+    def queue(self):
+        '''Queue a request.
+
+        Returns:
+            tuple: A future done when the previous request is finished or
+            None, and a future to be passed to :meth:`finish`.
+        '''
+        turn_future = self._last_done_future
+        done_future = trollius.Future()
+        self._last_done_future = done_future
+        self._count += 1
+
+        return turn_future, done_future
+
+    def finish(self, done_future):
+        '''Let the next request read its response.
+
+        Returns:
+            bool: Whether no requests are left.
+        '''
+        assert self._count > 0
+
+        self._count -= 1
+
+        if not done_future.done():
+            done_future.set_result(None)
+
+        return not self._count
+
+
+class PipelineTable(object):
+    '''Pipelines of a client keyed by scheme, host, and port.
+
+    Args:
+        max_depth (int): The maximum number of requests on a connection.
+
+    Attributes:
+        pipelined_count (int): Number of requests queued behind another
+            request.
+        fallback_count (int): Number of queued requests sent again on
+            another connection.
+    '''
+    def __init__(self, max_depth):
+        self._max_depth = max_depth
+        self._pipelines = {}
+        self._disabled_keys = set()
+        self.pipelined_count = 0
+        self.fallback_count = 0
+
+    @classmethod
+    def get_key(cls, request):
+        '''Return the key for the request or None if not pipelinable.
+
+        Only GET and HEAD requests without a body can be pipelined.
+        '''
+        if request.method.upper() not in ('GET', 'HEAD') or request.body:
+            return None
+
+        url_info = request.url_info
+
+        return url_info.scheme, url_info.hostname, url_info.port
+
+    def get(self, key):
+        '''Return a pipeline that accepts requests or None.'''
+        pipeline = self._pipelines.get(key)
+
+        if pipeline and pipeline.can_queue():
+            return pipeline
+
+    def add(self, key, connection):
+        '''Add a pipeline for the connection.
+
+        Returns:
+            Pipeline: The new pipeline or None if the key already has one or
+            is disabled.
+        '''
+        if key in self._disabled_keys or key in self._pipelines:
+            return None
+
+        pipeline = self._pipelines[key] = Pipeline(
+            connection, self._max_depth)
+
+        return pipeline
+
+    def remove(self, key, pipeline):
+        '''Remove the pipeline.'''
+        if self._pipelines.get(key) is pipeline:
+            del self._pipelines[key]
+
+    def disable(self, key):
+        '''Do not pipeline requests to the key again.'''
+        _logger.debug(__('Disable pipelining for {0}.', key))
+        self._disabled_keys.add(key)
 
 
 class Session(BaseSession):
     '''HTTP request and response session.'''
-    def __init__(self, stream_factory=None, **kwargs):
+    def __init__(self, stream_factory=None, pipeline_table=None, **kwargs):
         super().__init__(**kwargs)
 
         assert stream_factory
         self._stream_factory = stream_factory
+        self._pipeline_table = pipeline_table
         self._connection = None
         self._stream = None
         self._request = None
         self._response = None
+        self._pipeline = None
+        self._pipeline_key = None
+        self._pipeline_done_future = None
 
         self._session_complete = True
 
@@ -62,6 +211,21 @@ class Session(BaseSession):
         assert not self._connection
         _logger.debug(__('Client fetch request {0}.', request))
 
+        if self._pipeline_table:
+            pipeline_key = self._pipeline_table.get_key(request)
+        else:
+            pipeline_key = None
+
+        if pipeline_key:
+            pipeline = self._pipeline_table.get(pipeline_key)
+
+            if pipeline:
+                response = yield From(
+                    self._fetch_pipelined(request, pipeline, pipeline_key))
+
+                if response:
+                    raise Return(response)
+
         connection = yield From(self._acquire_connection(request))
         full_url = connection.proxied and not connection.tunneled
 
@@ -69,6 +233,13 @@ class Session(BaseSession):
 
         yield From(self._stream.reconnect())
 
+        if pipeline_key:
+            pipeline = self._pipeline_table.add(pipeline_key, connection)
+
+            if pipeline:
+                self._join_pipeline(pipeline, pipeline_key)
+                stream.pipelined = True
+
         request.address = connection.address
 
         self._connect_data_observer()
@@ -89,6 +260,8 @@ class Session(BaseSession):
         self._response = response = yield From(stream.read_response())
         response.request = request
 
+        self._check_pipeline_close(response)
+
         if self._recorder_session:
             self._recorder_session.pre_response(response)
 
@@ -96,6 +269,133 @@ class Session(BaseSession):
 
         raise Return(response)
 
+    @trollius.coroutine
+    def _fetch_pipelined(self, request, pipeline, pipeline_key):
+        '''Send the request on the connection of the pipeline.
+
+        The request is sent immediately but the response is read after the
+        responses of the requests queued before.
+
+        Returns:
+            .http.request.Response: The response or None if the request
+            needs to be sent on another connection.
+
+        Coroutine.
+        '''
+        _logger.debug(__('Pipeline request {0}.', request))
+
+        turn_future = self._join_pipeline(pipeline, pipeline_key)
+        self._pipeline_table.pipelined_count += 1
+
+        self._request = request
+        self._connection = connection = pipeline.connection
+        full_url = connection.proxied and not connection.tunneled
+        self._stream = stream = self._stream_factory(connection)
+        stream.pipelined = True
+
+        # Hold the data for the recorder until the response header is read
+        # so a request sent again is not recorded twice
+        stream_events = []
+
+        def stream_callback(*args):
+            stream_events.append(args)
+
+        stream.data_observer.add(stream_callback)
+
+        try:
+            yield From(stream.write_request(request, full_url=full_url))
+
+            if turn_future:
+                yield From(turn_future)
+
+            if pipeline.broken or connection.closed():
+                raise NetworkError('Pipelined connection closed.')
+
+            response = yield From(stream.read_response())
+        except (NetworkError, ProtocolError) as error:
+            _logger.debug(__('Pipelined request failed: {0}', error))
+
+            if isinstance(error, ProtocolError):
+                self._pipeline_table.disable(pipeline_key)
+
+            pipeline.broken = True
+            self._pipeline_table.fallback_count += 1
+
+            if self._leave_pipeline():
+                self._connection_pool.no_wait_release(connection)
+
+            self._connection = self._stream = self._request = None
+
+            raise Return(None)
+
+        stream.data_observer.remove(stream_callback)
+
+        request.address = connection.address
+        self._connect_data_observer()
+
+        if self._recorder_session:
+            self._recorder_session.pre_request(request)
+
+        for data_type, data in stream_events:
+            if data_type == 'request':
+                self._data_callback(data_type, data)
+
+        if self._recorder_session:
+            self._recorder_session.request(request)
+
+        for data_type, data in stream_events:
+            if data_type != 'request':
+                self._data_callback(data_type, data)
+
+        self._response = response
+        response.request = request
+
+        self._check_pipeline_close(response)
+
+        if self._recorder_session:
+            self._recorder_session.pre_response(response)
+
+        self._session_complete = False
+
+        raise Return(response)
+
+    def _check_pipeline_close(self, response):
+        '''Stop queuing requests if the server closes after the response.
+
+        Requests already queued are sent again on another connection.
+        '''
+        if self._pipeline and wpull.http.util.should_close(
+                self._request.version, response.fields.get('Connection')):
+            self._pipeline.broken = True
+
+    def _join_pipeline(self, pipeline, pipeline_key):
+        '''Queue this session on the pipeline and return its turn future.'''
+        self._pipeline = pipeline
+        self._pipeline_key = pipeline_key
+        turn_future, self._pipeline_done_future = pipeline.queue()
+
+        return turn_future
+
+    def _leave_pipeline(self):
+        '''Let the next request of the pipeline continue.
+
+        Returns:
+            bool: Whether this session was the last one using the connection.
+        '''
+        pipeline = self._pipeline
+        self._pipeline = None
+
+        if not pipeline.finish(self._pipeline_done_future):
+            return False
+
+        self._pipeline_table.remove(self._pipeline_key, pipeline)
+
+        if pipeline.broken:
+            # Responses of requests sent again may still arrive
+            pipeline.connection.close()
+
+        return True
+
     @trollius.coroutine
     def read_content(self, file=None, raw=False, rewind=True,
                      duration_timeout=None):
@@ -166,6 +466,9 @@ class Session(BaseSession):
         if self._connection:
             self._connection.close()
 
+        if self._pipeline:
+            self._pipeline.broken = True
+
         self._session_complete = True
 
     def recycle(self):
@@ -174,5 +477,9 @@ class Session(BaseSession):
 
             self.abort()
 
+        if self._pipeline and not self._leave_pipeline():
+            # The connection is still used by the requests queued after
+            return
+
         if self._connection:
             self._connection_pool.no_wait_release(self._connection)
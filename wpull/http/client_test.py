@@ -4,7 +4,9 @@ import functools
 import io
 import warnings
 
-from trollius import From
+from trollius import From, Return
+import trollius
+
 from wpull.abstract.client import DurationTimeout
 
 from wpull.connection import ConnectionPool, Connection
@@ -175,3 +177,71 @@ class TestClient(BadAppTestCase):
                 request = Request(self.get_url('/'))
                 yield From(session.fetch(request))
                 raise MyException('Oops')
+
+    @trollius.coroutine
+    def _fetch_pipelined(self, client, first_path):
+        @trollius.coroutine
+        def fetch(path):
+            with client.session() as session:
+                request = Request(self.get_url(path))
+                response = yield From(session.fetch(request))
+                file_obj = io.BytesIO()
+                yield From(session.read_content(file_obj))
+
+            raise Return((response.status_code, file_obj.getvalue()))
+
+        tasks = []
+
+        with client.session() as session:
+            request = Request(self.get_url(first_path))
+            yield From(session.fetch(request))
+
+            for num in range(3):
+                tasks.append(trollius.async(
+                    fetch('/content_length?{0}'.format(num))))
+
+            yield From(trollius.sleep(0.1))
+            yield From(session.read_content())
+
+        results = yield From(trollius.gather(*tasks))
+
+        for status_code, data in results:
+            self.assertEqual(200, status_code)
+            self.assertEqual(b'a' * 100, data)
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_pipelining(self):
+        recorder = MockRecorder()
+        connection_pool = ConnectionPool()
+        client = Client(pipeline_depth=4, recorder=recorder,
+                        connection_pool=connection_pool)
+
+        yield From(self._fetch_pipelined(client, '/content_length'))
+
+        self.assertEqual(3, client.pipeline_table.pipelined_count)
+        self.assertEqual(0, client.pipeline_table.fallback_count)
+        self.assertEqual(1, connection_pool.checkout_count)
+        self.assertEqual(4, recorder.request_data.count(b'GET '))
+        self.assertEqual(4, recorder.response_data.count(b'HTTP/1.1 200'))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_pipelining_fallback(self):
+        recorder = MockRecorder()
+        client = Client(pipeline_depth=4, recorder=recorder)
+
+        yield From(self._fetch_pipelined(
+            client, '/content_length_without_close'))
+
+        self.assertEqual(3, client.pipeline_table.pipelined_count)
+        self.assertEqual(3, client.pipeline_table.fallback_count)
+        self.assertEqual(4, recorder.request_data.count(b'GET '))
+        self.assertEqual(4, recorder.response_data.count(b'HTTP/1.1 200'))
+
+    @wpull.testing.async.async_test(timeout=DEFAULT_TIMEOUT)
+    def test_pipelining_connection_close(self):
+        client = Client(pipeline_depth=4)
+
+        yield From(self._fetch_pipelined(
+            client, '/content_length_with_close'))
+
+        self.assertEqual(0, client.pipeline_table.pipelined_count)
@@ -50,6 +50,9 @@ class Stream(object):
             2. bytes: the raw data
 
         connection: The underlying connection.
+        pipelined (bool): If True, other responses may follow on the
+            connection so the body is not read past its length. Data past
+            the length is otherwise discarded as an overrun.
     '''
     def __init__(self, connection, keep_alive=True, ignore_length=False):
         self._connection = connection
@@ -58,6 +61,7 @@ class Stream(object):
         self._data_observer = Observer()
         self._read_size = 4096*128
         self._decompressor = None
+        self.pipelined = False
 
     @property
     def connection(self):
@@ -278,7 +282,12 @@ class Stream(object):
         bytes_left = body_size
 
         while bytes_left > 0:
-            data = yield From(self._connection.read(self._read_size))
+            if self.pipelined:
+                read_size = min(bytes_left, self._read_size)
+            else:
+                read_size = self._read_size
+
+            data = yield From(self._connection.read(read_size))
 
             if not data:
                 break
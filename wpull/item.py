@@ -4,6 +4,9 @@ import collections
 import gettext
 import logging
 
+from trollius import From
+import trollius
+
 from wpull.backport.logging import BraceMessage as __
 from wpull.url import URLInfo
 
@@ -135,6 +138,7 @@ class URLItem(object):
         self._url_record = url_record
         self._url = self._url_record.url
         self._processed = False
+        self._status = None
         self._try_count_incremented = False
 
     @property
@@ -157,20 +161,30 @@ class URLItem(object):
         '''Return whether the item has been processed.'''
         return self._processed
 
+    @property
+    def status(self):
+        '''Return the status the item was marked with or None.'''
+        return self._status
+
     def skip(self):
         '''Mark the item as processed without download.'''
         _logger.debug(__(_('Skipping ‘{url}’.'), url=self._url))
         self._url_table.check_in(self._url, Status.skipped)
 
+        self._status = Status.skipped
         self._processed = True
 
-    def set_status(self, status, increment_try_count=True, filename=None):
+    def set_status(self, status, increment_try_count=True, filename=None,
+                   retry_time=None):
         '''Mark the item with the given status.
 
         Args:
             status (int): a value from :class:`Status`.
             increment_try_count (bool): if True, increment the ``try_count``
                 value
+            filename (str): The path to where the file was saved.
+            retry_time (float): If provided, the timestamp before which the
+                item is not checked out again. Used with ``error`` status.
         '''
         assert not self._try_count_incremented, (self._url, status)
 
@@ -178,13 +192,21 @@ class URLItem(object):
             self._try_count_incremented = True
 
         _logger.debug(__('Marking URL {0} status {1}.', self._url, status))
+
+        kwargs = {}
+
+        if retry_time is not None:
+            kwargs['retry_time'] = retry_time
+
         self._url_table.check_in(
             self._url,
             status,
             increment_try_count=increment_try_count,
             filename=filename,
+            **kwargs
         )
 
+        self._status = status
         self._processed = True
 
     def set_value(self, **kwargs):
@@ -220,14 +242,35 @@ class URLItem(object):
 
         See also :meth:`.database.base.BaseSQLURLTable.add_many`.
         '''
-        self._url_table.add_many(
-            [item if isinstance(item, dict) else {'url': item} for item in urls],
-            inline=(self._url_record.inline or 0) + 1 if inline else None,
-            level=self._url_record.level + 1 if level is None else level,
-            referrer=self._url_record.url,
-            top_url=self._url_record.top_url or self._url_record.url,
-            **kwargs
-        )
+        url_dicts, values = self._child_url_args(
+            urls, inline, level, kwargs)
+        self._url_table.add_many(url_dicts, **values)
+
+    @trollius.coroutine
+    def add_child_urls_async(self, urls, inline=False, level=None,
+                             **kwargs):
+        '''Add links scraped from the document with automatic values.
+
+        Coroutine version of :meth:`add_child_urls`.
+        '''
+        url_dicts, values = self._child_url_args(
+            urls, inline, level, kwargs)
+        yield From(self._url_table.add_many_async(url_dicts, **values))
+
+    def _child_url_args(self, urls, inline, level, kwargs):
+        '''Return the URL dicts and the column values for all URLs.'''
+        url_dicts = [
+            item if isinstance(item, dict) else {'url': item} for item in urls
+        ]
+        values = {
+            'inline': (self._url_record.inline or 0) + 1 if inline else None,
+            'level': self._url_record.level + 1 if level is None else level,
+            'referrer': self._url_record.url,
+            'top_url': self._url_record.top_url or self._url_record.url,
+        }
+        values.update(kwargs)
+
+        return url_dicts, values
 
     def child_url_record(self, url_info, inline=False,
                          link_type=None, post_data=None, level=None):
@@ -8,6 +8,7 @@ import ssl
 import sys
 
 from wpull.backport.logging import BraceMessage as __
+from wpull.database.base import CrawlOrder, CRAWL_ORDERS
 from wpull.util import IS_PYPY
 import wpull.resmon
 import wpull.string
@@ -133,6 +134,22 @@ class AppArgumentParser(argparse.ArgumentParser):
         else:
             return cls.int_0_inf(string)
 
+    @classmethod
+    def host_port(cls, string):
+        '''Convert a ``HOST:PORT`` string to a tuple.'''
+        host, sep, port = string.rpartition(':')
+
+        try:
+            port = int(port)
+        except ValueError as error:
+            raise argparse.ArgumentTypeError(error)
+
+        if not sep or not host or not 0 < port < 65536:
+            raise argparse.ArgumentTypeError(
+                _('Expected HOST:PORT. Got {string}.').format(string=string))
+
+        return host.strip('[]'), port
+
     @classmethod
     def comma_list(cls, string):
         '''Convert a comma separated string to list.'''
@@ -261,6 +278,56 @@ class AppArgumentParser(argparse.ArgumentParser):
             metavar='URI',
             help=_('save database tables at SQLAlchemy URI instead of memory'),
         )
+        database_group.add_argument(
+            '--coordinator',
+            metavar='HOST:PORT',
+            type=self.host_port,
+            help=_('share the URL table of a coordinator started with '
+                   '‘python3 -m wpull.coordinator’'),
+        )
+        group.add_argument(
+            '--coordinator-key',
+            metavar='KEY',
+            help=_('authenticate to the coordinator with the secret KEY'),
+        )
+        group.add_argument(
+            '--database-backend',
+            metavar='NAME',
+            choices=['sqlalchemy', 'sqlite3', 'sqlite3-fingerprint'],
+            default='sqlalchemy',
+            help=_('use backend NAME to access the database tables '
+                   'saved by --database. sqlite3-fingerprint keys URLs by '
+                   'hash for smaller files that only it can open'),
+        )
+        group.add_argument(
+            '--seen-url-filter',
+            metavar='RATE',
+            type=float,
+            help=_('skip looking up new URLs in a new database using a '
+                   'filter that misses them with probability RATE'),
+        )
+        group.add_argument(
+            '--seen-url-filter-memory',
+            metavar='NUMBER',
+            type=self.int_bytes,
+            default=64 * 2 ** 20,
+            help=_('use NUMBER bytes for --seen-url-filter. The number of '
+                   'URLs it holds grows with NUMBER'),
+        )
+        group.add_argument(
+            '--lease-timeout',
+            metavar='SECONDS',
+            type=float,
+            default=0,
+            help=_('put back URLs in progress in the database only after '
+                   'SECONDS so several processes can share it'),
+        )
+        group.add_argument(
+            '--checkpoint',
+            metavar='FILE',
+            help=_('save DNS results and robots.txt files to FILE while '
+                   'downloading and load them on start'),
+        )
         group.add_argument(
             '--concurrent',
             metavar='N',
@@ -268,6 +335,35 @@ class AppArgumentParser(argparse.ArgumentParser):
             type=self.int_0_inf,
             help=_('run at most N downloads at the same time'),
         )
+        group.add_argument(
+            '--host-concurrent',
+            metavar='N',
+            default=0,
+            type=self.int_0_inf,
+            help=_('run at most N downloads at the same time per host'),
+        )
+        group.add_argument(
+            '--adaptive-concurrency',
+            action='store_true',
+            help=_('adjust the number of downloads between 1 and '
+                   '--max-concurrent and per host up to --host-concurrent '
+                   'using errors and response times'),
+        )
+        group.add_argument(
+            '--max-concurrent',
+            metavar='N',
+            default=16,
+            type=int,
+            help=_('run at most N downloads when using '
+                   '--adaptive-concurrency'),
+        )
+        group.add_argument(
+            '--workers',
+            metavar='N',
+            default=1,
+            type=int,
+            help=_('split the crawl by host across N processes'),
+        )
         group.add_argument(
             '--debug-console-port',
             metavar='PORT',
@@ -570,6 +666,37 @@ class AppArgumentParser(argparse.ArgumentParser):
             default=10.0,
             help=_('wait up to SECONDS seconds on retries'),
         )
+        group.add_argument(
+            '--retry-delay',
+            metavar='SECONDS',
+            type=float,
+            default=0.0,
+            help=_('retry failed downloads after SECONDS seconds doubling '
+                   'up to --waitretry instead of after all other downloads'),
+        )
+        group.add_argument(
+            '--circuit-breaker',
+            metavar='N',
+            type=int,
+            default=0,
+            help=_('defer downloads from a host after N network errors '
+                   'in a row'),
+        )
+        group.add_argument(
+            '--circuit-breaker-cool-down',
+            metavar='SECONDS',
+            type=float,
+            default=60.0,
+            help=_('try a host again SECONDS seconds after '
+                   '--circuit-breaker defers it'),
+        )
+        group.add_argument(
+            '--host-wait',
+            metavar='SECONDS',
+            type=float,
+            default=0.0,
+            help=_('wait SECONDS seconds between requests to the same host'),
+        )
         group.add_argument(
             '--random-wait',
             action='store_true',
@@ -593,6 +720,18 @@ class AppArgumentParser(argparse.ArgumentParser):
             type=self.int_bytes,
             help=_('limit download bandwidth to RATE'),
         )
+        group.add_argument(
+            '--host-limit-rate',
+            metavar='RATE',
+            type=self.int_bytes,
+            help=_('limit download bandwidth of each host to RATE'),
+        )
+        group.add_argument(
+            '--limit-rate-burst',
+            metavar='SIZE',
+            type=self.int_bytes,
+            help=_('allow bursts of SIZE bytes over the download rate limits'),
+        )
         group.add_argument(
             '--no-dns-cache',
             action='store_false',
@@ -600,11 +739,39 @@ class AppArgumentParser(argparse.ArgumentParser):
             dest='dns_cache',
             help=_('disable caching of DNS lookups'),
         )
+        group.add_argument(
+            '--dns-cache-size',
+            metavar='NUMBER',
+            type=int,
+            default=1000,
+            help=_('cache the DNS lookups of up to NUMBER hosts'),
+        )
+        group.add_argument(
+            '--dns-negative-ttl',
+            metavar='SECONDS',
+            type=float,
+            default=60.0,
+            help=_('cache hosts that do not exist for SECONDS seconds'),
+        )
         group.add_argument(
             '--rotate-dns',
             action='store_true',
             help=_('use different resolved IP addresses on requests'),
         )
+        group.add_argument(
+            '--dns-prefetch',
+            metavar='NUMBER',
+            type=int,
+            default=0,
+            help=_('resolve up to NUMBER hostnames of upcoming URLs '
+                   'at once ahead of time'),
+        )
+        group.add_argument(
+            '--preconnect',
+            action='store_true',
+            help=_('open connections to the hosts resolved by '
+                   '--dns-prefetch ahead of time'),
+        )
         group.add_argument(
             '--no-skip-getaddrinfo',
             dest='always_getaddrinfo',
@@ -813,6 +980,20 @@ class AppArgumentParser(argparse.ArgumentParser):
             default=True,
             help=_('disable persistent HTTP connections')
         )
+        group.add_argument(
+            '--http-pipelining',
+            metavar='NUMBER',
+            type=int,
+            default=0,
+            help=_('send up to NUMBER GET requests on a persistent '
+                   'connection before reading the responses'),
+        )
+        group.add_argument(
+            '--keep-alive-timeout',
+            metavar='SECS',
+            type=float,
+            help=_('close persistent connections idle for SECS seconds'),
+        )
         group.add_argument(
             '--no-cookies',
             dest='cookies',
@@ -1120,6 +1301,15 @@ class AppArgumentParser(argparse.ArgumentParser):
             default=5,
             help=_('limit recursion depth to NUMBER')
         )
+        group.add_argument(
+            '--crawl-order',
+            metavar='ORDER',
+            choices=CRAWL_ORDERS,
+            default=CrawlOrder.default,
+            help=_('download URLs in ORDER: default, breadth-first, '
+                   'depth-first, inline-first, or priority as set by '
+                   'scripts'),
+        )
         group.add_argument(
             '--delete-after',
             action='store_true',
@@ -1405,9 +1595,77 @@ class AppArgumentParser(argparse.ArgumentParser):
                 (args.proxy_user and args.proxy_password):
             self.error(_('both username and password must be supplied'))
 
+        if (args.coordinator or args.workers > 1) and \
+                sys.version_info < (3, 3):
+            self.error(_('--workers and --coordinator require Python 3.3 '
+                         'or greater'))
+
+        if args.coordinator and not args.coordinator_key:
+            self.error(_('--coordinator requires --coordinator-key'))
+
+        if args.coordinator and args.crawl_order != CrawlOrder.default:
+            self.error(_('--crawl-order is set by the coordinator'))
+
+        if args.adaptive_concurrency and args.max_concurrent < 1:
+            self.error(_('maximum concurrency must be positive'))
+
+        if args.circuit_breaker < 0:
+            self.error(_('number of errors must not be negative'))
+
+        if args.lease_timeout < 0:
+            self.error(_('lease timeout must not be negative'))
+
+        if args.http_pipelining < 0:
+            self.error(_('pipelining depth must not be negative'))
+
+        if args.dns_cache_size < 1:
+            self.error(_('DNS cache size must be positive'))
+
+        if args.dns_negative_ttl < 0:
+            self.error(_('DNS negative TTL must not be negative'))
+
+        if args.dns_prefetch < 0:
+            self.error(_('number of prefetches must not be negative'))
+
+        if args.preconnect and not args.dns_prefetch:
+            self.error(_('--preconnect requires --dns-prefetch'))
+
+        if args.workers > 1:
+            self._post_workers_args(args)
+        elif args.workers < 1:
+            self.error(_('number of workers must be positive'))
+
+        if args.seen_url_filter is not None \
+                and not 0 < args.seen_url_filter < 1:
+            self.error(_('filter rate must be between 0 and 1'))
+
+        if args.seen_url_filter is not None \
+                and (args.database_uri or
+                     args.database_backend == 'sqlalchemy'):
+            self.error(_('--seen-url-filter requires --database-backend '
+                         'sqlite3 or sqlite3-fingerprint'))
+
         assert args.retr_symlinks in BOOLEAN_VALUES
         args.retr_symlinks = args.retr_symlinks in BOOLEAN_TRUE_VALUES
 
+    def _post_workers_args(self, args):
+        if sys.platform == 'win32':
+            self.error(_('Multiple workers are not supported on this OS.'))
+
+        option_names = ('output_document', 'zip', 'quota')
+
+        for option_name in option_names:
+            if vars(args).get(option_name):
+                self.error(
+                    _('Multiple workers cannot be combined with '
+                      '{option_name}.')
+                    .format(option_name=option_name)
+                )
+
+        if args.proxy_server and args.proxy_server_port:
+            self.error(
+                _('Multiple workers cannot share the proxy server port.'))
+
     def _post_warc_args(self, args):
         option_names = ('clobber_method', 'timestamping', 'continue_download')
 
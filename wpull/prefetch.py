@@ -0,0 +1,123 @@
+# encoding=utf-8
+'''Speculative DNS lookups and connections.'''
+import logging
+
+from trollius import From
+import trollius
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.cache import FIFOCache
+from wpull.errors import NetworkError, ProtocolError, SSLVerificationError
+
+
+_logger = logging.getLogger(__name__)
+
+
+class HostPrefetcher(object):
+    '''Resolve the hosts of upcoming URLs before they are processed.
+
+    Args:
+        resolver (:class:`.dns.Resolver`): The resolver used for lookups.
+            Its cache keeps the results.
+        connection_pool (:class:`.connection.ConnectionPool`): If provided,
+            an idle connection to each HTTP host is opened after the lookup
+            so the first request does not wait for the connection.
+        max_tasks (int): The maximum number of lookups and connections in
+            progress. Hosts fed while the budget is used up are skipped.
+        max_hosts (int): The number of prefetched hosts to remember.
+        time_to_live (float): The time in seconds a prefetched host is not
+            prefetched again.
+
+    Errors are ignored. The URL reports them when it is processed.
+
+    Attributes:
+        lookup_count (int): Number of hosts resolved.
+        connect_count (int): Number of connections opened.
+        skip_count (int): Number of hosts skipped because of the budget.
+        error_count (int): Number of lookups or connections that failed.
+    '''
+    def __init__(self, resolver, connection_pool=None, max_tasks=10,
+                 max_hosts=1000, time_to_live=600):
+        assert max_tasks > 0, \
+            'Expect positive budget. Got {}.'.format(max_tasks)
+
+        self._resolver = resolver
+        self._connection_pool = connection_pool
+        self._max_tasks = max_tasks
+        self._seen_hosts = FIFOCache(max_items=max_hosts,
+                                     time_to_live=time_to_live)
+        self._tasks = set()
+
+        self.lookup_count = 0
+        self.connect_count = 0
+        self.skip_count = 0
+        self.error_count = 0
+
+    @property
+    def task_count(self):
+        '''Return the number of prefetches in progress.'''
+        return len(self._tasks)
+
+    def feed(self, url_records):
+        '''Prefetch the hosts of the given URLs.
+
+        Args:
+            url_records (list): A list of :class:`.item.URLRecord`.
+        '''
+        for url_record in url_records:
+            try:
+                url_info = url_record.url_info
+            except ValueError:
+                # The URL reports the error when it is processed
+                continue
+
+            hostname = url_info.hostname
+
+            if not hostname:
+                continue
+
+            use_ssl = url_info.scheme == 'https'
+            key = (hostname, url_info.port, use_ssl)
+
+            if key in self._seen_hosts:
+                continue
+
+            if len(self._tasks) >= self._max_tasks:
+                self.skip_count += 1
+                continue
+
+            self._seen_hosts[key] = True
+
+            preconnect = self._connection_pool and \
+                url_info.scheme in ('http', 'https')
+
+            task = trollius.async(self._prefetch(key, preconnect))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def close(self):
+        '''Cancel the prefetches in progress.'''
+        for task in tuple(self._tasks):
+            task.cancel()
+
+        self._tasks.clear()
+
+    @trollius.coroutine
+    def _prefetch(self, key, preconnect):
+        hostname, port, use_ssl = key
+
+        _logger.debug(__('Prefetch {0}.', key))
+
+        try:
+            yield From(self._resolver.resolve(hostname, port))
+            self.lookup_count += 1
+
+            if preconnect:
+                connected = yield From(
+                    self._connection_pool.preconnect(hostname, port, use_ssl))
+
+                if connected:
+                    self.connect_count += 1
+        except (NetworkError, ProtocolError, SSLVerificationError) as error:
+            _logger.debug(__('Prefetch {0} failed: {1}', key, error))
+            self.error_count += 1
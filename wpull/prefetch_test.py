@@ -0,0 +1,104 @@
+# encoding=utf-8
+from trollius import From, Return
+import trollius
+
+from wpull.connection import ConnectionPool
+from wpull.dns import Resolver
+from wpull.errors import DNSNotFound
+from wpull.prefetch import HostPrefetcher
+from wpull.testing.async import AsyncTestCase
+import wpull.testing.async
+from wpull.testing.badapp import BadAppTestCase
+from wpull.testing.util import new_url_record
+
+
+class MockResolver(object):
+    def __init__(self):
+        self.hosts = []
+        self.event = trollius.Event()
+
+    @trollius.coroutine
+    def resolve(self, host, port=0):
+        self.hosts.append(host)
+        yield From(self.event.wait())
+
+        if host == 'bad.example':
+            raise DNSNotFound('Not found.')
+
+        raise Return((2, ('127.0.0.1', port)))
+
+
+class TestPrefetch(AsyncTestCase):
+    @wpull.testing.async.async_test()
+    def test_budget(self):
+        resolver = MockResolver()
+        prefetcher = HostPrefetcher(resolver, max_tasks=2)
+
+        prefetcher.feed([
+            new_url_record('http://a.example/1'),
+            new_url_record('http://a.example/2'),
+            new_url_record('mailto:user@a.example'),
+            new_url_record('http://[bad/'),
+            new_url_record('http://bad.example/'),
+            new_url_record('http://c.example/'),
+        ])
+
+        self.assertEqual(2, prefetcher.task_count)
+        self.assertEqual(1, prefetcher.skip_count)
+
+        resolver.event.set()
+        yield From(trollius.sleep(0.01))
+
+        self.assertEqual(['a.example', 'bad.example'], resolver.hosts)
+        self.assertEqual(0, prefetcher.task_count)
+        self.assertEqual(1, prefetcher.lookup_count)
+        self.assertEqual(1, prefetcher.error_count)
+
+        prefetcher.feed([
+            new_url_record('http://a.example/3'),
+            new_url_record('http://c.example/'),
+        ])
+        yield From(trollius.sleep(0.01))
+
+        self.assertEqual(['a.example', 'bad.example', 'c.example'],
+                         resolver.hosts)
+        self.assertEqual(2, prefetcher.lookup_count)
+
+    @wpull.testing.async.async_test()
+    def test_close(self):
+        resolver = MockResolver()
+        prefetcher = HostPrefetcher(resolver)
+
+        prefetcher.feed([new_url_record('http://a.example/')])
+        yield From(trollius.sleep(0.01))
+        prefetcher.close()
+
+        self.assertEqual(0, prefetcher.task_count)
+
+        resolver.event.set()
+        yield From(trollius.sleep(0.01))
+
+        self.assertEqual(0, prefetcher.lookup_count)
+
+
+class TestPrefetchConnection(BadAppTestCase):
+    @wpull.testing.async.async_test()
+    def test_preconnect(self):
+        connection_pool = ConnectionPool()
+        prefetcher = HostPrefetcher(Resolver(), connection_pool)
+        url = 'http://localhost:{0}/'.format(self.get_http_port())
+
+        prefetcher.feed([new_url_record(url)])
+
+        while prefetcher.task_count:
+            yield From(trollius.sleep(0.01))
+
+        self.assertEqual(1, prefetcher.lookup_count)
+        self.assertEqual(1, prefetcher.connect_count)
+        self.assertEqual(0, connection_pool.checkout_count)
+
+        connection = yield From(connection_pool.acquire(
+            'localhost', self.get_http_port()))
+
+        self.assertFalse(connection.closed())
+        self.assertEqual(1, connection_pool.reuse_count)
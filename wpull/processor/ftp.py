@@ -331,7 +331,7 @@ class FTPProcessorSession(BaseProcessorSession):
             raise Return(wait_time)
         else:
             self._log_response(request, response)
-            self._handle_response(request, response)
+            yield From(self._handle_response(request, response))
 
             wait_time = self._result_rule.get_wait_time(
                 request, self._url_item.url_record, response=response
@@ -346,8 +346,12 @@ class FTPProcessorSession(BaseProcessorSession):
 
             raise Return(wait_time)
 
+    @trollius.coroutine
     def _add_listing_links(self, response):
-        '''Add links from file listing response.'''
+        '''Add links from file listing response.
+
+        Coroutine.
+        '''
         base_url = response.request.url_info.url
         dir_urls_to_add = set()
         file_urls_to_add = set()
@@ -389,8 +393,10 @@ class FTPProcessorSession(BaseProcessorSession):
                         else:
                             file_urls_to_add.add(linked_url_info.url)
 
-        self._url_item.add_child_urls(dir_urls_to_add, link_type=LinkType.directory)
-        self._url_item.add_child_urls(file_urls_to_add, link_type=LinkType.file, level=level)
+        yield From(self._url_item.add_child_urls_async(
+            dir_urls_to_add, link_type=LinkType.directory))
+        yield From(self._url_item.add_child_urls_async(
+            file_urls_to_add, link_type=LinkType.file, level=level))
 
     def _log_response(self, request, response):
         '''Log response.'''
@@ -403,8 +409,12 @@ class FTPProcessorSession(BaseProcessorSession):
             content_length=response.body.size(),
         ))
 
+    @trollius.coroutine
     def _handle_response(self, request, response):
-        '''Process a response.'''
+        '''Process a response.
+
+        Coroutine.
+        '''
         self._url_item.set_value(status_code=response.reply.code)
         is_listing = isinstance(response, ListingResponse)
 
@@ -417,9 +427,9 @@ class FTPProcessorSession(BaseProcessorSession):
             action = self._result_rule.handle_no_document(request, response, self._url_item)
 
         if isinstance(response, ListingResponse):
-            self._add_listing_links(response)
+            yield From(self._add_listing_links(response))
 
-        return action
+        raise Return(action)
 
     def _make_symlink(self, link_name, link_target):
         '''Make a symlink on the system.'''
@@ -1,6 +1,7 @@
 '''Fetching rules.'''
 import logging
 import random
+import time
 
 from trollius import From, Return
 import trollius
@@ -9,7 +10,7 @@ from wpull.backport.logging import BraceMessage as __
 from wpull.hook import HookableMixin, HookDisconnected, Actions, HookStop
 from wpull.item import Status, LinkType
 from wpull.errors import DNSNotFound, ServerError, ConnectionRefused, \
-    SSLVerificationError, ProtocolError
+    SSLVerificationError, ProtocolError, NetworkError
 from wpull.scraper.css import CSSScraper
 from wpull.scraper.html import HTMLScraper
 import wpull.url
@@ -187,15 +188,26 @@ class ResultRule(HookableMixin):
             to be permanent error.
         waiter (:class:`.waiter.Waiter`): The Waiter.
         statistics (:class:`.stats.Statistics`): The Statistics.
+        retry_delay (float): If provided, items with errors are given a
+            retry time this many seconds away, doubled for each previous
+            try. The waiter is not incremented on errors.
+        max_retry_delay (float): The maximum delay of a retry.
+        circuit_breaker (:class:`.circuit.CircuitBreaker`): If provided,
+            it is told about responses and network errors of each host.
     '''
     def __init__(self, ssl_verification=False, retry_connrefused=False,
-                 retry_dns_error=False, waiter=None, statistics=None):
+                 retry_dns_error=False, waiter=None, statistics=None,
+                 retry_delay=0.0, max_retry_delay=3600.0,
+                 circuit_breaker=None):
         super().__init__()
         self._ssl_verification = ssl_verification
         self.retry_connrefused = retry_connrefused
         self.retry_dns_error = retry_dns_error
         self._waiter = waiter
         self._statistics = statistics
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._circuit_breaker = circuit_breaker
 
         self.register_hook(
             'wait_time', 'handle_response', 'handle_pre_response',
@@ -223,6 +235,7 @@ class ResultRule(HookableMixin):
             str: A value from :class:`.hook.Actions`.
         '''
         self._waiter.reset()
+        self._add_host_success(request)
 
         action = self.handle_response(request, response, url_item)
 
@@ -239,6 +252,7 @@ class ResultRule(HookableMixin):
             str: A value from :class:`.hook.Actions`.
         '''
         self._waiter.reset()
+        self._add_host_success(request)
 
         action = self.handle_response(request, response, url_item)
 
@@ -254,6 +268,7 @@ class ResultRule(HookableMixin):
             str: A value from :class:`.hook.Actions`.
         '''
         self._waiter.reset()
+        self._add_host_success(request)
 
         action = self.handle_response(request, response, url_item)
 
@@ -265,14 +280,15 @@ class ResultRule(HookableMixin):
         Returns:
             str: A value from :class:`.hook.Actions`.
         '''
-        self._waiter.increment()
+        self._increment_wait()
+        self._add_host_success(request)
 
-        self._statistics.errors[ServerError] += 1
+        self._statistics.increment_error(ServerError())
 
         action = self.handle_response(request, response, url_item)
 
         if action == Actions.NORMAL:
-            url_item.set_status(Status.error)
+            self._set_error_status(url_item)
 
         return action
 
@@ -286,7 +302,7 @@ class ResultRule(HookableMixin):
             request, response, url_item.url_record)
 
         if action == Actions.RETRY:
-            url_item.set_status(Status.error)
+            self._set_error_status(url_item)
         elif action == Actions.FINISH:
             url_item.set_status(Status.done)
         elif action == Actions.STOP:
@@ -308,12 +324,17 @@ class ResultRule(HookableMixin):
         else:
             self._statistics.increment_error(error)
 
-        self._waiter.increment()
+        self._increment_wait()
+
+        if self._circuit_breaker and isinstance(error, NetworkError) \
+                and request:
+            self._circuit_breaker.add_failure(
+                request.url_info.hostname, url_item.url_record.url)
 
         action = self.consult_error_hook(request, url_item.url_record, error)
 
         if action == Actions.RETRY:
-            url_item.set_status(Status.error)
+            self._set_error_status(url_item)
         elif action == Actions.FINISH:
             url_item.set_status(Status.done)
         elif action == Actions.STOP:
@@ -327,10 +348,47 @@ class ResultRule(HookableMixin):
                 not self.retry_dns_error:
             url_item.set_status(Status.skipped)
         else:
-            url_item.set_status(Status.error)
+            self._set_error_status(url_item)
 
         return action
 
+    def _increment_wait(self):
+        '''Slow down after an error unless retries are delayed instead.'''
+        if not self._retry_delay:
+            self._waiter.increment()
+
+    def _add_host_success(self, request):
+        '''Tell the circuit breaker the host responded.'''
+        if self._circuit_breaker and request:
+            self._circuit_breaker.add_success(request.url_info.hostname)
+
+    def _set_error_status(self, url_item):
+        '''Mark the item as an error to be tried again later.'''
+        if self._retry_delay:
+            retry_delay = self.get_retry_delay(url_item.url_record)
+
+            _logger.debug(__('Retry {0} in {1:.1f} seconds.',
+                             url_item.url_record.url, retry_delay))
+
+            url_item.set_status(
+                Status.error, retry_time=time.time() + retry_delay)
+        else:
+            url_item.set_status(Status.error)
+
+    def get_retry_delay(self, url_record):
+        '''Return the time in seconds before the item may be tried again.
+
+        The delay doubles with each try up to the maximum. It is perturbed
+        randomly within a factor of 0.5 and 1 so retries of many items
+        failing at once are spread out.
+        '''
+        delay = min(
+            self._max_retry_delay,
+            self._retry_delay * 2 ** min(url_record.try_count, 32)
+        )
+
+        return delay * random.uniform(0.5, 1.0)
+
     def get_wait_time(self, request, url_record, response=None, error=None):
         '''Return the wait time in seconds between requests.'''
         seconds = self._waiter.get()
@@ -386,8 +444,12 @@ class ProcessingRule(HookableMixin):
 
     parse_url = staticmethod(wpull.url.parse_url_or_log)
 
+    @trollius.coroutine
     def add_extra_urls(self, url_item):
-        '''Add additional URLs such as robots.txt, favicon.ico.'''
+        '''Add additional URLs such as robots.txt, favicon.ico.
+
+        Coroutine.
+        '''
 
         if url_item.url_record.level == 0 and self._sitemaps:
             extra_url_infos = (
@@ -403,12 +465,16 @@ class ProcessingRule(HookableMixin):
                 )
             )
 
-            url_item.add_child_urls(
+            yield From(url_item.add_child_urls_async(
                 [url_info.url for url_info in extra_url_infos]
-            )
+            ))
 
+    @trollius.coroutine
     def scrape_document(self, request, response, url_item):
-        '''Process document for links.'''
+        '''Process document for links.
+
+        Coroutine.
+        '''
         try:
             self.call_hook(
                 'scrape_document', request, response, url_item
@@ -427,9 +493,9 @@ class ProcessingRule(HookableMixin):
         num_linked_urls = 0
 
         for scraper, scrape_result in demux_info.items():
-            new_inline, new_linked = self._process_scrape_info(
+            new_inline, new_linked = yield From(self._process_scrape_info(
                 scraper, scrape_result, url_item
-            )
+            ))
             num_inline_urls += new_inline
             num_linked_urls += new_linked
 
@@ -437,10 +503,14 @@ class ProcessingRule(HookableMixin):
                          num_inline_urls, num_linked_urls
         ))
 
+    @trollius.coroutine
     def _process_scrape_info(self, scraper, scrape_result, url_item):
-        '''Collect the URLs from the scrape info dict.'''
+        '''Collect the URLs from the scrape info dict.
+
+        Coroutine.
+        '''
         if not scrape_result:
-            return 0, 0
+            raise Return(0, 0)
 
         urls_to_be_added = []
         num_inline = 0
@@ -465,9 +535,9 @@ class ProcessingRule(HookableMixin):
                     else:
                         num_linked += 1
 
-        url_item.add_child_urls(urls_to_be_added)
+        yield From(url_item.add_child_urls_async(urls_to_be_added))
 
-        return num_inline, num_linked
+        raise Return(num_inline, num_linked)
 
     def rewrite_url(self, url_info):
         '''Return a rewritten URL such as escaped fragment.'''
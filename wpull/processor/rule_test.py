@@ -1,6 +1,30 @@
 import unittest
 
-from wpull.processor.rule import ProcessingRule
+from trollius import From
+
+from wpull.circuit import CircuitBreaker, CircuitState
+from wpull.coprocessor.proxy import MockURLItem
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.errors import NetworkTimedOut, ProtocolError
+from wpull.http.request import Request, Response
+from wpull.item import Status, URLItem
+from wpull.processor.rule import FetchRule, ProcessingRule, ResultRule
+from wpull.stats import Statistics
+from wpull.testing.async import AsyncTestCase
+from wpull.testing.util import new_url_record
+from wpull.waiter import LinearWaiter
+import wpull.testing.async
+
+
+class MockURLTable(SQLiteURLTable):
+    def __init__(self):
+        super().__init__(':memory:')
+        self.async_urls = []
+
+    def add_many_async(self, urls, **kwargs):
+        urls = list(urls)
+        self.async_urls.extend(item['url'] for item in urls)
+        return super().add_many_async(urls, **kwargs)
 
 
 class TestRule(unittest.TestCase):
@@ -17,3 +41,46 @@ class TestRule(unittest.TestCase):
         self.assertFalse(
             ProcessingRule.parse_url('.xn--hda.com/')
         )
+
+    def test_result_rule_circuit_breaker(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2)
+        result_rule = ResultRule(
+            waiter=LinearWaiter(), statistics=Statistics(),
+            circuit_breaker=circuit_breaker
+        )
+        request = Request('http://example.com/')
+        url_item = MockURLItem(
+            request.url_info, new_url_record('http://example.com/'))
+
+        result_rule.handle_error(request, NetworkTimedOut(), url_item)
+        result_rule.handle_error(request, ProtocolError(), url_item)
+        result_rule.handle_no_document(request, Response(), url_item)
+        result_rule.handle_error(request, NetworkTimedOut(), url_item)
+
+        self.assertEqual(
+            CircuitState.closed, circuit_breaker.get_state('example.com'))
+
+        result_rule.handle_error(request, NetworkTimedOut(), url_item)
+
+        self.assertEqual(
+            CircuitState.open, circuit_breaker.get_state('example.com'))
+
+
+class TestProcessingRule(AsyncTestCase):
+    @wpull.testing.async.async_test()
+    def test_add_extra_urls(self):
+        url_table = MockURLTable()
+        url_table.add_many([{'url': 'http://example.com/'}], level=0)
+        url_record = url_table.check_out(Status.todo)
+        url_item = URLItem(url_table, url_record.url_info, url_record)
+        processing_rule = ProcessingRule(FetchRule(), sitemaps=True)
+
+        yield From(processing_rule.add_extra_urls(url_item))
+
+        self.assertEqual(
+            ['http://example.com/robots.txt',
+             'http://example.com/sitemap.xml'],
+            url_table.async_urls
+        )
+        self.assertEqual(
+            1, url_table.get_one('http://example.com/sitemap.xml').level)
@@ -206,7 +206,7 @@ class WebProcessorSession(BaseProcessorSession):
         if not ok:
             return
 
-        self._processing_rule.add_extra_urls(self._url_item)
+        yield From(self._processing_rule.add_extra_urls(self._url_item))
 
         self._web_client_session = self._processor.web_client.session(
             self._new_initial_request()
@@ -336,7 +336,7 @@ class WebProcessorSession(BaseProcessorSession):
             raise Return(True, wait_time)
         else:
             self._log_response(request, response)
-            action = self._handle_response(request, response)
+            action = yield From(self._handle_response(request, response))
             wait_time = self._result_rule.get_wait_time(
                 request, self._url_item.url_record, response=response
             )
@@ -432,9 +432,12 @@ class WebProcessorSession(BaseProcessorSession):
                 response.fields.get('Content-Type', _('unspecified'))),
         ))
 
+    @trollius.coroutine
     def _handle_response(self, request, response):
         '''Process the response.
 
+        Coroutine.
+
         Returns:
             str: A value from :class:`.hook.Actions`.
         '''
@@ -444,32 +447,32 @@ class WebProcessorSession(BaseProcessorSession):
                 self._web_client_session.loop_type() == LoopType.authentication:
             self._file_writer_session.discard_document(response)
 
-            return self._result_rule.handle_intermediate_response(
+            raise Return(self._result_rule.handle_intermediate_response(
                 request, response, self._url_item
-            )
+            ))
         elif (response.status_code in self._document_codes
               or self._processor.fetch_params.content_on_error):
             filename = self._file_writer_session.save_document(response)
 
-            self._processing_rule.scrape_document(
+            yield From(self._processing_rule.scrape_document(
                 request, response, self._url_item
-            )
+            ))
 
-            return self._result_rule.handle_document(
+            raise Return(self._result_rule.handle_document(
                 request, response, self._url_item, filename
-            )
+            ))
         elif response.status_code in self._no_document_codes:
             self._file_writer_session.discard_document(response)
 
-            return self._result_rule.handle_no_document(
+            raise Return(self._result_rule.handle_no_document(
                 request, response, self._url_item
-            )
+            ))
         else:
             self._file_writer_session.discard_document(response)
 
-            return self._result_rule.handle_document_error(
+            raise Return(self._result_rule.handle_document_error(
                 request, response, self._url_item
-            )
+            ))
 
     def _close_instance_body(self, instance):
         '''Close any files on instance.
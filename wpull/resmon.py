@@ -2,8 +2,13 @@
 import collections
 import gettext
 import logging
+import time
+
+from trollius import From
+import trollius
 
 from wpull.backport.logging import BraceMessage as __
+import wpull.string
 
 
 _logger = logging.getLogger(__name__)
@@ -20,6 +25,12 @@ except ImportError as error:
     psutil = None
 
 
+if psutil:
+    _SAMPLE_ERRORS = (OSError, psutil.Error)
+else:
+    _SAMPLE_ERRORS = (OSError,)
+
+
 ResourceInfo = collections.namedtuple(
     'ResourceInfoType',
     ['path', 'free', 'limit']
@@ -42,14 +53,33 @@ class ResourceMonitor(object):
             include temporary directories and the current working directory.
         min_disk (int, optional): Minimum disk space in bytes.
         min_memory (int, optional): Minimum memory in bytes.
+        interval (float): The time in seconds between samples.
+        exceeded_interval (float): The time in seconds between samples
+            while a limit is exceeded.
+        reminder_interval (float): The time in seconds between repeated
+            warnings while a limit is exceeded.
+
+    Call :meth:`start` to sample the levels periodically in a background
+    task. The levels are read in a thread so slow file systems do not
+    block the event loop. Use :attr:`is_ready` and :meth:`wait_ready`
+    to find out whether the last sample was within the limits.
     '''
     def __init__(self, resource_paths=('/',), min_disk=10000,
-                 min_memory=10000):
+                 min_memory=10000, interval=5.0, exceeded_interval=1.0,
+                 reminder_interval=900.0):
         assert not isinstance(resource_paths, str), type(resource_paths)
 
         self._resource_paths = resource_paths
         self._min_disk = min_disk
         self._min_memory = min_memory
+        self._interval = interval
+        self._exceeded_interval = exceeded_interval
+        self._reminder_interval = reminder_interval
+        self._resource_info = None
+        self._ready_event = trollius.Event()
+        self._ready_event.set()
+        self._task = None
+        self._last_warning_time = None
 
         if not psutil:
             raise OSError('psutil is not available')
@@ -78,3 +108,108 @@ class ResourceMonitor(object):
         for info in self.get_info():
             if info.free < info.limit:
                 return info
+
+    @property
+    def resource_info(self):
+        '''Return the ResourceInfo exceeding limits from the last sample.
+
+        Returns:
+            None, ResourceInfo
+        '''
+        return self._resource_info
+
+    @property
+    def is_ready(self):
+        '''Return whether no levels were exceeded in the last sample.'''
+        return self._ready_event.is_set()
+
+    @trollius.coroutine
+    def wait_ready(self):
+        '''Wait until no levels are exceeded or the monitor is stopped.
+
+        Coroutine.
+        '''
+        yield From(self._ready_event.wait())
+
+    def start(self):
+        '''Start sampling in a background task.'''
+        if not self._task:
+            self._task = trollius.async(self._run())
+
+    def stop(self):
+        '''Stop sampling and wake up any waiters.'''
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        self._ready_event.set()
+
+    @trollius.coroutine
+    def sample(self):
+        '''Check the resource levels in a thread and update the state.
+
+        Coroutine.
+        '''
+        event_loop = trollius.get_event_loop()
+        resource_info = yield From(
+            event_loop.run_in_executor(None, self.check))
+
+        self._update(resource_info)
+
+    @trollius.coroutine
+    def _run(self):
+        try:
+            while True:
+                try:
+                    yield From(self.sample())
+                except _SAMPLE_ERRORS as error:
+                    # A level that cannot be read does not hold up the
+                    # waiters
+                    _logger.warning(__(
+                        _('Failed to check resource levels: {error}'),
+                        error=error
+                    ))
+                    self._update(None)
+
+                if self._resource_info:
+                    yield From(trollius.sleep(self._exceeded_interval))
+                else:
+                    yield From(trollius.sleep(self._interval))
+        finally:
+            self._ready_event.set()
+
+    def _update(self, resource_info):
+        '''Publish the sample and log changes.'''
+        self._resource_info = resource_info
+
+        if not resource_info:
+            if not self._ready_event.is_set():
+                _logger.info(_('Situation cleared.'))
+                self._ready_event.set()
+
+            self._last_warning_time = None
+            return
+
+        self._ready_event.clear()
+
+        if self._last_warning_time is None or \
+                time.time() - self._last_warning_time >= \
+                self._reminder_interval:
+            self._last_warning_time = time.time()
+            self._log_exceeded(resource_info)
+
+    @classmethod
+    def _log_exceeded(cls, resource_info):
+        if resource_info.path:
+            _logger.warning(__(
+                _('Low disk space on {path} ({size} free).'),
+                path=resource_info.path,
+                size=wpull.string.format_size(resource_info.free)
+            ))
+        else:
+            _logger.warning(__(
+                _('Low memory ({size} free).'),
+                size=wpull.string.format_size(resource_info.free)
+            ))
+
+        _logger.warning(_('Waiting for operator to clear situation.'))
@@ -0,0 +1,127 @@
+# encoding=utf-8
+import unittest
+
+from trollius import From
+import trollius
+
+from wpull.resmon import ResourceMonitor, ResourceInfo
+from wpull.testing.async import AsyncTestCase
+import wpull.resmon
+import wpull.testing.async
+
+
+class MockResourceMonitor(ResourceMonitor):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.free = 100
+        self.sample_count = 0
+
+    def get_info(self):
+        self.sample_count += 1
+
+        if self.free is None:
+            raise OSError('No such file or directory')
+
+        yield ResourceInfo(None, self.free, 50)
+
+
+@unittest.skipIf(not wpull.resmon.psutil, 'psutil not available')
+class TestResourceMonitor(AsyncTestCase):
+    def test_check(self):
+        monitor = ResourceMonitor(resource_paths=['/'], min_disk=1,
+                                  min_memory=1)
+
+        self.assertFalse(monitor.check())
+
+        monitor = ResourceMonitor(resource_paths=['/'], min_disk=2 ** 80,
+                                  min_memory=0)
+
+        self.assertEqual('/', monitor.check().path)
+
+    @wpull.testing.async.async_test()
+    def test_sample(self):
+        monitor = MockResourceMonitor()
+
+        yield From(monitor.sample())
+
+        self.assertTrue(monitor.is_ready)
+        self.assertFalse(monitor.resource_info)
+
+        monitor.free = 10
+        yield From(monitor.sample())
+
+        self.assertFalse(monitor.is_ready)
+        self.assertEqual(10, monitor.resource_info.free)
+
+        monitor.free = 100
+        yield From(monitor.sample())
+
+        self.assertTrue(monitor.is_ready)
+
+    @wpull.testing.async.async_test()
+    def test_background(self):
+        monitor = MockResourceMonitor(interval=0.01, exceeded_interval=0.01)
+        monitor.free = 10
+        monitor.start()
+
+        yield From(trollius.sleep(0.05))
+
+        self.assertFalse(monitor.is_ready)
+
+        sample_count = monitor.sample_count
+        event_loop = trollius.get_event_loop()
+        event_loop.call_later(0.05, setattr, monitor, 'free', 100)
+
+        yield From(trollius.wait_for(monitor.wait_ready(), 1))
+
+        self.assertTrue(monitor.is_ready)
+        self.assertGreater(monitor.sample_count, sample_count)
+
+        monitor.stop()
+        sample_count = monitor.sample_count
+
+        yield From(trollius.sleep(0.05))
+
+        self.assertEqual(sample_count, monitor.sample_count)
+
+    @wpull.testing.async.async_test()
+    def test_background_error(self):
+        monitor = MockResourceMonitor(interval=0.01, exceeded_interval=0.01)
+        monitor.free = 10
+        monitor.start()
+
+        yield From(trollius.sleep(0.05))
+
+        self.assertFalse(monitor.is_ready)
+
+        monitor.free = None
+
+        yield From(trollius.wait_for(monitor.wait_ready(), 1))
+
+        self.assertTrue(monitor.is_ready)
+        sample_count = monitor.sample_count
+
+        yield From(trollius.sleep(0.05))
+
+        self.assertGreater(monitor.sample_count, sample_count)
+
+        monitor.free = 10
+
+        yield From(trollius.sleep(0.05))
+
+        self.assertFalse(monitor.is_ready)
+
+        monitor.stop()
+
+    @wpull.testing.async.async_test()
+    def test_stop_wakes_waiters(self):
+        monitor = MockResourceMonitor()
+        monitor.free = 10
+
+        yield From(monitor.sample())
+
+        self.assertFalse(monitor.is_ready)
+
+        trollius.get_event_loop().call_soon(monitor.stop)
+
+        yield From(trollius.wait_for(monitor.wait_ready(), 1))
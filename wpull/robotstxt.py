@@ -14,6 +14,7 @@ class RobotsTxtPool(object):
     '''Pool of robots.txt parsers.'''
     def __init__(self):
         self._parsers = {}
+        self._texts = {}
 
     def has_parser(self, url_info):
         '''Return whether a parser has been created for the URL.'''
@@ -29,11 +30,32 @@ class RobotsTxtPool(object):
 
     def load_robots_txt(self, url_info, text):
         '''Load the robot.txt file.'''
-        key = self.url_info_key(url_info)
+        self._load(self.url_info_key(url_info), text)
+
+    def _load(self, key, text):
+        if isinstance(text, (bytes, bytearray)):
+            # Same as the parser so the text can be saved as a string
+            text = text.decode('iso-8859-1')
+
         parser = robotexclusionrulesparser.RobotExclusionRulesParser()
         parser.parse(text)
 
         self._parsers[key] = parser
+        self._texts[key] = text
+
+    def get_texts(self):
+        '''Return the loaded robots.txt files.
+
+        Returns:
+            list: A list of tuples containing the key from
+            :meth:`url_info_key` and the text.
+        '''
+        return list(self._texts.items())
+
+    def load_texts(self, texts):
+        '''Load the robots.txt files returned by :meth:`get_texts`.'''
+        for key, text in texts:
+            self._load(tuple(key), text)
 
     @classmethod
     def url_info_key(cls, url_info):
@@ -0,0 +1,163 @@
+# encoding=utf-8
+'''Loading of input URLs into the URL table.'''
+import gettext
+import itertools
+import logging
+import time
+
+from trollius import From
+import trollius
+
+from wpull.backport.logging import BraceMessage as __
+import wpull.observer
+
+
+_logger = logging.getLogger(__name__)
+_ = gettext.gettext
+
+
+class SeedLoader(object):
+    '''Insert input URLs into the URL table in batches.
+
+    Args:
+        url_table (:class:`.database.base.BaseURLTable`): The URL table.
+        url_infos: An iterable of :class:`.url.URLInfo`. It is consumed
+            lazily in a thread so the URLs are parsed while earlier batches
+            are inserted.
+        batch_size (int): The number of URLs inserted in one transaction.
+        early_start (bool): Whether URLs may be processed before all of the
+            input URLs are loaded. If False, the engine waits until loading
+            is finished.
+        report_interval (float): The time in seconds between progress log
+            messages.
+
+    Attributes:
+        batch_observer (:class:`.observer.Observer`): Called with a tuple of
+            :class:`.url.URLInfo` before each batch is inserted.
+    '''
+    def __init__(self, url_table, url_infos, batch_size=5000,
+                 early_start=True, report_interval=30):
+        super().__init__()
+        assert batch_size > 0, \
+            'Expect positive batch size. Got {}.'.format(batch_size)
+        self._url_table = url_table
+        self._url_infos = iter(url_infos)
+        self._batch_size = batch_size
+        self._early_start = early_start
+        self._report_interval = report_interval
+        self._loading = True
+        self._loaded_count = 0
+        self._event = trollius.Event()
+        self.batch_observer = wpull.observer.Observer()
+
+    @property
+    def early_start(self):
+        '''Return whether URLs may be processed while loading.'''
+        return self._early_start
+
+    @property
+    def loading(self):
+        '''Return whether more input URLs may be added.'''
+        return self._loading
+
+    @property
+    def loaded_count(self):
+        '''Return the number of input URLs inserted so far.'''
+        return self._loaded_count
+
+    @trollius.coroutine
+    def load(self):
+        '''Read all the input URLs and insert them.
+
+        The next batch is parsed in a thread while the previous batch is
+        inserted.
+
+        Coroutine.
+        '''
+        event_loop = trollius.get_event_loop()
+        time_start = time.time()
+        report_time = time_start
+        insert_task = None
+
+        try:
+            while True:
+                read_future = event_loop.run_in_executor(
+                    None, self._read_batch)
+
+                if insert_task:
+                    yield From(insert_task)
+                    insert_task = None
+
+                url_infos = yield From(read_future)
+
+                if not url_infos:
+                    break
+
+                self.batch_observer.notify(url_infos)
+
+                insert_task = trollius.async(self._insert_batch(url_infos))
+
+                if time.time() - report_time >= self._report_interval:
+                    report_time = time.time()
+                    self._log_progress(time_start)
+        finally:
+            if insert_task:
+                insert_task.cancel()
+
+            self._loading = False
+            self._event.set()
+
+        if self._loaded_count:
+            self._log_progress(time_start, finished=True)
+
+    def _read_batch(self):
+        '''Return the next batch of input URLs.'''
+        return tuple(itertools.islice(self._url_infos, self._batch_size))
+
+    @trollius.coroutine
+    def _insert_batch(self, url_infos):
+        '''Insert the URLs and wake anything waiting.
+
+        Coroutine.
+        '''
+        yield From(self._url_table.add_many_async(
+            [{'url': url_info.url} for url_info in url_infos]
+        ))
+
+        self._loaded_count += len(url_infos)
+        _logger.debug(__('Loaded {0} input URLs.', self._loaded_count))
+
+        if self._early_start:
+            self._event.set()
+
+    def _log_progress(self, time_start, finished=False):
+        duration = max(time.time() - time_start, 0.001)
+
+        if finished:
+            message = _('Loaded {num} input URLs in {duration:.1f} seconds '
+                        '({rate:.0f} URLs/s).')
+        else:
+            message = _('Loading input URLs: {num} so far '
+                        '({rate:.0f} URLs/s).')
+
+        _logger.info(__(
+            message,
+            num=self._loaded_count,
+            duration=duration,
+            rate=self._loaded_count / duration
+        ))
+
+    @trollius.coroutine
+    def wait(self):
+        '''Wait until another batch is inserted or loading is finished.
+
+        If :attr:`early_start` is False, only the end of loading is waited
+        for.
+
+        Coroutine.
+        '''
+        if not self._loading:
+            return
+
+        self._event.clear()
+        yield From(self._event.wait())
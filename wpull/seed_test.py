@@ -0,0 +1,80 @@
+# encoding=utf-8
+import threading
+
+from trollius import From
+import trollius
+
+from wpull.database.sqltable import SQLiteURLTable
+from wpull.item import Status
+from wpull.seed import SeedLoader
+from wpull.testing.async import AsyncTestCase
+from wpull.url import URLInfo
+import wpull.testing.async
+
+
+class TestSeed(AsyncTestCase):
+    @wpull.testing.async.async_test()
+    def test_seed_loader(self):
+        url_table = SQLiteURLTable(':memory:')
+        urls = ['http://example.com/{}'.format(num) for num in range(25)]
+        urls.append(urls[0])
+        threads = set()
+
+        def parse_urls():
+            for url in urls:
+                threads.add(threading.current_thread())
+                yield URLInfo.parse(url)
+
+        seed_loader = SeedLoader(url_table, parse_urls(), batch_size=10)
+        batches = []
+
+        def batch_callback(url_infos):
+            batches.append(url_infos)
+
+        seed_loader.batch_observer.add(batch_callback)
+
+        self.assertTrue(seed_loader.loading)
+
+        yield From(seed_loader.load())
+
+        self.assertFalse(seed_loader.loading)
+        self.assertEqual(26, seed_loader.loaded_count)
+        self.assertEqual([10, 10, 6], [len(batch) for batch in batches])
+        self.assertEqual(urls[0], batches[0][0].url)
+        self.assertEqual(25, url_table.count())
+        self.assertEqual(
+            Status.todo, url_table.get_one('http://example.com/24').status)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    @wpull.testing.async.async_test()
+    def test_seed_loader_wait(self):
+        url_table = SQLiteURLTable(':memory:')
+        url_infos = (
+            URLInfo.parse('http://example.com/{}'.format(num))
+            for num in range(25)
+        )
+        seed_loader = SeedLoader(url_table, url_infos, batch_size=10)
+        load_task = trollius.async(seed_loader.load())
+
+        yield From(seed_loader.wait())
+
+        self.assertTrue(seed_loader.loaded_count)
+
+        yield From(load_task)
+        yield From(seed_loader.wait())
+
+    @wpull.testing.async.async_test()
+    def test_seed_loader_no_early_start(self):
+        url_table = SQLiteURLTable(':memory:')
+        url_infos = (
+            URLInfo.parse('http://example.com/{}'.format(num))
+            for num in range(25)
+        )
+        seed_loader = SeedLoader(
+            url_table, url_infos, batch_size=10, early_start=False)
+        trollius.async(seed_loader.load())
+
+        yield From(seed_loader.wait())
+
+        self.assertFalse(seed_loader.loading)
+        self.assertEqual(25, seed_loader.loaded_count)
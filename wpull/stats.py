@@ -10,6 +10,7 @@ import atexit
 
 from wpull.bandwidth import BandwidthMeter
 from wpull.errors import ERROR_PRIORITIES
+import wpull.observer
 
 
 _logger = logging.getLogger(__name__)
@@ -31,6 +32,8 @@ class Statistics(object):
             mapping uses a disk store so it is created on demand.
         bandwidth_meter (:class:`.network.BandwidthMeter`): The bandwidth
             meter.
+        error_observer (:class:`.observer.Observer`): Called with the
+            error class counted by :meth:`increment_error`.
     '''
     def __init__(self):
         self.start_time = None
@@ -42,6 +45,7 @@ class Statistics(object):
         self._temp_dir = None
         self._required_urls_db = None
         self.bandwidth_meter = BandwidthMeter()
+        self.error_observer = wpull.observer.Observer()
 
     @property
     def required_urls_db(self):
@@ -111,7 +115,9 @@ class Statistics(object):
 
         for error_class in ERROR_PRIORITIES:
             if isinstance(error, error_class):
-                self.errors[error_class] += 1
-                return
+                break
+        else:
+            error_class = type(error)
 
-        self.errors[type(error)] += 1
+        self.errors[error_class] += 1
+        self.error_observer.notify(error_class)
@@ -123,6 +123,7 @@ def get_urls(filename, url_info, document_info):
                 'inline': True,
                 'post_data': 'text=hello',
                 'replace': True,
+                'priority': 1,
             },
             {
                 'url': '..malformed',
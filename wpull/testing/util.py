@@ -2,6 +2,16 @@ import contextlib
 import os
 from tempfile import TemporaryDirectory
 
+from wpull.item import URLRecord, Status
+
+
+def new_url_record(url):
+    '''Return a checked out :class:`.item.URLRecord` of the URL.'''
+    return URLRecord(
+        url, Status.in_progress, 0, 0, None, None, None, None, None, None,
+        None
+    )
+
 
 class TempDirMixin:
     def set_up_temp_dir(self):
@@ -224,9 +224,16 @@ class SpanHostsFilter(BaseURLFilter):
         self._enabled = enabled
         self._page_requisites = page_requisites
         self._linked_pages = linked_pages
-        self._base_urls = frozenset(
-            url_info.hostname for url_info in input_url_infos
-        )
+        self._base_urls = set()
+        self.add_input_url_infos(input_url_infos)
+
+    def add_input_url_infos(self, input_url_infos):
+        '''Allow the hostnames of more input URLs.'''
+        self.add_hostnames(url_info.hostname for url_info in input_url_infos)
+
+    def add_hostnames(self, hostnames):
+        '''Allow more hostnames.'''
+        self._base_urls.update(hostnames)
 
     def test(self, url_info, url_table_record):
         if self._enabled:
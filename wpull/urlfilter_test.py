@@ -383,6 +383,22 @@ class TestURLFilter(unittest.TestCase):
             mock_record
         ))
 
+        url_filter.add_input_url_infos([
+            URLInfo.parse('http://hotdog.example/'),
+        ])
+
+        self.assertTrue(url_filter.test(
+            URLInfo.parse('http://hotdog.example/blog/topic1/blah.html'),
+            mock_record
+        ))
+
+        url_filter.add_hostnames(['sausage.example'])
+
+        self.assertTrue(url_filter.test(
+            URLInfo.parse('http://sausage.example/blog/topic1/blah.html'),
+            mock_record
+        ))
+
         url_filter = SpanHostsFilter([
             URLInfo.parse('http://example.com/blog/'),
         ],
@@ -0,0 +1,219 @@
+# encoding=utf-8
+'''Crawling with multiple processes.'''
+import copy
+import gettext
+import logging
+import multiprocessing
+import sys
+
+from trollius import From
+import trollius
+
+from wpull.backport.logging import BraceMessage as __
+from wpull.database.remote import RemoteURLTable
+
+
+_logger = logging.getLogger(__name__)
+
+
+class WorkerInfo(object):
+    '''Information given to a worker process.
+
+    Attributes:
+        worker_id (int): The number of the worker starting from 1.
+        connection: The connection to the
+            :class:`.database.remote.URLTableServer`.
+        input_hostnames (frozenset): The hostnames of the input URLs.
+    '''
+    def __init__(self, worker_id, connection, input_hostnames):
+        self.worker_id = worker_id
+        self.connection = connection
+        self.input_hostnames = input_hostnames
+
+
+class WorkerPool(object):
+    '''Run engines in worker processes that share one URL table.
+
+    Args:
+        url_table (:class:`.database.base.BaseURLTable`): The URL table.
+        server (:class:`.database.remote.URLTableServer`): The server of
+            the URL table.
+        statistics (:class:`.stats.Statistics`): The statistics that the
+            worker reports are added to.
+        worker_count (int): The number of worker processes.
+        worker_function: A callable called with :class:`WorkerInfo` in
+            each worker process. It returns the exit status.
+        seed_loader (:class:`.seed.SeedLoader`): If provided, the input URLs
+            are loaded before the workers start.
+
+    The workers are forked so they inherit the state of this process.
+
+    This class replaces :class:`.engine.Engine` in the coordinating
+    process.
+    '''
+    def __init__(self, url_table, server, statistics, worker_count,
+                 worker_function, seed_loader=None):
+        assert worker_count > 0, \
+            'Expect positive worker count. Got {}.'.format(worker_count)
+        self._url_table = url_table
+        self._server = server
+        self._statistics = statistics
+        self._worker_count = worker_count
+        self._worker_function = worker_function
+        self._seed_loader = seed_loader
+        self._input_hostnames = set()
+        self._reported_workers = set()
+
+        self._server.report_observer.add(self._add_report)
+
+    @trollius.coroutine
+    def __call__(self):
+        '''Run the workers until they finish.
+
+        Coroutine.
+        '''
+        self._url_table.release()
+
+        if self._seed_loader:
+            self._seed_loader.batch_observer.add(self._add_input_hostnames)
+            yield From(self._seed_loader.load())
+
+        _logger.info(__(
+            gettext.ngettext(
+                'Starting {num} worker process.',
+                'Starting {num} worker processes.',
+                self._worker_count
+            ),
+            num=self._worker_count
+        ))
+
+        processes = [
+            self._start_worker(worker_id)
+            for worker_id in range(1, self._worker_count + 1)
+        ]
+        event_loop = trollius.get_event_loop()
+
+        yield From(event_loop.run_in_executor(None, self._server.serve))
+
+        for process in processes:
+            yield From(event_loop.run_in_executor(None, process.join))
+
+        missing_workers = [
+            worker_id for worker_id in range(1, self._worker_count + 1)
+            if worker_id not in self._reported_workers
+        ]
+
+        if missing_workers:
+            raise RuntimeError(
+                'Worker processes {} exited unexpectedly.'
+                .format(missing_workers))
+
+    def _start_worker(self, worker_id):
+        '''Fork a worker process.
+
+        Returns:
+            multiprocessing.Process
+        '''
+        context = multiprocessing.get_context('fork')
+        connection, child_connection = context.Pipe()
+        worker = WorkerInfo(
+            worker_id, child_connection, frozenset(self._input_hostnames))
+
+        process = context.Process(
+            target=self._run_worker, args=(worker,),
+            name='wpull-worker-{}'.format(worker_id)
+        )
+        process.start()
+        child_connection.close()
+
+        _logger.debug(__('Started worker {0} as process {1}.',
+                         worker_id, process.pid))
+
+        self._server.add_connection(connection, worker_id)
+
+        return process
+
+    def _run_worker(self, worker):
+        '''Run the worker function and exit the process.'''
+        exit_code = self._worker_function(worker)
+        sys.exit(exit_code)
+
+    def _add_input_hostnames(self, url_infos):
+        self._input_hostnames.update(
+            url_info.hostname for url_info in url_infos)
+
+    def _add_report(self, worker_id, report):
+        '''Add the statistics from a worker.'''
+        _logger.debug(__('Worker {0} reported {1}.', worker_id, report))
+
+        self._reported_workers.add(worker_id)
+        self._statistics.files += report['files']
+        self._statistics.size += report['size']
+        self._statistics.errors.update(report['errors'])
+
+    def stop(self):
+        '''Stop the workers after their current items.'''
+        _logger.debug('Stopping workers.')
+        self._server.stop()
+
+
+def new_worker_args(args, worker_id):
+    '''Return a copy of the options suitable for a worker.
+
+    Files that cannot be shared get a suffix with the worker number. Log
+    messages are appended to the log file of the coordinating process.
+    '''
+    args = copy.copy(args)
+    suffix = '-worker{}'.format(worker_id)
+
+    if args.warc_file:
+        args.warc_file += suffix
+
+    if args.save_cookies:
+        args.save_cookies += suffix
+
+    if args.checkpoint:
+        args.checkpoint += suffix
+
+    if args.output_file:
+        args.append_output = args.output_file
+        args.output_file = None
+
+    args.convert_links = False
+    args.debug_console_port = None
+
+    return args
+
+
+def run_worker(builder_class, args, worker):
+    '''Build and run an application in a worker process.
+
+    Args:
+        builder_class: The class of :class:`.builder.Builder`.
+        args: The options of the coordinating process.
+        worker (:class:`WorkerInfo`): The worker.
+
+    Returns:
+        int: The exit status.
+    '''
+    trollius.set_event_loop(trollius.new_event_loop())
+
+    root_logger = logging.getLogger()
+
+    for handler in tuple(root_logger.handlers):
+        root_logger.removeHandler(handler)
+
+    builder = builder_class(
+        new_worker_args(args, worker.worker_id), worker=worker)
+    application = builder.build()
+    application.setup_signal_handlers()
+    exit_code = application.run_sync()
+    statistics = builder.factory['Statistics']
+
+    RemoteURLTable(worker.connection).report({
+        'files': statistics.files,
+        'size': statistics.size,
+        'errors': dict(statistics.errors),
+    })
+
+    return exit_code